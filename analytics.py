@@ -2,41 +2,290 @@
 analytics.py
 -------------
 
-This script pulls analytics for recently published videos and triggers
-optimizations if performance thresholds are not met. In this placeholder
-version, it simply prints a summary of PUBLISHED entries from
-``publish_queue.csv`` without performing any optimizations.
+This script pulls analytics for recently published videos and flags the
+ones that miss the performance thresholds in ``config/ops.yml`` so they
+can be optimized (new thumbnail, title, re-cut).
+
+Per-video metrics snapshots (views, likes, comments, average view
+percentage per platform) are ingested into a time-series store,
+``data/metrics.db``. Snapshots are append-only; alongside them the store
+keeps the latest totals per video and daily roll-ups per
+``series``/``locale``. Each run only processes snapshots above a
+high-water mark and adds their deltas to the roll-ups, so rolling
+aggregates and underperformer checks stay fast regardless of how much
+history has accumulated. A snapshot arriving after a newer one for the
+same video is kept in the history but moves neither the totals nor the
+roll-ups. A video's age is counted from ``published_at`` on its queue
+row, or from its first snapshot when that is unknown.
+
+Platform APIs are not wired up yet; snapshots are read from a local
+fixture (``data/metrics_fixture.jsonl``) standing in for them, one JSON
+object per line with ``video_id`` (publish queue row id), ``platform``,
+``captured_at`` (ISO timestamp), ``views``, ``likes``, ``comments`` and
+``avg_view_pct``.
 
 Usage:
 
     python analytics.py
+    python analytics.py --fixture data/metrics_fixture.jsonl --window-days 28
 
 Configuration files:
-    config/ops.yml
+    config/ops.yml (``analytics`` section)
 
 Data files:
-    data/publish_queue.csv
+    data/publish_queue.db
+    data/metrics.db
+    data/metrics_fixture.jsonl
 """
 
-import csv
+import argparse
+import json
+import sqlite3
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config_loader import config_section
+from instrument import add_profiler_argument, instrumented, stage
+from queue_store import QueueStore, open_queue
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS snapshots (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    video_id TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    captured_at TEXT NOT NULL,
+    views INTEGER NOT NULL DEFAULT 0,
+    likes INTEGER NOT NULL DEFAULT 0,
+    comments INTEGER NOT NULL DEFAULT 0,
+    avg_view_pct REAL
+);
+CREATE TABLE IF NOT EXISTS video_totals (
+    video_id TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    series TEXT,
+    locale TEXT,
+    first_seen TEXT NOT NULL,
+    published_at TEXT,
+    captured_at TEXT NOT NULL,
+    views INTEGER NOT NULL,
+    likes INTEGER NOT NULL,
+    comments INTEGER NOT NULL,
+    avg_view_pct REAL,
+    flagged_at TEXT,
+    PRIMARY KEY (video_id, platform)
+);
+CREATE TABLE IF NOT EXISTS series_daily (
+    series TEXT NOT NULL,
+    locale TEXT NOT NULL,
+    day TEXT NOT NULL,
+    views INTEGER NOT NULL DEFAULT 0,
+    likes INTEGER NOT NULL DEFAULT 0,
+    comments INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, series, locale)
+);
+"""
+
+DEFAULT_SETTINGS = {
+    'window_days': 7,
+    'min_age_hours': 48,
+    'thresholds': {'views': 500, 'like_rate': 0.02, 'avg_view_pct': 40},
+}
+
+
+class MetricsStore:
+    """Append-only metrics snapshots with incrementally maintained roll-ups."""
+
+    def __init__(self, db_path: Path) -> None:
+        self.conn = sqlite3.connect(str(db_path))
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        columns = [r[1] for r in self.conn.execute('PRAGMA table_info(video_totals)')]
+        if 'published_at' not in columns:
+            self.conn.execute('ALTER TABLE video_totals ADD COLUMN published_at TEXT')
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> 'MetricsStore':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def meta(self, key: str, default: str = '0') -> str:
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value) -> None:
+        self.conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, str(value)))
+
+    def append(self, snapshots: List[dict], fixture_offset: Optional[int] = None) -> None:
+        """Insert snapshots and, in the same transaction, the fixture offset they were read up to."""
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO snapshots (video_id, platform, captured_at, views, likes, comments, avg_view_pct) '
+                'VALUES (:video_id, :platform, :captured_at, :views, :likes, :comments, :avg_view_pct)',
+                [{'likes': 0, 'comments': 0, 'avg_view_pct': None, **s, 'video_id': str(s['video_id'])}
+                 for s in snapshots],
+            )
+            if fixture_offset is not None:
+                self.set_meta('fixture_offset', fixture_offset)
+
+    def aggregate(self, video_meta: Dict[str, Tuple[str, str, Optional[str]]]) -> int:
+        """Fold snapshots above the high-water mark into the roll-ups.
+
+        ``video_meta`` maps video ids to (series, locale, published_at).
+        Returns the number of snapshots processed.
+        """
+        high_water = int(self.meta('high_water'))
+        rows = self.conn.execute(
+            'SELECT seq, video_id, platform, captured_at, views, likes, comments, avg_view_pct '
+            'FROM snapshots WHERE seq > ? ORDER BY seq', (high_water,)).fetchall()
+        if not rows:
+            return 0
+        with self.conn:
+            for seq, video_id, platform, captured_at, views, likes, comments, avg_pct in rows:
+                series, locale, published_at = video_meta.get(video_id, ('', '', None))
+                prev = self.conn.execute(
+                    'SELECT captured_at, views, likes, comments FROM video_totals '
+                    'WHERE video_id = ? AND platform = ?', (video_id, platform)).fetchone()
+                # An older snapshot arriving late must not lower the totals, or
+                # the next snapshot would count the difference a second time
+                if prev is None or captured_at >= prev[0]:
+                    deltas = [max(0, new - old) for new, old in
+                              zip((views, likes, comments), prev[1:] if prev else (0, 0, 0))]
+                    self.conn.execute(
+                        'INSERT INTO series_daily (series, locale, day, views, likes, comments) '
+                        'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (day, series, locale) DO UPDATE SET '
+                        'views = views + excluded.views, likes = likes + excluded.likes, '
+                        'comments = comments + excluded.comments',
+                        (series, locale, captured_at[:10], *deltas))
+                self.conn.execute(
+                    'INSERT INTO video_totals (video_id, platform, series, locale, first_seen, published_at, '
+                    'captured_at, views, likes, comments, avg_view_pct) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (video_id, platform) DO UPDATE SET captured_at = excluded.captured_at, '
+                    'published_at = COALESCE(excluded.published_at, published_at), '
+                    'views = excluded.views, likes = excluded.likes, comments = excluded.comments, '
+                    'avg_view_pct = excluded.avg_view_pct '
+                    'WHERE excluded.captured_at >= video_totals.captured_at',
+                    (video_id, platform, series, locale, captured_at, published_at, captured_at,
+                     views, likes, comments, avg_pct))
+                high_water = seq
+            self.set_meta('high_water', high_water)
+        return len(rows)
+
+    def rolling(self, days: int, now: Optional[datetime] = None) -> List[tuple]:
+        """Per series/locale totals over the last ``days`` days of roll-ups."""
+        now = now or datetime.now(timezone.utc)
+        since = (now - timedelta(days=days)).date().isoformat()
+        return self.conn.execute(
+            'SELECT series, locale, SUM(views), SUM(likes), SUM(comments) FROM series_daily '
+            'WHERE day > ? GROUP BY series, locale ORDER BY SUM(views) DESC', (since,)).fetchall()
+
+    def underperformers(self, settings: dict, now: Optional[datetime] = None) -> List[dict]:
+        """Videos old enough to judge whose latest metrics miss any threshold."""
+        now = now or datetime.now(timezone.utc)
+        cutoff = (now - timedelta(hours=settings['min_age_hours'])).isoformat()
+        limits = settings['thresholds']
+        rows = self.conn.execute(
+            'SELECT video_id, platform, series, locale, views, likes, avg_view_pct FROM video_totals '
+            'WHERE COALESCE(published_at, first_seen) <= ? AND flagged_at IS NULL', (cutoff,)).fetchall()
+        flagged = []
+        for video_id, platform, series, locale, views, likes, avg_pct in rows:
+            reasons = []
+            if views < limits.get('views', 0):
+                reasons.append(f'views {views} < {limits["views"]}')
+            like_rate = likes / views if views else 0.0
+            if like_rate < limits.get('like_rate', 0):
+                reasons.append(f'like rate {like_rate:.3f} < {limits["like_rate"]}')
+            if avg_pct is not None and avg_pct < limits.get('avg_view_pct', 0):
+                reasons.append(f'avg view {avg_pct:.0f}% < {limits["avg_view_pct"]}%')
+            if reasons:
+                flagged.append({'video_id': video_id, 'platform': platform, 'series': series,
+                                'locale': locale, 'reasons': reasons})
+        return flagged
+
+    def mark_flagged(self, flagged: List[dict]) -> None:
+        stamp = datetime.now(timezone.utc).isoformat()
+        with self.conn:
+            self.conn.executemany(
+                'UPDATE video_totals SET flagged_at = ? WHERE video_id = ? AND platform = ?',
+                [(stamp, f['video_id'], f['platform']) for f in flagged])
+
+
+def read_fixture(fixture_path: Path, offset: int) -> Tuple[List[dict], int]:
+    """Read snapshots appended to the fixture since ``offset``. Stands in for platform APIs."""
+    if not fixture_path.exists():
+        return [], offset
+    if offset > fixture_path.stat().st_size:
+        offset = 0
+    snapshots = []
+    with fixture_path.open('rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            if line.strip():
+                snapshots.append(json.loads(line))
+    return snapshots, offset
+
+
+def video_metadata(store: QueueStore, video_ids: Iterable[str]) -> Dict[str, Tuple[str, str, Optional[str]]]:
+    meta = {}
+    for video_id in set(video_ids):
+        row = store.get(int(video_id)) if str(video_id).isdigit() else None
+        meta[video_id] = (row['series'], row['locale'], row['published_at'] or None) if row else ('', '', None)
+    return meta
+
+
+def load_settings(base: Path) -> dict:
+    settings = config_section(base, 'analytics', DEFAULT_SETTINGS)
+    settings['thresholds'] = dict(DEFAULT_SETTINGS['thresholds'], **settings.get('thresholds', {}))
+    return settings
+
+
+def run_analytics(base: Path, metrics: MetricsStore, fixture_path: Path, settings: dict) -> List[dict]:
+    """Ingest new snapshots, print rolling aggregates and return newly flagged videos."""
+    snapshots, offset = read_fixture(fixture_path, int(metrics.meta('fixture_offset')))
+    # A crash can neither ingest snapshots twice nor skip them
+    metrics.append(snapshots, fixture_offset=offset)
+    pending = [r[0] for r in metrics.conn.execute(
+        'SELECT DISTINCT video_id FROM snapshots WHERE seq > ?', (int(metrics.meta('high_water')),))]
+    with stage('analytics.aggregate') as s, open_queue(base) as store:
+        processed = s.items = metrics.aggregate(video_metadata(store, pending))
+    print(f"Ingested {len(snapshots)} snapshots, aggregated {processed}.")
+
+    print(f"Last {settings['window_days']} days by series/locale:")
+    for series, locale, views, likes, comments in metrics.rolling(settings['window_days']):
+        print(f"- {series or '?'}/{locale or '?'}: {views} views, {likes} likes, {comments} comments")
 
-def summarize_published(queue_path: Path) -> None:
-    with queue_path.open(newline='') as csvfile:
-        rows = list(csv.DictReader(csvfile))
-    published = [row for row in rows if row.get('status') == 'PUBLISHED']
-    if not published:
-        print("No published videos to analyze.")
-        return
-    print("Published videos:")
-    for row in published:
-        print(f"- {row['topic']} (published at {row.get('published_at')})")
+    with stage('analytics.flag') as s:
+        flagged = metrics.underperformers(settings)
+        s.items = len(flagged)
+    for f in flagged:
+        print(f"[UNDERPERFORMING] video {f['video_id']} on {f['platform']}: {'; '.join(f['reasons'])}")
+    metrics.mark_flagged(flagged)
+    return flagged
 
 
 def main() -> None:
-    base = Path(__file__).resolve().parent.parent
-    queue_path = base / 'data' / 'publish_queue.csv'
-    summarize_published(queue_path)
+    parser = argparse.ArgumentParser(description="Ingest video metrics and flag underperformers.")
+    parser.add_argument('--fixture', help='Metrics snapshot JSONL (default: data/metrics_fixture.jsonl)')
+    parser.add_argument('--window-days', type=int, help='Rolling window for series/locale aggregates')
+    add_profiler_argument(parser)
+    args = parser.parse_args()
+    with instrumented('analytics', args.profiler):
+        base = Path(__file__).resolve().parent.parent
+        settings = load_settings(base)
+        if args.window_days:
+            settings['window_days'] = args.window_days
+        fixture = Path(args.fixture) if args.fixture else base / 'data' / 'metrics_fixture.jsonl'
+        with MetricsStore(base / 'data' / 'metrics.db') as metrics:
+            run_analytics(base, metrics, fixture, settings)
 
 if __name__ == '__main__':
     main()
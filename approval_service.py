@@ -0,0 +1,243 @@
+"""
+approval_service.py
+-------------------
+
+Asynchronous Telegram approval service built on python-telegram-bot's
+asyncio API. Instead of one blocking prompt per script run, the service
+sends approval prompts for every waiting queue item at once, grouping
+several items into one message with an inline Approve/Reject button per
+item (plus buttons for the whole batch). Button presses are handled as
+they arrive and applied straight to the publish queue, so production
+stages never wait on a reply.
+
+The queue is scanned again every ``--rescan`` seconds (through the
+bot's job queue), so rows that reach a waiting status while the service
+runs are prompted for too, not only those waiting at startup.
+
+Outstanding prompts are saved to ``data/pending_approvals.json`` after
+every change. When the service restarts it reloads them, keeps listening
+for their buttons and does not prompt for those items again.
+
+Two kinds of approval are supported:
+
+- ``topic``: PLANNED → APPROVED_TOPIC; ❌ retires the row as REJECTED
+- ``queue``: READY → IN_QUEUE; ❌ holds the video: it stays READY with a
+  ``held_at`` time on its queue row and is not prompted for again until
+  that field is cleared
+
+The preview approval (``approvals.prerender``) is not one of them: it
+runs inside a production job between generation and fact-checking, where
+the queue row has no status of its own to wait in, so
+``preview_approval.py`` still asks for it and waits for the answer.
+
+Usage:
+
+    python approval_service.py --kind queue
+    python approval_service.py --kind topic --kind queue --batch-size 5 --rescan 30
+    python approval_service.py --kind queue --base-url http://127.0.0.1:8081/bot
+
+``--base-url`` points the bot at a different Bot API server, e.g. a local
+fake server for testing.
+
+Environment variables:
+    TELEGRAM_BOT_TOKEN (name configurable in ops.yml)
+
+Configuration files:
+    config/ops.yml
+
+Data files:
+    data/publish_queue.db
+    data/pending_approvals.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import Application, CallbackQueryHandler, ContextTypes
+
+from config_loader import load_config
+from queue_store import open_queue
+
+# kind -> (status awaiting approval, status after approval, prompt)
+APPROVAL_KINDS = {
+    'topic': ('PLANNED', 'APPROVED_TOPIC', 'Approve these topics?'),
+    'queue': ('READY', 'IN_QUEUE', 'Add these videos to the upload queue?'),
+}
+
+
+class PendingApprovals:
+    """Outstanding approval prompts, persisted atomically to a JSON file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.items: Dict[str, dict] = {}
+        if path.exists():
+            self.items = json.loads(path.read_text())
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.items, f, indent=1)
+        os.replace(tmp, self.path)
+
+    def add(self, approval_id: str, entry: dict) -> None:
+        self.items[approval_id] = entry
+
+    def pop(self, approval_id: str) -> Optional[dict]:
+        return self.items.pop(approval_id, None)
+
+    def in_message(self, message_id: int) -> List[str]:
+        return [aid for aid, e in self.items.items() if e.get('message_id') == message_id]
+
+
+def approval_id(kind: str, row_id: int) -> str:
+    # Callback data is limited to 64 bytes, so keep ids short
+    return f'{kind[0]}{row_id}'
+
+
+def build_keyboard(entries: Dict[str, dict]) -> InlineKeyboardMarkup:
+    rows = [
+        [InlineKeyboardButton(f"✅ {e['topic']}", callback_data=f'{aid}:y'),
+         InlineKeyboardButton('❌', callback_data=f'{aid}:n')]
+        for aid, e in entries.items()
+    ]
+    if len(entries) > 1:
+        batch = ','.join(entries)
+        if len(batch) <= 60:
+            rows.append([InlineKeyboardButton('✅ All', callback_data=f'{batch}:y'),
+                         InlineKeyboardButton('❌ All', callback_data=f'{batch}:n')])
+    return InlineKeyboardMarkup(rows)
+
+
+class ApprovalService:
+    """Sends batched approval prompts and applies decisions as they arrive."""
+
+    def __init__(self, base: Path, chat_id: str, pending: PendingApprovals,
+                 batch_size: int = 5) -> None:
+        self.base = base
+        self.chat_id = chat_id
+        self.pending = pending
+        self.batch_size = batch_size
+        self.lock = asyncio.Lock()
+
+    def waiting_rows(self, kind: str) -> List[dict]:
+        """Queue rows awaiting this kind of approval that have no prompt yet."""
+        from_status = APPROVAL_KINDS[kind][0]
+        with open_queue(self.base) as store:
+            rows = list(store.rows(from_status))
+        return [r for r in rows
+                if approval_id(kind, r['id']) not in self.pending.items and not r.get('held_at')]
+
+    async def request(self, bot, kind: str, rows: Iterable[dict]) -> int:
+        """Send prompts for ``rows`` in batches. Returns the number of items prompted."""
+        rows = list(rows)
+        prompt = APPROVAL_KINDS[kind][2]
+        sends = []
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            entries = {approval_id(kind, r['id']): {'kind': kind, 'row_id': r['id'], 'topic': r['topic']}
+                       for r in batch}
+            text = prompt + '\n' + '\n'.join(f"• {e['topic']}" for e in entries.values())
+            sends.append(self._send(bot, text, entries))
+        await asyncio.gather(*sends)
+        return len(rows)
+
+    async def rescan(self, bot, kinds: List[str]) -> None:
+        """Prompt for rows that started waiting since the last scan."""
+        for kind in kinds:
+            rows = await asyncio.to_thread(self.waiting_rows, kind)
+            if not rows:
+                continue
+            n = await self.request(bot, kind, rows)
+            print(f"Sent {kind} approval prompts for {n} items "
+                  f"({len(self.pending.items)} pending in total)")
+
+    async def _send(self, bot, text: str, entries: Dict[str, dict]) -> None:
+        message = await bot.send_message(self.chat_id, text, reply_markup=build_keyboard(entries))
+        async with self.lock:
+            for aid, entry in entries.items():
+                self.pending.add(aid, dict(entry, message_id=message.message_id, sent_at=time.time()))
+            self.pending.save()
+
+    def apply(self, entry: dict, approved: bool) -> bool:
+        """Record a decision in the publish queue. Returns True if a row moved."""
+        from_status, to_status, _ = APPROVAL_KINDS[entry['kind']]
+        with open_queue(self.base) as store:
+            if approved:
+                return store.transition(entry['row_id'], from_status, to_status)
+            if entry['kind'] == 'topic':
+                return store.retire(entry['row_id'], 'REJECTED', 'topic rejected in Telegram')
+            # A held video stays READY; remember the decision so rescans skip it
+            store.update(entry['row_id'], held_at=datetime.now(timezone.utc).isoformat(timespec='seconds'))
+            return False
+
+    async def on_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        query = update.callback_query
+        ids, _, decision = (query.data or '').rpartition(':')
+        approved = decision == 'y'
+        async with self.lock:
+            entries = [e for e in (self.pending.pop(aid) for aid in ids.split(',')) if e]
+            self.pending.save()
+        if not entries:
+            await query.answer('Already handled.')
+            return
+        # Queue writes are blocking SQLite calls; keep them off the event loop
+        await asyncio.gather(*(asyncio.to_thread(self.apply, e, approved) for e in entries))
+        verb = 'Approved' if approved else 'Rejected' if entries[0]['kind'] == 'topic' else 'Held'
+        await query.answer(f"{verb}: {', '.join(e['topic'] for e in entries)}")
+
+        remaining = {aid: self.pending.items[aid] for aid in self.pending.in_message(query.message.message_id)}
+        if remaining:
+            await query.edit_message_reply_markup(build_keyboard(remaining))
+        else:
+            await query.edit_message_reply_markup(None)
+
+
+def load_ops(base: Path) -> dict:
+    return load_config(base, 'ops')
+
+
+def build_application(token: str, service: ApprovalService, kinds: List[str],
+                      base_url: Optional[str] = None, rescan_seconds: float = 60) -> Application:
+    builder = Application.builder().token(token)
+    if base_url:
+        builder = builder.base_url(base_url)
+
+    async def rescan(context: ContextTypes.DEFAULT_TYPE) -> None:
+        await service.rescan(context.bot, kinds)
+
+    app = builder.build()
+    app.add_handler(CallbackQueryHandler(service.on_callback))
+    # Runs never overlap, so a row is not prompted for twice while a send is in flight
+    app.job_queue.run_repeating(rescan, interval=rescan_seconds, first=0)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the asynchronous Telegram approval service.")
+    parser.add_argument('--kind', action='append', choices=sorted(APPROVAL_KINDS),
+                        help='Approval kinds to prompt for (repeatable; default: queue)')
+    parser.add_argument('--batch-size', type=int, default=5, help='Items per Telegram message')
+    parser.add_argument('--base-url', help='Bot API base URL (e.g. a local fake server)')
+    parser.add_argument('--rescan', type=float, default=60, help='Seconds between scans of the queue')
+    args = parser.parse_args()
+
+    base = Path(__file__).resolve().parent.parent
+    ops = load_ops(base)
+    token = os.environ[ops['telegram']['bot_token_env']]
+    pending = PendingApprovals(base / 'data' / 'pending_approvals.json')
+    service = ApprovalService(base, ops['telegram']['chat_id'], pending, args.batch_size)
+    app = build_application(token, service, args.kind or ['queue'], args.base_url, args.rescan)
+    app.run_polling(allowed_updates=[Update.CALLBACK_QUERY])
+
+if __name__ == '__main__':
+    main()
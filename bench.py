@@ -0,0 +1,389 @@
+"""
+bench.py
+--------
+
+Offline benchmarks for the subsystems that dominate a production cycle:
+rendering, thumbnails, de-duplication and the publish queue. Fixtures
+are synthetic and generated deterministically (fixed seed) under
+``tmp/bench/fixtures`` on first use, so runs on different commits
+measure the same inputs:
+
+- render: quizzes of 3–8 questions (``render_questions``, draft profile)
+- thumbnail: 50 thumbnails drawn and saved as PNG and WebP
+- dedupe: question banks of 1k / 100k / 1M items (index build from
+  scratch, then filtering an 8-question quiz against it)
+- queue: publish queues of 100 / 10k / 100k rows (bulk insert, status
+  count, first PLANNED, transition, update, CSV export/import)
+- startup: wall time of a full ``buffer_watcher.py`` run and of the
+  ``--help`` of other stages n8n starts often (imports only), against a
+  bare interpreter start, with the config cache warm and with
+  ``QS_CONFIG_CACHE=off``
+
+Every case runs in a fresh child process so its peak RSS is its own.
+Results (latency in seconds, throughput in items per second, peak RSS in
+MB) are appended to ``data/benchmarks.jsonl`` tagged with the git commit,
+and ``compare`` lines up two commits.
+
+Cases larger than ``--max-items`` (default 100000) are skipped; pass
+``--max-items 1000000`` to include the 1M-question bank.
+
+Usage:
+
+    python bench.py run
+    python bench.py run --suite dedupe --suite queue --max-items 1000000
+    python bench.py run --suite startup
+    python bench.py compare --base 7dc0e3c --head HEAD
+
+Data files:
+    data/benchmarks.jsonl
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BASE = Path(__file__).resolve().parent.parent
+FIXTURES = BASE / 'tmp' / 'bench' / 'fixtures'
+RESULTS = BASE / 'data' / 'benchmarks.jsonl'
+SEED = 1729
+DEFAULT_MAX_ITEMS = 100_000
+
+CASES = {
+    'render': [{'questions': n} for n in range(3, 9)],
+    'thumbnail': [{'count': 50, 'format': 'png'}, {'count': 50, 'format': 'webp'}],
+    'dedupe': [{'bank': 1_000}, {'bank': 100_000}, {'bank': 1_000_000}],
+    'queue': [{'rows': 100}, {'rows': 10_000}, {'rows': 100_000}],
+    'startup': [
+        {'script': 'buffer_watcher', 'args': '', 'runs': 20},
+        {'script': 'preview_approval', 'args': '--help', 'runs': 20},
+        {'script': 'upload_schedule', 'args': '--help', 'runs': 20},
+        {'script': 'render_queue', 'args': '--help', 'runs': 20},
+    ],
+}
+
+WORDS = (
+    'river mountain capital island flag currency ocean desert language king queen empire '
+    'planet element painter novel composer volcano lake border bridge tower festival dish '
+    'river delta canal harbor glacier forest valley coast city village temple castle museum '
+    'anthem dynasty treaty battle invention rocket satellite poet sculptor opera symphony'
+).split()
+
+
+# --- fixtures ---------------------------------------------------------------
+
+def synthetic_question(rng: random.Random, i: int) -> dict:
+    words = ' '.join(rng.choice(WORDS) for _ in range(6))
+    return {
+        'question': f'Which {words} is known as number {i}?',
+        'options': [f'{rng.choice(WORDS)} {rng.randint(1, 999)}' for _ in range(4)],
+        'correct': rng.randrange(4),
+        'hint': '',
+        'explanation': '',
+    }
+
+
+def fixture(name: str, write: Callable[[Path], None]) -> Path:
+    """Return a fixture path, generating it on first use."""
+    path = FIXTURES / name
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + '.tmp')
+        write(tmp)
+        tmp.replace(path)
+    return path
+
+
+def bank_fixture(n: int) -> Path:
+    def write(path: Path) -> None:
+        rng = random.Random(SEED)
+        with path.open('w') as f:
+            for i in range(n):
+                f.write(json.dumps(synthetic_question(rng, i)) + '\n')
+    return fixture(f'bank-{n}.jsonl', write)
+
+
+def quiz_fixture(n: int) -> Path:
+    def write(path: Path) -> None:
+        rng = random.Random(SEED + n)
+        with path.open('w') as f:
+            for i in range(n):
+                f.write(json.dumps(synthetic_question(rng, 10_000_000 + i)) + '\n')
+    return fixture(f'quiz-{n}.jsonl', write)
+
+
+def queue_fixture(n: int) -> Path:
+    def write(path: Path) -> None:
+        rng = random.Random(SEED)
+        statuses = ['PLANNED', 'APPROVED_TOPIC', 'VERIFIED', 'READY', 'IN_QUEUE', 'PUBLISHED']
+        with path.open('w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['date', 'topic', 'series', 'locale', 'status'])
+            for i in range(n):
+                writer.writerow([f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}', f'Topic {i} {rng.choice(WORDS)}',
+                                 rng.choice(WORDS), rng.choice(['EN', 'PL', 'DE']), rng.choice(statuses)])
+    return fixture(f'queue-{n}.csv', write)
+
+
+def case_dir(suite: str, params: dict) -> Path:
+    path = BASE / 'tmp' / 'bench' / 'work' / f"{suite}-{'-'.join(str(v) for v in params.values())}"
+    path.mkdir(parents=True, exist_ok=True)
+    for stale in path.iterdir():
+        stale.unlink()
+    return path
+
+
+def latency(fn: Callable[[], object], repeat: int) -> float:
+    """Median wall time of ``repeat`` calls."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+# --- suites -----------------------------------------------------------------
+
+def bench_render(params: dict) -> dict:
+    from question_stream import read_questions
+    from render_native import load_brand_config, render_questions
+
+    config = load_brand_config(BASE)
+    questions = list(read_questions(quiz_fixture(params['questions'])))
+    work = case_dir('render', params)
+    started = time.perf_counter()
+    report = render_questions(questions, work / 'video.mp4', config, profile='draft')
+    seconds = time.perf_counter() - started
+    return {
+        'render_s': round(seconds, 3),
+        'questions_per_s': round(report['questions'] / seconds, 2),
+        'bitrate_kbps': report['bitrate_kbps'],
+    }
+
+
+def bench_thumbnail(params: dict) -> dict:
+    from make_thumbnail import ThumbnailRenderer, load_brand_config
+
+    renderer = ThumbnailRenderer(load_brand_config(BASE))
+    work = case_dir('thumbnail', params)
+    rng = random.Random(SEED)
+    topics = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 7))).title()
+              for _ in range(params['count'])]
+    started = time.perf_counter()
+    for i, topic in enumerate(topics):
+        renderer.save(topic, 'Only 1% get all right!', work / f'{i}.{params["format"]}')
+    seconds = time.perf_counter() - started
+    return {
+        'per_thumbnail_s': round(seconds / len(topics), 4),
+        'thumbnails_per_s': round(len(topics) / seconds, 1),
+    }
+
+
+def bench_dedupe(params: dict) -> dict:
+    from dedupe import QuestionIndex, deduplicate
+
+    bank = bank_fixture(params['bank'])
+    quiz = quiz_fixture(8)
+    work = case_dir('dedupe', params)
+    index_path = work / 'bank.index.db'
+    started = time.perf_counter()
+    with QuestionIndex(index_path) as index:
+        index.sync(bank)
+    build = time.perf_counter() - started
+    filter_s = latency(lambda: deduplicate(quiz, bank, work / 'out.jsonl', index_path=index_path), 5)
+    return {
+        'index_build_s': round(build, 3),
+        'index_questions_per_s': round(params['bank'] / build, 1),
+        'filter_quiz_s': round(filter_s, 4),
+        'index_mb': round(index_path.stat().st_size / 2 ** 20, 1),
+    }
+
+
+def bench_queue(params: dict) -> dict:
+    from queue_store import QueueStore
+
+    source = queue_fixture(params['rows'])
+    work = case_dir('queue', params)
+    with QueueStore(work / 'queue.db') as store:
+        started = time.perf_counter()
+        store.import_csv(source)
+        insert = time.perf_counter() - started
+        row_ids = [row['id'] for row in store.rows('READY', limit=100)]
+        count_s = latency(lambda: store.count('READY'), 50)
+        first_s = latency(lambda: store.first('PLANNED'), 50)
+        started = time.perf_counter()
+        for row_id in row_ids:
+            store.transition(row_id, 'READY', 'IN_QUEUE')
+        transition_s = (time.perf_counter() - started) / max(1, len(row_ids))
+        update_s = latency(lambda: store.update(row_ids[0], thumbnail='thumb.png'), 50) if row_ids else 0.0
+        export_s = latency(lambda: store.export_csv(work / 'export.csv'), 3)
+    return {
+        'import_s': round(insert, 4),
+        'import_rows_per_s': round(params['rows'] / insert, 1),
+        'count_s': round(count_s, 6),
+        'first_s': round(first_s, 6),
+        'transition_s': round(transition_s, 6),
+        'update_s': round(update_s, 6),
+        'export_csv_s': round(export_s, 4),
+    }
+
+
+def bench_startup(params: dict) -> dict:
+    script = [str(Path(__file__).resolve().parent / f"{params['script']}.py")] + params['args'].split()
+    env = dict(os.environ, QS_STAGE_LOG='off')
+
+    def run(args: List[str], extra_env: Optional[dict] = None) -> Callable[[], object]:
+        return lambda: subprocess.run([sys.executable] + args, env=dict(env, **(extra_env or {})),
+                                      stdout=subprocess.DEVNULL, check=True)
+
+    interpreter = latency(run(['-c', 'pass']), params['runs'])
+    run(script)()  # fills the config cache
+    warm = latency(run(script), params['runs'])
+    uncached = latency(run(script, {'QS_CONFIG_CACHE': 'off'}), params['runs'])
+    return {
+        'interpreter_s': round(interpreter, 4),
+        'startup_s': round(warm, 4),
+        'script_s': round(warm - interpreter, 4),
+        'uncached_config_s': round(uncached, 4),
+    }
+
+
+SUITES: Dict[str, Callable[[dict], dict]] = {
+    'render': bench_render,
+    'thumbnail': bench_thumbnail,
+    'dedupe': bench_dedupe,
+    'queue': bench_queue,
+    'startup': bench_startup,
+}
+
+
+# --- running and recording --------------------------------------------------
+
+def _run_case(suite: str, params: dict) -> dict:
+    import resource
+
+    try:
+        metrics = SUITES[suite](params)
+    except Exception as exc:  # e.g. a missing optional dependency; keep the other cases going
+        return {'error': f'{type(exc).__name__}: {exc}'}
+    metrics['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return metrics
+
+
+def case_size(params: dict) -> int:
+    return max(v for v in params.values() if isinstance(v, int))
+
+
+def git_revision() -> str:
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               cwd=Path(__file__).parent, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{rev}-dirty' if dirty else rev
+
+
+def run_benchmarks(suites: List[str], max_items: int = DEFAULT_MAX_ITEMS) -> List[dict]:
+    """Run the selected suites, append the results and return them."""
+    commit = git_revision()
+    results = []
+    for suite in suites:
+        for params in CASES[suite]:
+            if case_size(params) > max_items:
+                continue
+            # A fresh forked child per case keeps peak RSS and warm caches separate
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('fork')) as pool:
+                metrics = pool.submit(_run_case, suite, params).result()
+            result = {
+                'ts': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'commit': commit,
+                'python': platform.python_version(),
+                'suite': suite,
+                'case': params,
+                'metrics': metrics,
+            }
+            print(f"{suite:<10} {json.dumps(params):<32} {json.dumps(metrics)}", flush=True)
+            results.append(result)
+    RESULTS.parent.mkdir(parents=True, exist_ok=True)
+    with RESULTS.open('a') as f:
+        for result in results:
+            f.write(json.dumps(result) + '\n')
+    return results
+
+
+def load_results(commit: str) -> Dict[tuple, dict]:
+    """Latest metrics per (suite, case) recorded for a commit (prefix match)."""
+    latest = {}
+    if not RESULTS.exists():
+        return latest
+    with RESULTS.open() as f:
+        for line in f:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            if result['commit'].startswith(commit) and 'error' not in result['metrics']:
+                latest[(result['suite'], json.dumps(result['case'], sort_keys=True))] = result['metrics']
+    return latest
+
+
+def compare(base: str, head: str, tolerance: float = 0.1) -> List[str]:
+    """Describe metric changes from ``base`` to ``head``; regressions are marked with ``!``."""
+    before, after = load_results(base), load_results(head)
+    lines = []
+    for key in sorted(before.keys() & after.keys()):
+        for metric, old in before[key].items():
+            new = after[key].get(metric)
+            if not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or not old:
+                continue
+            change = new / old - 1
+            higher_is_better = metric.endswith('_per_s')
+            worse = change < -tolerance if higher_is_better else change > tolerance
+            if metric.endswith('_kbps'):
+                worse = False
+            lines.append(f"{'!' if worse else ' '} {key[0]:<10} {key[1]:<32} {metric:<24} "
+                         f"{old:>12} → {new:<12} ({change:+.0%})")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run or compare offline benchmarks.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_run = sub.add_parser('run', help='Run benchmark suites and record the results')
+    p_run.add_argument('--suite', action='append', choices=sorted(SUITES), help='Suite to run (repeatable; default: all)')
+    p_run.add_argument('--max-items', type=int, default=DEFAULT_MAX_ITEMS,
+                       help='Skip cases with more bank questions/queue rows than this')
+    p_compare = sub.add_parser('compare', help='Compare recorded results of two commits')
+    p_compare.add_argument('--base', required=True, help='Baseline commit (prefix)')
+    p_compare.add_argument('--head', default='HEAD', help='Commit to compare (prefix, default: HEAD)')
+    p_compare.add_argument('--tolerance', type=float, default=0.1, help='Relative change that counts as a regression')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run_benchmarks(args.suite or list(SUITES), args.max_items)
+        print(f"Results appended to {RESULTS}")
+        return
+    head = git_revision().split('-')[0] if args.head == 'HEAD' else args.head
+    lines = compare(args.base, head, args.tolerance)
+    if not lines:
+        print(f"No common results recorded for {args.base} and {head}.")
+        return
+    print('\n'.join(lines))
+    if any(line.startswith('!') for line in lines):
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+config_loader.py
+----------------
+
+Shared loader for the YAML files in ``config/`` (``ops.yml``,
+``brand.yml``, ``status_keys.yml``, ``seo.yml``). A file is parsed and
+checked against ``SCHEMAS`` only when it changes. The validated result is
+kept as JSON in ``cache/config/`` along with the file's mtime and size.
+Later runs ``stat`` the YAML file and, if both still match, read the
+JSON instead. On that path PyYAML is never imported, and that import is
+most of the startup time of the light stages n8n runs every few hours
+(``buffer_watcher.py``, the approvals, uploads). Inside one process the
+result is also memoized under the same key, so long-running services see
+edits without reparsing on every call.
+
+An invalid file raises ``ConfigError`` naming the file and the key, and
+is never cached. Set ``QS_CONFIG_CACHE=off`` to always parse (the disk
+cache is skipped, the in-process memo is kept).
+
+Usage:
+
+    python config_loader.py check
+    python config_loader.py show ops
+    python config_loader.py show brand --section colors
+
+Configuration files:
+    config/*.yml
+
+Data files:
+    cache/config/<name>.json
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+# Bump when SCHEMAS or the cache layout change so older cache files are reparsed
+CACHE_VERSION = 4
+
+NUMBER = (int, float)
+
+# Expected type per key, by file and section. Sections and keys not listed
+# are accepted as they are; listed ones must have the given type.
+SCHEMAS: Dict[str, dict] = {
+    'ops': {
+        'buffer': {'low_watermark': int, 'target': int},
+        'approvals': {'topic': bool, 'prerender': bool, 'queue': bool},
+        'telegram': {'chat_id': str, 'bot_token_env': str},
+        'dedupe': {'similarity_threshold': NUMBER},
+        'render_cache': {'enabled': bool, 'dir': str, 'max_size_mb': NUMBER},
+        'render_farm': {'enabled': bool, 'db': str, 'url': str, 'host': str, 'port': int,
+                        'token_env': str, 'output_root': str,
+                        'lease_seconds': NUMBER, 'max_attempts': int, 'poll_seconds': NUMBER},
+        'planner': {'batch_size': int, 'series_cooldown': int},
+        'scheduler': {'render_workers': int, 'io_workers': int, 'questions_per_topic': int},
+        'analytics': {'window_days': int, 'min_age_hours': NUMBER, 'thresholds': dict},
+        'upload': {'chunk_mb': NUMBER, 'max_retries': int, 'platforms': dict},
+        'generation': {'backend': str, 'batch_size': int, 'workers': int,
+                       'tokens_per_minute': NUMBER, 'requests_per_minute': NUMBER,
+                       'overgenerate': NUMBER, 'max_retries': int},
+    },
+    'brand': {
+        'typography': {'question_font_size': int, 'option_font_size': int, 'hint_font_size': int},
+        'colors': {'background': str, 'text_primary': str, 'text_secondary': str,
+                   'correct_option': str, 'wrong_option': str},
+        'short': {'timer_seconds': NUMBER, 'min_duration_sec': NUMBER, 'max_duration_sec': NUMBER,
+                  'reading_wps': NUMBER, 'reveal_seconds': NUMBER,
+                  'explanation_min_seconds': NUMBER, 'transition_ms': NUMBER},
+        'encoder': {'publish_profile': str, 'profiles': dict},
+    },
+    'status_keys': {'states': list, 'buffer_counts': str},
+    'seo': {'title_template': str, 'description_template': str, 'hashtags': list},
+}
+
+# Keys the scripts index directly, so a file without them is rejected
+REQUIRED = {
+    'ops': ['buffer.low_watermark', 'buffer.target', 'telegram.chat_id'],
+    'brand': ['colors.background', 'colors.text_primary', 'short.timer_seconds',
+              'short.min_duration_sec', 'short.max_duration_sec'],
+    'status_keys': ['states'],
+}
+
+# Files loaded by this process: path -> ((version, mtime_ns, size), JSON text)
+_memo: Dict[Path, Tuple[tuple, str]] = {}
+
+
+class ConfigError(ValueError):
+    """A configuration file is missing a required key or has a value of the wrong type."""
+
+
+def config_path(base: Path, name: str) -> Path:
+    return base / 'config' / f'{name}.yml'
+
+
+def cache_path(base: Path, name: str) -> Path:
+    return base / 'cache' / 'config' / f'{name}.json'
+
+
+def _type_name(expected) -> str:
+    types = expected if isinstance(expected, tuple) else (expected,)
+    return ' or '.join(t.__name__ for t in types)
+
+
+def _check(path: Path, key: str, value, expected) -> None:
+    types = expected if isinstance(expected, tuple) else (expected,)
+    # YAML's true/false are ints to isinstance; only accept them where a bool is expected
+    if isinstance(value, bool) and bool not in types or not isinstance(value, types):
+        raise ConfigError(f"{path}: {key} must be {_type_name(expected)}, got {value!r}")
+
+
+def validate(name: str, data, path: Path) -> dict:
+    """Check parsed file contents against ``SCHEMAS``; returns them unchanged."""
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        raise ConfigError(f"{path}: expected a mapping at the top level")
+    for section, spec in SCHEMAS.get(name, {}).items():
+        if section not in data:
+            continue
+        value = data[section]
+        if not isinstance(spec, dict):
+            _check(path, section, value, spec)
+            continue
+        if value is None:
+            continue  # empty section; the scripts fall back to their defaults
+        _check(path, section, value, dict)
+        for key, expected in spec.items():
+            if key in value:
+                _check(path, f'{section}.{key}', value[key], expected)
+    for dotted in REQUIRED.get(name, []):
+        node = data
+        for part in dotted.split('.'):
+            if not isinstance(node, dict) or part not in node:
+                raise ConfigError(f"{path}: missing required key {dotted}")
+            node = node[part]
+    return data
+
+
+def _parse(name: str, path: Path) -> str:
+    import yaml  # only needed when the cache is stale
+
+    with path.open() as f:
+        data = validate(name, yaml.safe_load(f), path)
+    # YAML dates and the like become strings, identically on cached and uncached loads
+    return json.dumps(data, default=str)
+
+
+def _read_cache(cache: Path, key: tuple) -> Optional[dict]:
+    try:
+        with cache.open() as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cached['data'] if cached.get('key') == list(key) else None
+
+
+def _write_cache(cache: Path, key: tuple, text: str) -> None:
+    tmp = cache.with_name(f'{cache.name}.{os.getpid()}.tmp')
+    try:
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        with tmp.open('w') as f:
+            f.write(f'{{"key": {json.dumps(list(key))}, "data": {text}}}\n')
+        os.replace(tmp, cache)
+    except OSError:
+        tmp.unlink(missing_ok=True)  # read-only checkout; parse again next time
+
+
+def load_config(base: Path, name: str) -> dict:
+    """Validated contents of ``config/<name>.yml``, reparsed only when the file changes.
+
+    Every call returns a fresh copy, so callers may modify it.
+    """
+    path = config_path(base, name)
+    st = path.stat()
+    key = (CACHE_VERSION, st.st_mtime_ns, st.st_size)
+    memo = _memo.get(path)
+    if memo is not None and memo[0] == key:
+        return json.loads(memo[1])
+    use_disk = os.environ.get('QS_CONFIG_CACHE') != 'off'
+    cache = cache_path(base, name)
+    data = _read_cache(cache, key) if use_disk else None
+    if data is None:
+        text = _parse(name, path)
+        if use_disk:
+            _write_cache(cache, key, text)
+        data = json.loads(text)
+    else:
+        text = json.dumps(data)
+    _memo[path] = (key, text)
+    return data
+
+
+def config_section(base: Path, section: str, defaults: Optional[dict] = None, name: str = 'ops') -> dict:
+    """One section of a config file merged over ``defaults``.
+
+    A missing file or section yields the defaults.
+    """
+    settings = dict(defaults or {})
+    if config_path(base, name).exists():
+        settings.update(load_config(base, name).get(section) or {})
+    return settings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Validate and show the cached configuration.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('check', help='Validate every configuration file')
+    p_show = sub.add_parser('show', help='Print a configuration file as JSON')
+    p_show.add_argument('name', choices=sorted(SCHEMAS), help='File name without .yml')
+    p_show.add_argument('--section', help='Only this section')
+    args = parser.parse_args()
+
+    base = Path(__file__).resolve().parent.parent
+    if args.command == 'show':
+        data = load_config(base, args.name)
+        if args.section:
+            data = data.get(args.section)
+        print(json.dumps(data, indent=2, ensure_ascii=False))
+        return
+    failed = False
+    for name in SCHEMAS:
+        path = config_path(base, name)
+        if not path.exists():
+            print(f"{path}: not found")
+            continue
+        try:
+            load_config(base, name)
+            print(f"{path}: ok")
+        except ConfigError as exc:
+            print(exc, file=sys.stderr)
+            failed = True
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -3,33 +3,384 @@ dedupe.py
 ---------
 
 This script removes duplicate questions by comparing new questions against
-a questions bank. For simplicity, this placeholder implementation
-assumes all questions are unique. For production, compute sentence
-embeddings and drop questions whose similarity exceeds a threshold.
+a questions bank. Exact repeats are caught by hashing the normalized
+question text. Near-duplicates (rewordings, changed punctuation or
+articles) are caught with MinHash signatures over character n-grams,
+looked up through locality-sensitive hashing (LSH) buckets so each check
+touches only a handful of candidate questions regardless of bank size.
+
+The hashes, signatures and buckets live in a persistent SQLite index next
+to the bank (``dedupe.index.db`` inside a sharded bank directory, see
+``question_bank.py``, or ``questions_bank.index.db`` beside a legacy JSONL
+bank). The index remembers how far into the bank it has read (the last
+sequence number per shard, or the byte offset into the JSONL file), so
+each run only indexes questions appended since the previous run instead
+of rebuilding from the full bank.
+
+Questions are streamed through one at a time (see ``question_stream.py``;
+``-`` reads stdin or writes stdout), and questions accepted earlier in the
+same run are checked through TEMP tables of the index connection rather
+than a growing in-memory list, so memory stays flat on large bulk
+imports. Only publishing writes to the shared index; filtering never
+holds a transaction open on it while the stream is consumed, so other
+processes can sync or publish in the meantime.
 
 Usage:
 
-    python dedupe.py --in verified.jsonl --bank data/questions_bank.jsonl --out deduped.jsonl
+    python dedupe.py --in verified.jsonl --bank data/bank --out deduped.jsonl
+    python dedupe.py --in deduped.jsonl --bank data/bank --publish --topic "World Capitals"
+    python dedupe.py --job current --bank data/bank
+    python dedupe.py --job current --bank data/bank --publish
+
+With ``--job`` the job's ``verified.jsonl`` is filtered into its
+``deduped.jsonl``; the step is skipped when neither the input nor the
+bank (which only grows, so its size is enough) has changed since
+(see ``job_journal.py``). Publishing under ``--job`` files the questions
+under the job's topic, series and locale.
+
+Configuration files:
+    config/ops.yml (``dedupe.similarity_threshold``)
 """
 
 import argparse
+import hashlib
 import json
+import re
+import sqlite3
+import sys
+import unicodedata
+from array import array
 from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+from config_loader import config_section
+from instrument import add_profiler_argument, instrumented, stage
+from job_journal import add_job_argument, job_step, open_job, skip_message
+from question_stream import read_questions, write_questions
+
+NGRAM = 5
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+DEFAULT_THRESHOLD = 0.8
+
+# Fixed MinHash permutations (a * x + b) mod p so signatures stay
+# comparable across runs and machines.
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_PERMS = [
+    (int.from_bytes(hashlib.blake2b(f'a{i}'.encode(), digest_size=8).digest(), 'big') % (_PRIME - 1) + 1,
+     int.from_bytes(hashlib.blake2b(f'b{i}'.encode(), digest_size=8).digest(), 'big') % _PRIME)
+    for i in range(NUM_PERM)
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS exact (digest TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS signatures (id INTEGER PRIMARY KEY, sig BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS buckets (band INTEGER, bucket TEXT, id INTEGER);
+CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets (band, bucket);
+"""
+
+# Questions accepted earlier in the current run; TEMP tables are private to
+# the connection, so writing them takes no lock on the shared index
+RUN_SCHEMA = """
+CREATE TEMP TABLE IF NOT EXISTS run_exact (digest TEXT PRIMARY KEY);
+CREATE TEMP TABLE IF NOT EXISTS run_signatures (id INTEGER PRIMARY KEY, sig BLOB NOT NULL);
+CREATE TEMP TABLE IF NOT EXISTS run_buckets (band INTEGER, bucket TEXT, id INTEGER);
+CREATE INDEX IF NOT EXISTS temp.run_buckets_lookup ON run_buckets (band, bucket);
+"""
+
+# Table name prefixes of the bank's entries and of the current run's
+TABLE_SETS = ('', 'run_')
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, strip accents and punctuation, and collapse whitespace."""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+
+def exact_digest(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def minhash(normalized: str) -> array:
+    """Compute the MinHash signature of a normalized string's character n-grams."""
+    padded = f' {normalized} '
+    grams = {padded[i:i + NGRAM] for i in range(max(1, len(padded) - NGRAM + 1))}
+    hashed = [int.from_bytes(hashlib.blake2b(g.encode(), digest_size=4).digest(), 'big') for g in grams]
+    return array('Q', (min((a * h + b) % _PRIME & _MAX_HASH for h in hashed) for a, b in _PERMS))
+
+
+def band_keys(sig: array) -> List[str]:
+    return [sig[band * ROWS:(band + 1) * ROWS].tobytes().hex() for band in range(BANDS)]
+
+
+def similarity(sig_a: array, sig_b: array) -> float:
+    """Estimate the Jaccard similarity of two signatures."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERM
+
+
+class QuestionIndex:
+    """Persistent exact-hash and MinHash-LSH index over the questions bank."""
+
+    def __init__(self, db_path: Path) -> None:
+        # Concurrent jobs sync the same index; a sync waits for the one before it
+        self.conn = sqlite3.connect(str(db_path), timeout=120)
+        self.conn.executescript(SCHEMA + RUN_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> 'QuestionIndex':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _meta(self, key: str, default: str) -> str:
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _insert(self, prefix: str, question: dict) -> None:
+        normalized = normalize_text(question['question'])
+        self.conn.execute(f'INSERT OR IGNORE INTO {prefix}exact VALUES (?)', (exact_digest(normalized),))
+        sig = minhash(normalized)
+        cur = self.conn.execute(f'INSERT INTO {prefix}signatures (sig) VALUES (?)', (sig.tobytes(),))
+        self.conn.executemany(
+            f'INSERT INTO {prefix}buckets VALUES (?, ?, ?)',
+            [(band, key, cur.lastrowid) for band, key in enumerate(band_keys(sig))],
+        )
+
+    def add(self, question: dict) -> None:
+        """Index a single question. Call ``commit`` to persist."""
+        self._insert('', question)
+
+    def remember(self, question: dict) -> None:
+        """Check later questions of this run against ``question`` without touching the bank's index."""
+        self._insert('run_', question)
+        self.commit()  # temp tables only; ends the implicit transaction before control leaves
+
+    def forget_run(self) -> None:
+        self.conn.executescript('DELETE FROM run_exact; DELETE FROM run_signatures; DELETE FROM run_buckets;')
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def sync(self, bank_path: Path) -> int:
+        """Index questions appended to the bank since the last sync."""
+        if is_sharded(bank_path):
+            return self._sync_shards(bank_path)
+        if not bank_path.exists():
+            return 0
+        # Read the offset under the write lock, so two processes never index the same lines
+        self.conn.execute('BEGIN IMMEDIATE')
+        offset = int(self._meta('bank_offset', '0'))
+        if offset > bank_path.stat().st_size:
+            # Bank was truncated or replaced; start over
+            for table in ('exact', 'signatures', 'buckets'):
+                self.conn.execute(f'DELETE FROM {table}')
+            offset = 0
+        added = 0
+        with stage('dedupe.sync') as s, bank_path.open('rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # partially written line; pick it up next time
+                offset += len(line)
+                if line.strip():
+                    self.add(json.loads(line))
+                    added += 1
+            s.items = added
+        self.conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('bank_offset', str(offset)))
+        self.commit()
+        return added
+
+    def _sync_shards(self, bank_path: Path) -> int:
+        # Imported here so filtering against a JSONL bank (and factcheck,
+        # which borrows normalize_text) does not pay for NumPy
+        from question_bank import open_bank
+
+        added = 0
+        with stage('dedupe.sync') as s, open_bank(bank_path) as bank:
+            self.conn.execute('BEGIN IMMEDIATE')  # see sync
+            for shard in bank.shards():
+                key = f'seq:{shard.name}'
+                last = int(self._meta(key, '0'))
+                for last, question in shard.after(last):
+                    self.add(question)
+                    added += 1
+                self.conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, str(last)))
+            s.items = added
+        self.commit()
+        return added
+
+    def is_exact_duplicate(self, normalized: str) -> bool:
+        digest = exact_digest(normalized)
+        return any(self.conn.execute(f'SELECT 1 FROM {prefix}exact WHERE digest = ?', (digest,)).fetchone()
+                   for prefix in TABLE_SETS)
+
+    def best_match(self, sig: array) -> float:
+        """Return the highest estimated similarity among LSH candidates of the bank and the run."""
+        best = 0.0
+        for prefix in TABLE_SETS:
+            candidates = set()
+            for band, key in enumerate(band_keys(sig)):
+                candidates.update(r[0] for r in self.conn.execute(
+                    f'SELECT id FROM {prefix}buckets WHERE band = ? AND bucket = ?', (band, key)))
+            for cid in candidates:
+                (blob,) = self.conn.execute(f'SELECT sig FROM {prefix}signatures WHERE id = ?', (cid,)).fetchone()
+                other = array('Q')
+                other.frombytes(blob)
+                best = max(best, similarity(sig, other))
+        return best
+
+
+def is_sharded(bank_path: Path) -> bool:
+    """True for a ``question_bank.py`` directory, False for a legacy JSONL bank."""
+    return bank_path.suffix != '.jsonl'
+
+
+def default_index_path(bank_path: Path) -> Path:
+    if is_sharded(bank_path):
+        bank_path.mkdir(parents=True, exist_ok=True)
+        return bank_path / 'dedupe.index.db'
+    return bank_path.with_suffix('.index.db')
+
+
+def bank_size(bank_path: Path) -> int:
+    """Bytes on disk, enough to tell whether the bank changed."""
+    if is_sharded(bank_path):
+        return sum(p.stat().st_size for p in bank_path.glob('*/*.bin'))
+    return bank_path.stat().st_size if bank_path.exists() else 0
+
+
+def iter_unique(questions: Iterable[dict], index: QuestionIndex,
+                threshold: float = DEFAULT_THRESHOLD) -> Iterator[dict]:
+    """Lazily drop questions that repeat the bank or an earlier question in the stream.
+
+    Accepted questions go to the run's TEMP tables so later questions are
+    checked against them too; they are cleared at the end because nothing
+    is published yet.
+    """
+    try:
+        for q in questions:
+            normalized = normalize_text(q['question'])
+            if index.is_exact_duplicate(normalized):
+                continue
+            if index.best_match(minhash(normalized)) >= threshold:
+                continue
+            index.remember(q)
+            yield q
+    finally:
+        index.forget_run()
+
+
+def filter_duplicates(questions: Iterable[dict], index: QuestionIndex,
+                      threshold: float = DEFAULT_THRESHOLD) -> List[dict]:
+    """Drop questions that repeat the bank or an earlier question in the batch."""
+    return list(iter_unique(questions, index, threshold))
+
+
+def iter_deduped(questions: Iterable[dict], bank_path: Path, threshold: float = DEFAULT_THRESHOLD,
+                 index_path: Optional[Path] = None) -> Iterator[dict]:
+    """Sync the bank index, then lazily yield the questions that are not duplicates."""
+    with QuestionIndex(index_path or default_index_path(bank_path)) as index:
+        index.sync(bank_path)
+        yield from iter_unique(questions, index, threshold)
+
+
+def dedupe_records(questions: Iterable[dict], bank_path: Path, threshold: float = DEFAULT_THRESHOLD,
+                   index_path: Optional[Path] = None) -> List[dict]:
+    """Sync the bank index and return the questions that are not duplicates."""
+    return list(iter_deduped(questions, bank_path, threshold, index_path))
+
+
+def deduplicate(in_path: Path, bank_path: Path, out_path: Path,
+                threshold: float = DEFAULT_THRESHOLD, index_path: Optional[Path] = None) -> int:
+    """Write the input questions that are not duplicates to output.
+
+    Returns the number of questions removed.
+    """
+    seen = 0
+
+    def counted() -> Iterator[dict]:
+        nonlocal seen
+        for q in read_questions(in_path):
+            seen += 1
+            yield q
+
+    with stage('dedupe.filter') as s:
+        kept = s.items = write_questions(out_path, iter_deduped(counted(), bank_path, threshold, index_path))
+        s.fields['removed'] = seen - kept
+    return seen - kept
+
+
+def publish_to_bank(in_path: Path, bank_path: Path, index_path: Optional[Path] = None,
+                    topic: str = '', series: str = '', locale: str = '') -> int:
+    """Append published questions to the bank and index them incrementally."""
+    if is_sharded(bank_path):
+        from question_bank import open_bank
+
+        with open_bank(bank_path) as bank:
+            n = bank.append(read_questions(in_path), topic, series, locale)
+    else:
+        n = write_questions(bank_path, read_questions(in_path), append=True)
+    with QuestionIndex(index_path or default_index_path(bank_path)) as index:
+        index.sync(bank_path)
+    return n
+
 
-def deduplicate(in_path: Path, bank_path: Path, out_path: Path) -> None:
-    """Write the input questions to output without modification."""
-    with in_path.open() as fin, out_path.open('w') as fout:
-        for line in fin:
-            fout.write(line)
+def load_threshold(base: Path) -> float:
+    return float(config_section(base, 'dedupe').get('similarity_threshold', DEFAULT_THRESHOLD))
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Remove duplicate questions.")
-    parser.add_argument('--in', dest='inp', required=True, help='Input JSONL file')
-    parser.add_argument('--bank', required=True, help='Path to questions bank JSONL')
-    parser.add_argument('--out', dest='outp', required=True, help='Output JSONL file')
+    parser.add_argument('--in', dest='inp', help='Input JSONL file')
+    parser.add_argument('--bank', required=True, help='Questions bank directory (or legacy JSONL file)')
+    parser.add_argument('--out', dest='outp', help='Output JSONL file')
+    parser.add_argument('--index', help='Path to the index database (default: next to the bank)')
+    parser.add_argument('--threshold', type=float, help='Similarity at or above which a question is a duplicate')
+    parser.add_argument('--publish', action='store_true', help='Append the input to the bank instead of filtering it')
+    parser.add_argument('--topic', default='', help='Topic to file published questions under')
+    parser.add_argument('--series', default='', help='Series to file published questions under')
+    parser.add_argument('--locale', default='', help='Locale to file published questions under')
+    add_job_argument(parser)
+    add_profiler_argument(parser)
     args = parser.parse_args()
-    deduplicate(Path(args.inp), Path(args.bank), Path(args.outp))
-    print(f"Deduplicated {args.inp} → {args.outp}")
+    with instrumented('dedupe', args.profiler):
+        base = Path(__file__).resolve().parent.parent
+        journal = open_job(base, args.job) if args.job else None
+        if journal is not None:
+            args.inp = args.inp or str(journal.file('verified.jsonl' if not args.publish else 'deduped.jsonl'))
+            args.outp = str(journal.file('deduped.jsonl'))
+            args.topic = args.topic or journal.topic
+            args.series = args.series or journal.data.get('series', '')
+            args.locale = args.locale or journal.data.get('locale', '')
+        if not args.inp:
+            parser.error('--in is required unless --job is given')
+        index_path = Path(args.index) if args.index else None
+        if args.publish:
+            n = publish_to_bank(Path(args.inp), Path(args.bank), index_path, args.topic, args.series, args.locale)
+            print(f"Added {n} questions from {args.inp} to {args.bank}")
+            return
+        if not args.outp:
+            parser.error('--out is required unless --publish is given')
+        threshold = args.threshold
+        if threshold is None:
+            threshold = load_threshold(base)
+        bank = Path(args.bank)
+        params = {'threshold': threshold, 'bank': str(bank), 'bank_size': bank_size(bank)}
+        with job_step(journal, 'dedupe', [Path(args.inp)], [Path(args.outp)], params) as step:
+            if step.skipped:
+                print(skip_message(journal, 'dedupe'))
+                return
+            removed = deduplicate(Path(args.inp), bank, Path(args.outp), threshold, index_path)
+        print(f"Deduplicated {args.inp} → {args.outp} ({removed} removed)",
+              file=sys.stderr if args.outp == '-' else sys.stdout)
 
 if __name__ == '__main__':
     main()
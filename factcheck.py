@@ -3,36 +3,350 @@ factcheck.py
 -------------
 
 This script verifies the correctness of generated questions by cross-
-checking answers against trusted sources (e.g., Wikidata/Wikipedia). In
-this placeholder version, fact-checking always succeeds and returns the
-same questions. For a real implementation, integrate with an API or
-scrape structured data to confirm answers.
+checking each marked answer against a local, offline knowledge snapshot
+(``data/facts.db``): a compact SQLite table of (subject, relation,
+object) facts in the style of Wikidata statements, with a full-text
+index over subjects. A question is *supported* when a fact about a
+subject named in the question has the marked answer as its object, and
+*contradicted* when that fact points at one of the other options instead.
+Questions the snapshot knows nothing about can be passed to an optional
+remote backend; otherwise they are reported as *unknown*.
+
+``--build-snapshot`` replaces the whole snapshot: facts are imported
+into a fresh database that is then renamed over ``data/facts.db``, and
+a hash of its facts is stored as the snapshot version.
+
+Verdicts are cached in ``data/factcheck_cache.db`` by snapshot version
+and normalized (question, answer), so rebuilding the snapshot retires
+every verdict drawn from the old one, while facts that recur across series (capitals, flags)
+are only ever checked once. Uncached questions are looked up concurrently
+while the input is still being read, and results are written in input
+order as soon as they are ready, so the stage works on a stream (``-``
+for stdin/stdout) without holding the whole file in memory.
+
+Each output question carries ``fact_check: {verdict, confidence, source}``.
+Contradicted questions are dropped unless ``--keep-contradicted`` is given.
 
 Usage:
 
     python factcheck.py --in questions.jsonl --out verified.jsonl
+    python factcheck.py --in questions.jsonl --out verified.jsonl --remote http://localhost:8090/check
+    python factcheck.py --build-snapshot facts.jsonl
+    python factcheck.py --job current
+
+With ``--job`` the job's ``questions.jsonl`` is checked into its
+``verified.jsonl``, unless that already happened for the same input
+(see ``job_journal.py``).
+
+The snapshot source is JSONL with ``subject``, ``relation`` and ``object``
+keys, e.g. ``{"subject": "Poland", "relation": "capital", "object": "Warsaw"}``.
 """
 
 import argparse
+import hashlib
 import json
+import os
+import sqlite3
+import sys
+import threading
+import urllib.request
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dedupe import normalize_text
+from instrument import add_profiler_argument, instrumented, stage
+from job_journal import add_job_argument, job_step, open_job, skip_message
+from question_stream import read_questions, write_questions
+
+SUPPORTED, CONTRADICTED, UNKNOWN = 'supported', 'contradicted', 'unknown'
+
+SNAPSHOT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS facts (
+    id INTEGER PRIMARY KEY,
+    subject TEXT NOT NULL,
+    relation TEXT NOT NULL,
+    object TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS facts_fts USING fts5(subject, content='facts', content_rowid='id');
+"""
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verdicts (
+    key TEXT PRIMARY KEY,
+    verdict TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    source TEXT NOT NULL
+);
+"""
+
+# Words too common to help find the subject of a question
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'at', 'by', 'does', 'for', 'from', 'how', 'in', 'is',
+    'it', 'of', 'on', 'the', 'this', 'to', 'was', 'what', 'when', 'where', 'which',
+    'who', 'whose', 'with',
+}
+
+
+def build_snapshot(source_path: Path, db_path: Path) -> int:
+    """Replace the snapshot database with the JSONL facts. Returns the count."""
+    tmp = db_path.with_name(db_path.name + '.tmp')
+    tmp.unlink(missing_ok=True)
+    conn = sqlite3.connect(str(tmp))
+    conn.executescript(SNAPSHOT_SCHEMA)
+    digest = hashlib.sha1()
+    n = 0
+    with stage('factcheck.snapshot') as s, conn, source_path.open() as f:
+        for line in f:
+            if not line.strip():
+                continue
+            fact = json.loads(line)
+            row = (normalize_text(fact['subject']), normalize_text(fact['relation']),
+                   normalize_text(str(fact['object'])))
+            conn.execute('INSERT INTO facts (subject, relation, object) VALUES (?, ?, ?)', row)
+            digest.update('\x1f'.join(row).encode() + b'\n')
+            n += 1
+        conn.execute("INSERT INTO facts_fts(facts_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO meta VALUES ('version', ?)", (digest.hexdigest(),))
+        s.items = n
+    conn.close()
+    # Checkers that already opened the old snapshot keep reading it
+    os.replace(tmp, db_path)
+    return n
+
+
+def contains_phrase(text: str, phrase: str) -> bool:
+    return f' {phrase} ' in f' {text} '
+
+
+def judge(question: str, answer: str, others: List[str],
+          facts: List[Tuple[str, str, str]]) -> Tuple[str, float]:
+    """Compare the marked answer with facts about subjects named in the question."""
+    relevant = [f for f in facts if contains_phrase(question, f[0])]
+    if not relevant:
+        return UNKNOWN, 0.0
+    # Prefer facts whose relation is also mentioned ("capital", "currency")
+    on_topic = [f for f in relevant if all(contains_phrase(question, w) for w in f[1].split())]
+    objects = {f[2] for f in (on_topic or relevant)}
+    confidence = 0.95 if on_topic else 0.6
+    if answer in objects:
+        return SUPPORTED, confidence
+    if any(o in objects for o in others):
+        return CONTRADICTED, confidence
+    return UNKNOWN, 0.2
+
+
+class RemoteBackend:
+    """Optional HTTP verifier used when the local snapshot has no answer.
+
+    The endpoint receives ``{"question", "answer", "options"}`` as JSON and
+    must reply with ``{"verdict", "confidence"}``.
+    """
+
+    def __init__(self, url: str, timeout: float = 10.0) -> None:
+        self.url = url
+        self.timeout = timeout
+
+    def check(self, question: dict) -> Tuple[str, float]:
+        payload = json.dumps({
+            'question': question['question'],
+            'answer': question['options'][question['correct']],
+            'options': question['options'],
+        }).encode()
+        request = urllib.request.Request(self.url, data=payload, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as resp:
+            result = json.load(resp)
+        return result.get('verdict', UNKNOWN), float(result.get('confidence', 0.0))
+
+
+class FactChecker:
+    """Checks questions against the snapshot, a verdict cache and an optional remote backend."""
+
+    def __init__(self, snapshot_path: Path, cache_path: Path,
+                 remote: Optional[RemoteBackend] = None, workers: int = 8) -> None:
+        self.snapshot_path = snapshot_path
+        self.remote = remote
+        self.workers = workers
+        self.cache = sqlite3.connect(str(cache_path))
+        self.cache.executescript(CACHE_SCHEMA)
+        self._local = threading.local()
+        self.snapshot_version = self._snapshot_version()
+
+    def close(self) -> None:
+        self.cache.close()
+
+    def __enter__(self) -> 'FactChecker':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def cache_key(self, question: dict) -> str:
+        answer = question['options'][question['correct']]
+        text = '\x1f'.join((self.snapshot_version, normalize_text(question['question']),
+                            normalize_text(str(answer))))
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def _snapshot_version(self) -> str:
+        conn = self._snapshot()
+        if conn is None:
+            return ''
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        except sqlite3.OperationalError:
+            # Snapshot built before versions were recorded
+            return ''
+        return row[0] if row else ''
+
+    def _snapshot(self) -> Optional[sqlite3.Connection]:
+        # One read-only connection per worker thread
+        if not self.snapshot_path.exists():
+            return None
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f'file:{self.snapshot_path}?mode=ro', uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def candidate_facts(self, question: str, limit: int = 50) -> List[Tuple[str, str, str]]:
+        conn = self._snapshot()
+        terms = [w for w in question.split() if w not in STOPWORDS]
+        if conn is None or not terms:
+            return []
+        match = ' OR '.join(f'"{w}"' for w in terms)
+        return conn.execute(
+            'SELECT f.subject, f.relation, f.object FROM facts_fts '
+            'JOIN facts f ON f.id = facts_fts.rowid '
+            'WHERE facts_fts MATCH ? ORDER BY rank LIMIT ?',
+            (match, limit),
+        ).fetchall()
+
+    def lookup(self, question: dict) -> Dict[str, object]:
+        """Verify one question without consulting the cache."""
+        text = normalize_text(question['question'])
+        options = [normalize_text(str(o)) for o in question['options']]
+        answer = options[question['correct']]
+        others = [o for i, o in enumerate(options) if i != question['correct']]
+        verdict, confidence = judge(text, answer, others, self.candidate_facts(text))
+        source = 'snapshot'
+        if verdict == UNKNOWN and self.remote is not None:
+            try:
+                verdict, confidence = self.remote.check(question)
+                source = 'remote'
+            except (OSError, ValueError):
+                pass
+        return {'verdict': verdict, 'confidence': round(confidence, 3), 'source': source}
+
+    def cached(self, key: str) -> Optional[Dict[str, object]]:
+        row = self.cache.execute(
+            'SELECT verdict, confidence, source FROM verdicts WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return {'verdict': row[0], 'confidence': row[1], 'source': row[2]}
+
+    def remember(self, key: str, result: Dict[str, object]) -> None:
+        # Unknown verdicts are not cached so a richer snapshot can still answer later
+        if result['verdict'] == UNKNOWN:
+            return
+        with self.cache:
+            self.cache.execute('INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?)',
+                               (key, result['verdict'], result['confidence'], result['source']))
+
+    def check_stream(self, questions: Iterable[dict]) -> Iterator[Tuple[dict, Dict[str, object]]]:
+        """Yield ``(question, verdict)`` in input order, looking up uncached ones concurrently.
+
+        At most ``workers`` lookups are in flight, and a result is yielded as
+        soon as it and everything before it are done.
+        """
+        window: deque = deque()
+
+        def settle() -> Tuple[dict, Dict[str, object]]:
+            question, key, pending = window.popleft()
+            if isinstance(pending, Future):
+                pending = pending.result()
+                self.remember(key, pending)
+            return question, pending
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for question in questions:
+                key = self.cache_key(question)
+                result = self.cached(key)
+                window.append((question, key, result if result else pool.submit(self.lookup, question)))
+                while window and (len(window) > self.workers or not isinstance(window[0][2], Future)
+                                  or window[0][2].done()):
+                    yield settle()
+            while window:
+                yield settle()
+
+
+def open_fact_checker(base: Path, remote_url: Optional[str] = None) -> FactChecker:
+    data = base / 'data'
+    remote = RemoteBackend(remote_url) if remote_url else None
+    return FactChecker(data / 'facts.db', data / 'factcheck_cache.db', remote)
+
+
+def iter_factchecked(questions: Iterable[dict], checker: FactChecker,
+                     keep_contradicted: bool = False) -> Iterator[dict]:
+    """Lazily attach a verdict to each question and drop contradicted ones."""
+    for data, result in checker.check_stream(questions):
+        if result['verdict'] == CONTRADICTED and not keep_contradicted:
+            continue
+        yield dict(data, fact_checked=True, fact_check=result)
+
+def factcheck_records(questions: Iterable[dict], checker: FactChecker,
+                      keep_contradicted: bool = False) -> List[dict]:
+    """Attach a verdict to each question and drop contradicted ones."""
+    return list(iter_factchecked(questions, checker, keep_contradicted))
+
+def factcheck_questions(in_path: Path, out_path: Path, checker: FactChecker,
+                        keep_contradicted: bool = False) -> int:
+    """Fact-check a JSONL file. Returns the number of questions dropped."""
+    seen = 0
+
+    def counted() -> Iterator[dict]:
+        nonlocal seen
+        for q in read_questions(in_path):
+            seen += 1
+            yield q
 
-def factcheck_questions(in_path: Path, out_path: Path) -> None:
-    """Copy questions from input to output, simulating fact-checking."""
-    with in_path.open() as fin, out_path.open('w') as fout:
-        for line in fin:
-            data = json.loads(line)
-            # Add a placeholder flag indicating the question was fact-checked
-            data['fact_checked'] = True
-            fout.write(json.dumps(data) + '\n')
+    with stage('factcheck.check') as s:
+        kept = s.items = write_questions(out_path, iter_factchecked(counted(), checker, keep_contradicted))
+        s.fields['dropped'] = seen - kept
+    return seen - kept
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Fact-check questions.")
-    parser.add_argument('--in', dest='inp', required=True, help='Input JSONL file')
-    parser.add_argument('--out', dest='outp', required=True, help='Output JSONL file')
+    parser.add_argument('--in', dest='inp', help='Input JSONL file')
+    parser.add_argument('--out', dest='outp', help='Output JSONL file')
+    parser.add_argument('--remote', help='URL of a remote verifier for questions the snapshot cannot answer')
+    parser.add_argument('--keep-contradicted', action='store_true', help='Keep questions whose answer is contradicted')
+    parser.add_argument('--build-snapshot', metavar='FACTS_JSONL', help='Import facts into data/facts.db and exit')
+    add_job_argument(parser)
+    add_profiler_argument(parser)
     args = parser.parse_args()
-    factcheck_questions(Path(args.inp), Path(args.outp))
-    print(f"Fact-checked {args.inp} → {args.outp}")
+    with instrumented('factcheck', args.profiler):
+        base = Path(__file__).resolve().parent.parent
+        if args.build_snapshot:
+            n = build_snapshot(Path(args.build_snapshot), base / 'data' / 'facts.db')
+            print(f"Imported {n} facts into {base / 'data' / 'facts.db'}")
+            return
+        journal = open_job(base, args.job) if args.job else None
+        if journal is not None:
+            args.inp = str(journal.file('questions.jsonl'))
+            args.outp = str(journal.file('verified.jsonl'))
+        if not (args.inp and args.outp):
+            parser.error('--in and --out are required unless --build-snapshot or --job is given')
+        params = {'remote': args.remote, 'keep_contradicted': args.keep_contradicted}
+        with job_step(journal, 'factcheck', [Path(args.inp)], [Path(args.outp)], params) as step:
+            if step.skipped:
+                print(skip_message(journal, 'factcheck'))
+                return
+            with open_fact_checker(base, args.remote) as checker:
+                dropped = factcheck_questions(Path(args.inp), Path(args.outp), checker, args.keep_contradicted)
+        print(f"Fact-checked {args.inp} → {args.outp} ({dropped} contradicted)",
+              file=sys.stderr if args.outp == '-' else sys.stdout)
 
 if __name__ == '__main__':
     main()
@@ -8,48 +8,432 @@ generates a set of questions that fit within the total runtime constraint
 (45–59 seconds for a Short). The resulting questions are written to a
 temporary JSON Lines file for downstream processing.
 
-This is a simplified placeholder implementation that produces fixed
-questions for demonstration purposes. In a production system, you
-would integrate with an LLM or question database.
+Questions come from a pluggable backend (``GENERATOR_BACKENDS``):
+
+- ``placeholder`` produces fixed demonstration questions offline (the
+  default until a model is configured);
+- ``http`` posts the prompt to an LLM completion endpoint, e.g.
+  ``llm_standin.py`` locally (``{"model", "prompt", "max_tokens"}`` in,
+  ``{"text", "usage": {"total_tokens"}}`` out);
+- ``command`` pipes the prompt through a local model command (for
+  example ``ollama run llama3``) and reads the JSON answer from stdout.
+
+Several topics are put into one prompt (``batch_size``), batches run
+concurrently (``workers``) within a tokens- and requests-per-minute
+budget, and every topic's questions are cached in
+``data/generation_cache.db`` keyed by (topic, series, locale,
+``PROMPT_VERSION``, backend and model), so switching the backend or
+model never serves questions another one produced. Each topic gets ``overgenerate`` times as many
+questions as requested, so the ones dropped by fact-checking and
+de-duplication can be replaced from the same response instead of
+another round trip.
 
 Usage:
 
     python gen_questions.py --topic "World Capitals" --out questions.jsonl
+    python gen_questions.py --topic "World Capitals" --out - | python factcheck.py --in - --out -
+    python gen_questions.py --approved --out-dir tmp/questions
+    python gen_questions.py --job current
+
+With ``--job`` the topic comes from the job journal, the questions go to
+the job's working directory and nothing is generated if the job already
+has them (see ``job_journal.py``).
 
 Configuration files:
-    config/brand.yml
+    config/ops.yml (``generation`` section)
 """
 
 import argparse
 import json
+import math
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
 
-def generate_placeholder_questions(topic: str, n: int) -> list:
-    """Generate n placeholder question dictionaries for a topic."""
-    questions = []
+from config_loader import config_section
+from instrument import add_profiler_argument, instrumented, stage
+from job_journal import add_job_argument, job_step, open_job, skip_message
+from queue_store import open_queue
+from question_stream import write_questions
+
+# Bump whenever the prompt or response format changes; old cache entries stop matching
+PROMPT_VERSION = '1'
+
+DEFAULT_SETTINGS = {
+    'backend': 'placeholder',
+    'batch_size': 4,
+    'workers': 4,
+    'tokens_per_minute': 40000,
+    'requests_per_minute': 30,
+    'overgenerate': 1.5,
+    'max_retries': 3,
+}
+
+# Rough output size of one question, used to budget tokens before a request
+TOKENS_PER_QUESTION = 80
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    topic TEXT NOT NULL,
+    series TEXT NOT NULL,
+    locale TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    questions TEXT NOT NULL,
+    PRIMARY KEY (topic, series, locale, prompt_version)
+);
+"""
+
+PROMPT_TEMPLATE = """You write multiple-choice questions for short quiz videos.
+For each topic below write exactly {per_topic} questions in the topic's language ({locales}).
+Each question needs four short options, the index of the correct one, an optional hint and a
+one-sentence explanation. Avoid questions whose answer is ambiguous or time-sensitive.
+
+Reply with JSON only, in this shape:
+{{"topics": {{"<topic>": [{{"question": "...", "options": ["...", "...", "...", "..."],
+"correct": 0, "hint": "...", "explanation": "..."}}]}}}}
+
+REQUEST: {request}
+"""
+
+
+def iter_placeholder_questions(topic: str, n: int) -> Iterator[dict]:
+    """Yield n placeholder question dictionaries for a topic."""
     for i in range(1, n + 1):
-        questions.append({
+        yield {
             'question': f'Placeholder question {i} about {topic}?',
             'options': ['Option A', 'Option B', 'Option C', 'Option D'],
             'correct': 0,
             'hint': '',
             'explanation': 'This is a placeholder question.'
-        })
-    return questions
+        }
+
+def generate_placeholder_questions(topic: str, n: int) -> list:
+    """Generate n placeholder question dictionaries for a topic."""
+    return list(iter_placeholder_questions(topic, n))
+
+def build_prompt(topics: List[dict], per_topic: int) -> str:
+    request = {
+        'topics': [{'topic': t['topic'], 'series': t.get('series', ''), 'locale': t.get('locale', '')}
+                   for t in topics],
+        'per_topic': per_topic,
+    }
+    locales = ', '.join(sorted({t.get('locale') or 'EN' for t in topics}))
+    return PROMPT_TEMPLATE.format(per_topic=per_topic, locales=locales, request=json.dumps(request))
+
+def valid_question(q: object) -> bool:
+    return (isinstance(q, dict) and isinstance(q.get('question'), str) and q['question'].strip() != ''
+            and isinstance(q.get('options'), list) and len(q['options']) >= 2
+            and isinstance(q.get('correct'), int) and 0 <= q['correct'] < len(q['options']))
+
+def parse_response(text: str, topics: List[dict]) -> Dict[str, List[dict]]:
+    """Extract per-topic questions from a model reply, dropping malformed ones."""
+    match = re.search(r'\{.*\}', text, re.S)  # tolerate chatter around the JSON
+    if not match:
+        raise ValueError('no JSON object in model response')
+    by_topic = json.loads(match.group(0)).get('topics', {})
+    if not isinstance(by_topic, dict):
+        raise ValueError('"topics" in model response is not an object')
+    result = {}
+    for t in topics:
+        questions = [q for q in by_topic.get(t['topic'], []) if valid_question(q)]
+        result[t['topic']] = [{'question': q['question'], 'options': q['options'], 'correct': q['correct'],
+                               'hint': q.get('hint', ''), 'explanation': q.get('explanation', '')}
+                              for q in questions]
+    return result
+
+
+class PlaceholderBackend:
+    """Offline backend returning the fixed demonstration questions."""
+
+    def __init__(self, settings: dict) -> None:
+        pass
+
+    def generate(self, topics: List[dict], per_topic: int) -> Tuple[Dict[str, List[dict]], int]:
+        return {t['topic']: generate_placeholder_questions(t['topic'], per_topic) for t in topics}, 0
+
+
+class HttpBackend:
+    """LLM completion endpoint speaking ``{"model", "prompt", "max_tokens"}`` JSON."""
+
+    def __init__(self, settings: dict) -> None:
+        self.url = settings['url']
+        self.model = settings.get('model', '')
+        self.timeout = settings.get('timeout', 120)
+
+    def generate(self, topics: List[dict], per_topic: int) -> Tuple[Dict[str, List[dict]], int]:
+        prompt = build_prompt(topics, per_topic)
+        payload = json.dumps({
+            'model': self.model,
+            'prompt': prompt,
+            'max_tokens': len(topics) * per_topic * TOKENS_PER_QUESTION * 2,
+        }).encode()
+        request = urllib.request.Request(self.url, data=payload, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as resp:
+            result = json.load(resp)
+        # A reply without text is retried like any other malformed answer
+        if not isinstance(result, dict) or not isinstance(result.get('text'), str):
+            raise ValueError(f'no "text" in completion reply from {self.url}')
+        return parse_response(result['text'], topics), int(result.get('usage', {}).get('total_tokens', 0))
+
+
+class CommandBackend:
+    """Local model run as a command: prompt on stdin, JSON answer on stdout."""
+
+    def __init__(self, settings: dict) -> None:
+        self.command = settings['command']
+        self.timeout = settings.get('timeout', 600)
+
+    def generate(self, topics: List[dict], per_topic: int) -> Tuple[Dict[str, List[dict]], int]:
+        prompt = build_prompt(topics, per_topic)
+        done = subprocess.run(self.command, input=prompt, capture_output=True, text=True,
+                              shell=isinstance(self.command, str), timeout=self.timeout, check=True)
+        return parse_response(done.stdout, topics), 0
+
+
+GENERATOR_BACKENDS = {
+    'placeholder': PlaceholderBackend,
+    'http': HttpBackend,
+    'command': CommandBackend,
+}
+
+
+class TokenBudget:
+    """Sliding one-minute window over tokens and requests spent."""
+
+    def __init__(self, tokens_per_minute: int = 0, requests_per_minute: int = 0) -> None:
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.lock = threading.Lock()
+        self.spent: deque = deque()  # (monotonic time, tokens, is_request)
+
+    def _fits(self, tokens: int, now: float) -> bool:
+        while self.spent and now - self.spent[0][0] >= 60:
+            self.spent.popleft()
+        if not self.spent:
+            return True
+        used = sum(s[1] for s in self.spent)
+        requests = sum(1 for s in self.spent if s[2])
+        return ((not self.tokens_per_minute or used + tokens <= self.tokens_per_minute)
+                and (not self.requests_per_minute or requests < self.requests_per_minute))
+
+    def acquire(self, tokens: int) -> None:
+        """Block until a request of about ``tokens`` tokens fits the budget."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self._fits(tokens, now):
+                    self.spent.append((now, tokens, True))
+                    return
+                wait = 60 - (now - self.spent[0][0])
+            time.sleep(max(wait, 0.05))
+
+    def correct(self, delta: int) -> None:
+        """Account for the difference between estimated and actual usage."""
+        if delta:
+            with self.lock:
+                self.spent.append((time.monotonic(), delta, False))
+
+
+def generation_source(settings: dict) -> str:
+    """What produces the questions: the backend and its model or command."""
+    model = settings.get('model') or settings.get('command') or ''
+    return f"{settings['backend']}:{model if isinstance(model, str) else json.dumps(model)}"
+
+
+class GenerationCache:
+    """Generated questions per (topic, series, locale, prompt version and source)."""
+
+    def __init__(self, db_path: Path, source: str = '') -> None:
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.executescript(CACHE_SCHEMA)
+        self.lock = threading.Lock()
+        # Stored in the prompt_version column, so entries of another backend never match
+        self.version = f'{PROMPT_VERSION}|{source}'
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _key(self, topic: dict) -> tuple:
+        return topic['topic'], topic.get('series') or '', topic.get('locale') or '', self.version
+
+    def get(self, topic: dict) -> Optional[List[dict]]:
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT questions FROM generations WHERE topic = ? AND series = ? AND locale = ? '
+                'AND prompt_version = ?', self._key(topic)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, topic: dict, questions: List[dict]) -> None:
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?, ?)',
+                              self._key(topic) + (json.dumps(questions),))
+
+
+class QuestionGenerator:
+    """Batches topics into prompts, runs them concurrently and caches the results."""
+
+    def __init__(self, settings: dict, cache: Optional[GenerationCache] = None) -> None:
+        self.settings = dict(DEFAULT_SETTINGS, **settings)
+        self.backend = GENERATOR_BACKENDS[self.settings['backend']](self.settings)
+        self.budget = TokenBudget(self.settings['tokens_per_minute'], self.settings['requests_per_minute'])
+        self.cache = cache
+
+    def close(self) -> None:
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self) -> 'QuestionGenerator':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def per_topic(self, n: int) -> int:
+        """Questions to ask for so that ``n`` survive fact-check and de-duplication."""
+        return math.ceil(n * self.settings['overgenerate'])
+
+    def _run_batch(self, batch: List[dict], per_topic: int) -> Dict[str, List[dict]]:
+        estimate = len(batch) * per_topic * TOKENS_PER_QUESTION
+        attempt = 0
+        while True:
+            self.budget.acquire(estimate)
+            try:
+                with stage('generate.batch', items=len(batch), backend=self.settings['backend']):
+                    result, used = self.backend.generate(batch, per_topic)
+                break
+            except (OSError, ValueError, subprocess.SubprocessError):
+                attempt += 1
+                if attempt > self.settings['max_retries']:
+                    raise
+                time.sleep(2 ** attempt)
+        self.budget.correct(used - estimate if used else 0)
+        for topic in batch:
+            if self.cache is not None and len(result.get(topic['topic'], [])) >= per_topic:
+                self.cache.put(topic, result[topic['topic']])
+        return result
+
+    def generate(self, topics: List[dict], n: int) -> Dict[str, List[dict]]:
+        """Return up to ``per_topic(n)`` questions for every topic, keyed by topic name."""
+        per_topic = self.per_topic(n)
+        results: Dict[str, List[dict]] = {}
+        missing = []
+        for topic in topics:
+            cached = self.cache.get(topic) if self.cache is not None else None
+            if cached is not None and len(cached) >= per_topic:
+                results[topic['topic']] = cached[:per_topic]
+            else:
+                missing.append(topic)
+        size = max(1, self.settings['batch_size'])
+        batches = [missing[i:i + size] for i in range(0, len(missing), size)]
+        if not batches:
+            return results
+        with ThreadPoolExecutor(max_workers=max(1, self.settings['workers'])) as pool:
+            futures = {pool.submit(self._run_batch, batch, per_topic): batch for batch in batches}
+            for future in as_completed(futures):
+                try:
+                    produced = future.result()
+                except Exception as exc:  # a failed batch leaves its topics empty; the rest continue
+                    print(f"Generation failed for {[t['topic'] for t in futures[future]]}: {exc}",
+                          file=sys.stderr)
+                    produced = {}
+                for topic in futures[future]:
+                    results[topic['topic']] = produced.get(topic['topic'], [])[:per_topic]
+        return results
+
+    def questions(self, topic: str, n: int, series: str = '', locale: str = '') -> List[dict]:
+        """Questions for a single topic (with the over-generated extras)."""
+        return self.generate([{'topic': topic, 'series': series, 'locale': locale}], n)[topic]
+
+
+def load_generation_settings(base: Path) -> dict:
+    return config_section(base, 'generation')
+
+
+def open_generator(base: Path, settings: Optional[dict] = None, use_cache: bool = True) -> QuestionGenerator:
+    settings = load_generation_settings(base) if settings is None else settings
+    source = generation_source(dict(DEFAULT_SETTINGS, **settings))
+    cache = GenerationCache(base / 'data' / 'generation_cache.db', source) if use_cache else None
+    return QuestionGenerator(settings, cache)
+
+
+def generate_for_approved(base: Path, generator: QuestionGenerator, out_dir: Path, n: int) -> int:
+    """Generate questions for every APPROVED_TOPIC queue row in batched requests.
+
+    Each row's questions go to ``out_dir/<id>.jsonl``, whose path is
+    recorded on the row as ``questions``. Returns the number of rows done.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    done = 0
+    with open_queue(base) as store:
+        rows = list(store.rows('APPROVED_TOPIC'))
+        generated = generator.generate(rows, n)
+        for row in rows:
+            questions = generated.get(row['topic'])
+            if not questions:
+                continue
+            path = out_dir / f"{row['id']}.jsonl"
+            write_questions(path, questions)
+            store.update(row['id'], questions=str(path))
+            done += 1
+    return done
+
 
 def main() -> None:
-    parser = argparse.ArgumentParser(description="Generate placeholder MCQs.")
-    parser.add_argument('--topic', required=True, help='Topic for the quiz')
-    parser.add_argument('--n', type=int, default=3, help='Number of questions to generate')
+    parser = argparse.ArgumentParser(description="Generate MCQs for a topic or all approved topics.")
+    parser.add_argument('--topic', help='Topic for the quiz')
+    parser.add_argument('--series', default='', help='Series of the topic (part of the cache key)')
+    parser.add_argument('--locale', default='', help='Locale of the topic (part of the cache key)')
+    parser.add_argument('--n', type=int, default=8,
+                        help='Number of questions needed (extras are added); matches the pipeline pool')
     parser.add_argument('--out', type=str, default='questions.jsonl', help='Output JSONL file')
+    parser.add_argument('--approved', action='store_true', help='Generate for all APPROVED_TOPIC queue rows')
+    parser.add_argument('--out-dir', default='tmp/questions', help='Output directory for --approved')
+    parser.add_argument('--backend', choices=sorted(GENERATOR_BACKENDS), help='Override generation.backend')
+    parser.add_argument('--no-cache', action='store_true', help='Ignore and do not fill the generation cache')
+    add_job_argument(parser)
+    add_profiler_argument(parser)
     args = parser.parse_args()
+    if not (args.topic or args.approved or args.job):
+        parser.error('--topic, --approved or --job is required')
+    if args.approved and args.job:
+        parser.error('--approved cannot be combined with --job')
 
-    questions = generate_placeholder_questions(args.topic, args.n)
-    out_path = Path(args.out)
-    with out_path.open('w') as f:
-        for q in questions:
-            f.write(json.dumps(q) + '\n')
-    print(f"Generated {len(questions)} placeholder questions for {args.topic} → {out_path}")
+    base = Path(__file__).resolve().parent.parent
+    settings = load_generation_settings(base)
+    if args.backend:
+        settings['backend'] = args.backend
+    journal = open_job(base, args.job) if args.job else None
+    if journal is not None:
+        args.topic = args.topic or journal.topic
+        args.series = args.series or journal.data.get('series', '')
+        args.locale = args.locale or journal.data.get('locale', '')
+        args.out = str(journal.file('questions.jsonl'))
+    params = {'topic': args.topic, 'series': args.series, 'locale': args.locale, 'n': args.n,
+              'settings': settings, 'prompt_version': PROMPT_VERSION}
+    with instrumented('gen_questions', args.profiler), \
+            job_step(journal, 'generate', outputs=[Path(args.out)], params=params) as step:
+        if step.skipped:
+            print(skip_message(journal, 'generate'))
+            return
+        with open_generator(base, settings, not args.no_cache) as generator, stage('generate') as s:
+            if args.approved:
+                s.items = generate_for_approved(base, generator, Path(args.out_dir), args.n)
+                print(f"Generated questions for {s.items} approved topics → {args.out_dir}")
+                return
+            questions = generator.questions(args.topic, args.n, args.series, args.locale)
+            n = s.items = write_questions(args.out, questions)
+    # Keep stdout clean for the next stage when streaming
+    print(f"Generated {n} questions for {args.topic} → {args.out}",
+          file=sys.stderr if args.out == '-' else sys.stdout)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,263 @@
+"""
+instrument.py
+-------------
+
+Lightweight stage timing shared by the pipeline scripts. A script wraps
+its ``main`` in ``instrumented(...)`` and marks interesting work with
+``stage(...)``:
+
+    with instrumented('dedupe', args.profiler):
+        with stage('dedupe.filter') as s:
+            ...
+            s.items = kept
+
+Every stage appends one JSON line to ``data/stage_metrics.jsonl`` with
+wall time, CPU time (this process and finished child processes such as
+ffmpeg), peak RSS so far and the item count, tagged with the script and a
+per-run id. Outside an ``instrumented`` block ``stage`` records nothing,
+so library callers pay almost nothing. CPU time is process-wide, which
+over-counts stages that run alongside others in threads.
+
+``--profiler cprofile`` (or ``pyinstrument``, when installed) on any
+instrumented script also profiles the whole run and writes the result to
+``tmp/profiles/``; scripts without a command line read ``QS_PROFILER``.
+Set ``QS_STAGE_LOG`` to log elsewhere, or to ``off`` to disable logging.
+
+Usage:
+
+    python instrument.py summary
+    python instrument.py summary --script render_native --runs 20
+
+The summary prints p50/p95 wall time, CPU time and peak RSS per stage
+across the logged runs.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+BASE = Path(__file__).resolve().parent.parent
+PROFILERS = ('cprofile', 'pyinstrument')
+
+_run: Optional[dict] = None
+_lock = threading.Lock()
+
+
+def log_path() -> Optional[Path]:
+    value = os.environ.get('QS_STAGE_LOG')
+    if value == 'off':
+        return None
+    return Path(value) if value else BASE / 'data' / 'stage_metrics.jsonl'
+
+
+def _cpu_seconds() -> tuple:
+    if resource is None:
+        return time.process_time(), 0.0
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time(), children.ru_utime + children.ru_stime
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _write(record: dict) -> None:
+    path = _run['log'] if _run else None
+    if path is None:
+        return
+    line = json.dumps(record, separators=(',', ':')) + '\n'
+    with _lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # One short append per record, so concurrent processes do not interleave
+        with path.open('a') as f:
+            f.write(line)
+
+
+class Stage:
+    """Handle yielded by ``stage``; set ``items`` or extra ``fields`` before it ends."""
+
+    __slots__ = ('name', 'items', 'fields')
+
+    def __init__(self, name: str, items: int) -> None:
+        self.name = name
+        self.items = items
+        self.fields: dict = {}
+
+
+@contextmanager
+def stage(name: str, items: int = 0, **fields) -> Iterator[Stage]:
+    """Time a block of work and log it as stage ``name``."""
+    handle = Stage(name, items)
+    handle.fields.update(fields)
+    if _run is None:
+        yield handle
+        return
+    wall = time.perf_counter()
+    cpu, child_cpu = _cpu_seconds()
+    ok = False
+    try:
+        yield handle
+        ok = True
+    finally:
+        cpu_end, child_cpu_end = _cpu_seconds()
+        record = {
+            'ts': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'run': _run['id'],
+            'script': _run['script'],
+            'stage': name,
+            'wall_s': round(time.perf_counter() - wall, 4),
+            'cpu_s': round(cpu_end - cpu + child_cpu_end - child_cpu, 4),
+            'peak_rss_mb': peak_rss_mb(),
+            'items': handle.items,
+            'ok': ok,
+        }
+        record.update(handle.fields)
+        _write(record)
+
+
+@contextmanager
+def _profiling(script: str, profiler: Optional[str]) -> Iterator[None]:
+    if not profiler:
+        yield
+        return
+    out_dir = BASE / 'tmp' / 'profiles'
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stem = out_dir / f"{script}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    if profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument is not installed; using cProfile", file=sys.stderr)
+        else:
+            prof = Profiler()
+            prof.start()
+            try:
+                yield
+            finally:
+                prof.stop()
+                stem.with_suffix('.html').write_text(prof.output_html())
+                print(prof.output_text(), file=sys.stderr)
+                print(f"Profile written to {stem.with_suffix('.html')}", file=sys.stderr)
+            return
+    import cProfile
+    import pstats
+
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        prof.dump_stats(stem.with_suffix('.prof'))
+        pstats.Stats(prof, stream=sys.stderr).sort_stats('cumulative').print_stats(25)
+        print(f"Profile written to {stem.with_suffix('.prof')}", file=sys.stderr)
+
+
+@contextmanager
+def instrumented(script: str, profiler: Optional[str] = None) -> Iterator[None]:
+    """Enable stage logging (and optional profiling) for one script run."""
+    global _run
+    _run = {'id': os.urandom(6).hex(), 'script': script, 'log': log_path()}
+    try:
+        with _profiling(script, profiler or os.environ.get('QS_PROFILER')):
+            with stage('total'):
+                yield
+    finally:
+        _run = None
+
+
+def add_profiler_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--profiler', choices=PROFILERS,
+                        help='Profile the run and write the result to tmp/profiles/')
+
+
+def read_log(path: Path) -> Iterator[dict]:
+    if not path.exists():
+        return
+    with path.open() as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(records: Iterator[dict], script: Optional[str] = None, runs: Optional[int] = None) -> List[dict]:
+    """p50/p95 per (script, stage), optionally over only the last ``runs`` runs."""
+    records = [r for r in records if script is None or r['script'] == script]
+    if runs:
+        recent = []
+        for r in reversed(records):
+            if r['run'] not in recent:
+                recent.append(r['run'])
+        keep = set(recent[:runs])
+        records = [r for r in records if r['run'] in keep]
+    groups = defaultdict(list)
+    for r in records:
+        groups[(r['script'], r['stage'])].append(r)
+    rows = []
+    for (script_name, stage_name), group in sorted(groups.items()):
+        walls = [r['wall_s'] for r in group]
+        cpus = [r['cpu_s'] for r in group]
+        rss = [r['peak_rss_mb'] for r in group if r.get('peak_rss_mb') is not None]
+        items = sum(r.get('items') or 0 for r in group)
+        rows.append({
+            'script': script_name, 'stage': stage_name, 'n': len(group),
+            'wall_p50': percentile(walls, 50), 'wall_p95': percentile(walls, 95),
+            'cpu_p50': percentile(cpus, 50), 'cpu_p95': percentile(cpus, 95),
+            'rss_p95': percentile(rss, 95) if rss else None,
+            'items_per_s': round(items / sum(walls), 1) if items and sum(walls) else None,
+        })
+    return rows
+
+
+def format_summary(rows: List[dict]) -> str:
+    header = f"{'script':<16} {'stage':<22} {'n':>5} {'wall p50':>9} {'wall p95':>9} " \
+             f"{'cpu p50':>8} {'cpu p95':>8} {'rss p95':>8} {'items/s':>9}"
+    lines = [header]
+    for r in rows:
+        lines.append(
+            f"{r['script']:<16} {r['stage']:<22} {r['n']:>5} {r['wall_p50']:>9.3f} {r['wall_p95']:>9.3f} "
+            f"{r['cpu_p50']:>8.3f} {r['cpu_p95']:>8.3f} {r['rss_p95'] or 0:>8.1f} {r['items_per_s'] or '':>9}"
+        )
+    return '\n'.join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Summarize logged stage timings.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_summary = sub.add_parser('summary', help='p50/p95 per stage across runs')
+    p_summary.add_argument('--log', help='Stage log (default: data/stage_metrics.jsonl)')
+    p_summary.add_argument('--script', help='Only this script')
+    p_summary.add_argument('--runs', type=int, help='Only the most recent N runs')
+    args = parser.parse_args()
+    path = Path(args.log) if args.log else (log_path() or BASE / 'data' / 'stage_metrics.jsonl')
+    rows = summarize(read_log(path), args.script, args.runs)
+    if not rows:
+        print(f"No stage timings in {path}.")
+        return
+    print(format_summary(rows))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+"""
+job_journal.py
+--------------
+
+Crash-safe journal for one production run ("job"). Each job has its own
+working directory, ``tmp/jobs/<job id>/``, holding the intermediate
+files of that run (``questions.jsonl``, ``verified.jsonl``,
+``deduped.jsonl``, ``video.mp4``, ``thumb.png``) and a ``journal.json``
+recording, per stage, its status, the SHA-256 of every input and output
+file, a digest of the parameters that shape its output and the artifact
+paths. The journal is rewritten atomically (temporary file, fsync,
+rename) on every change, so a crash leaves either the old or the new
+version on disk, never a torn one.
+
+A job is created when ``propose_topic.py`` gets a topic approved; its id
+is the publish-queue row id and ``tmp/jobs/current`` points at it. The
+stage scripts accept ``--job ID`` (or ``--job current``): they then read
+and write the job's directory and, through ``JobJournal.step``, skip
+their work when the stage already finished with the same inputs and
+parameters and its outputs are still intact. While the current job is
+unfinished, ``propose_topic.py`` resumes it instead of proposing a new
+topic, so rerunning the whole chain after a crash continues from the
+first incomplete stage.
+
+A job that cannot finish is retired instead of blocking production:
+``propose_topic.py`` retires the current job as FAILED once one stage
+has failed ``MAX_STAGE_ATTEMPTS`` times in a row, a rejected preview
+retires it as REJECTED, and ``abandon`` retires it by hand. Retiring
+moves the job's queue row to that terminal status, records the reason
+and clears ``tmp/jobs/current``, so the next run proposes a new topic.
+
+Usage:
+
+    python job_journal.py status
+    python job_journal.py status --job 42
+    python job_journal.py list
+    python job_journal.py abandon --reason "explanations too long"
+
+Data files:
+    tmp/jobs/<job id>/journal.json
+    tmp/jobs/current
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from queue_store import open_queue
+
+# Stages of a production job, in pipeline order
+JOB_STAGES = ('generate', 'preview', 'factcheck', 'dedupe', 'render', 'thumbnail')
+
+# Consecutive failures of one stage after which the job is retired
+MAX_STAGE_ATTEMPTS = 3
+
+RUNNING, DONE, FAILED = 'running', 'done', 'failed'
+
+
+def jobs_dir(base: Path) -> Path:
+    return base / 'tmp' / 'jobs'
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def file_digest(path: Path) -> Optional[str]:
+    """SHA-256 of a file, or None if it does not exist."""
+    path = Path(path)
+    if not path.is_file():
+        return None
+    h = hashlib.sha256()
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def params_digest(params: dict) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    """Replace ``path`` with ``text`` so readers see the old or the new file, never a partial one."""
+    tmp_path = path.with_name(path.name + '.tmp')
+    with tmp_path.open('w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    # Persist the rename itself
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class Step:
+    """Handle yielded by ``JobJournal.step``; ``skipped`` is True when the stage is already done."""
+
+    __slots__ = ('name', 'skipped')
+
+    def __init__(self, name: str, skipped: bool) -> None:
+        self.name = name
+        self.skipped = skipped
+
+
+class JobJournal:
+    """Per-stage status, file hashes and artifacts of one job, persisted atomically."""
+
+    def __init__(self, job_dir: Path) -> None:
+        self.dir = Path(job_dir)
+        self.path = self.dir / 'journal.json'
+        with self.path.open() as f:
+            self.data = json.load(f)
+
+    @property
+    def job_id(self) -> str:
+        return self.data['job']
+
+    @property
+    def topic(self) -> str:
+        return self.data['topic']
+
+    def file(self, name: str) -> Path:
+        """Path of an artifact inside the job's working directory."""
+        return self.dir / name
+
+    def save(self) -> None:
+        self.data['updated_at'] = now()
+        atomic_write_text(self.path, json.dumps(self.data, indent=2) + '\n')
+
+    def stage(self, name: str) -> dict:
+        return self.data['stages'].get(name, {})
+
+    def is_done(self, name: str, inputs: Dict[str, Optional[str]], params_hash: str) -> bool:
+        """True if the stage finished with these inputs and its outputs are unchanged."""
+        entry = self.stage(name)
+        if entry.get('status') != DONE or entry.get('inputs') != inputs or entry.get('params') != params_hash:
+            return False
+        return all(file_digest(Path(p)) == digest for p, digest in entry.get('outputs', {}).items())
+
+    def first_incomplete(self, stages: Iterable[str] = JOB_STAGES) -> Optional[str]:
+        return next((s for s in stages if self.stage(s).get('status') != DONE), None)
+
+    def finished(self) -> bool:
+        return self.first_incomplete() is None
+
+    @property
+    def retired(self) -> Optional[dict]:
+        """``{'status', 'reason', 'at'}`` once the job was given up, else None."""
+        return self.data.get('retired')
+
+    def closed(self) -> bool:
+        """True when no stage of this job will run again."""
+        return self.retired is not None or self.finished()
+
+    def exhausted(self) -> Optional[str]:
+        """The first stage that failed ``MAX_STAGE_ATTEMPTS`` times in a row, if any."""
+        return next((s for s in JOB_STAGES if self.stage(s).get('status') == FAILED
+                     and self.stage(s).get('attempts', 1) >= MAX_STAGE_ATTEMPTS), None)
+
+    @contextmanager
+    def step(self, name: str, inputs: Iterable[Path] = (), outputs: Iterable[Path] = (),
+             params: Optional[dict] = None) -> Iterator[Step]:
+        """Run a stage under the journal.
+
+        Yields a ``Step`` whose ``skipped`` flag is set when the stage can be
+        skipped. Otherwise the stage is marked running, and then done with
+        the hashes of its outputs, or failed if the block raises.
+        """
+        if self.retired is not None:
+            raise SystemExit(f"Job {self.job_id} was retired ({self.retired['status']}: {self.retired['reason']})")
+        input_hashes = {str(p): file_digest(p) for p in inputs}
+        params_hash = params_digest(params or {})
+        if self.is_done(name, input_hashes, params_hash):
+            yield Step(name, True)
+            return
+        previous = self.stage(name)
+        # Failures count until the stage succeeds; a run killed while
+        # running (status still ``running``) counts as a failure too
+        attempts = previous.get('attempts', 0) + 1 if previous.get('status') in (FAILED, RUNNING) else 1
+        entry = {'status': RUNNING, 'started_at': now(), 'inputs': input_hashes, 'params': params_hash,
+                 'attempts': attempts}
+        self.data['stages'][name] = entry
+        self.save()
+        try:
+            yield Step(name, False)
+        except BaseException as exc:
+            entry.update(status=FAILED, finished_at=now(), error=f'{type(exc).__name__}: {exc}')
+            self.save()
+            raise
+        entry.update(status=DONE, finished_at=now(),
+                     outputs={str(p): file_digest(p) for p in outputs})
+        self.save()
+
+
+@contextmanager
+def job_step(journal: Optional[JobJournal], name: str, inputs: Iterable[Path] = (),
+             outputs: Iterable[Path] = (), params: Optional[dict] = None) -> Iterator[Step]:
+    """``journal.step`` for scripts that may also run without a job."""
+    if journal is None:
+        yield Step(name, False)
+        return
+    with journal.step(name, inputs, outputs, params) as step:
+        yield step
+
+
+def create_job(base: Path, row: dict) -> JobJournal:
+    """Start the journal of a job for an approved queue row and make it current."""
+    job_id = str(row['id'])
+    job_dir = jobs_dir(base) / job_id
+    job_dir.mkdir(parents=True, exist_ok=True)
+    path = job_dir / 'journal.json'
+    if not path.exists():
+        atomic_write_text(path, json.dumps({
+            'job': job_id,
+            'row_id': row['id'],
+            'topic': row['topic'],
+            'series': row.get('series', ''),
+            'locale': row.get('locale', ''),
+            'created_at': now(),
+            'updated_at': now(),
+            'stages': {},
+        }, indent=2) + '\n')
+    atomic_write_text(jobs_dir(base) / 'current', job_id + '\n')
+    return JobJournal(job_dir)
+
+
+def current_job(base: Path) -> Optional[JobJournal]:
+    pointer = jobs_dir(base) / 'current'
+    if not pointer.exists():
+        return None
+    job_dir = jobs_dir(base) / pointer.read_text().strip()
+    return JobJournal(job_dir) if (job_dir / 'journal.json').exists() else None
+
+
+def open_job(base: Path, job: str) -> JobJournal:
+    """Open a job by id, or the current one for ``'current'``."""
+    if job == 'current':
+        journal = current_job(base)
+        if journal is None:
+            raise SystemExit('No current job; approve a topic with propose_topic.py first')
+        return journal
+    job_dir = jobs_dir(base) / job
+    if not (job_dir / 'journal.json').exists():
+        raise SystemExit(f'Unknown job {job!r} (no {job_dir / "journal.json"})')
+    return JobJournal(job_dir)
+
+
+def retire_job(base: Path, journal: JobJournal, status: str, reason: str) -> None:
+    """Give up on a job: record why, move its queue row to ``status`` and clear ``current``."""
+    journal.data['retired'] = {'status': status, 'reason': reason, 'at': now()}
+    journal.save()
+    with open_queue(base) as store:
+        store.retire(journal.data['row_id'], status, reason)
+    pointer = jobs_dir(base) / 'current'
+    if pointer.exists() and pointer.read_text().strip() == journal.job_id:
+        pointer.unlink()
+
+
+def record_on_queue(base: Path, journal: JobJournal, **fields) -> None:
+    """Store artifact paths on the job's publish-queue row."""
+    with open_queue(base) as store:
+        store.update(journal.data['row_id'], **fields)
+
+
+def add_job_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--job', help="Run as a stage of this job (an id or 'current'): use its working "
+                                      "directory and skip the stage if it already finished unchanged")
+
+
+def skip_message(journal: JobJournal, name: str) -> str:
+    return f"Job {journal.job_id}: {name} already done with unchanged inputs; skipping"
+
+
+def format_status(journal: JobJournal) -> List[str]:
+    lines = [f"Job {journal.job_id} – {journal.topic} ({journal.dir})"]
+    for name in JOB_STAGES:
+        entry = journal.stage(name)
+        status = entry.get('status', 'pending')
+        when = entry.get('finished_at') or entry.get('started_at') or ''
+        outputs = ', '.join(Path(p).name for p in entry.get('outputs', {}))
+        error = f"  {entry['error']}" if entry.get('error') else ''
+        lines.append(f"  {name:<10} {status:<8} {when:<26} {outputs}{error}")
+    if journal.retired is not None:
+        lines.append(f"  retired {journal.retired['status']}: {journal.retired['reason']}")
+        return lines
+    nxt = journal.first_incomplete()
+    lines.append(f"  resume at: {nxt}" if nxt else '  finished')
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect production job journals.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_status = sub.add_parser('status', help='Show the stages of one job')
+    p_status.add_argument('--job', default='current', help="Job id (default: current)")
+    sub.add_parser('list', help='List all jobs with their next stage')
+    p_abandon = sub.add_parser('abandon', help='Retire a job as FAILED so production moves on')
+    p_abandon.add_argument('--job', default='current', help="Job id (default: current)")
+    p_abandon.add_argument('--reason', default='abandoned by hand', help='Reason stored on the queue row')
+    args = parser.parse_args()
+
+    base = Path(__file__).resolve().parent.parent
+    if args.command == 'status':
+        print('\n'.join(format_status(open_job(base, args.job))))
+        return
+    if args.command == 'abandon':
+        journal = open_job(base, args.job)
+        if journal.closed():
+            raise SystemExit(f"Job {journal.job_id} is already {'retired' if journal.retired else 'finished'}")
+        retire_job(base, journal, 'FAILED', args.reason)
+        print(f"Retired job {journal.job_id} ({journal.topic}) as FAILED: {args.reason}")
+        return
+    root = jobs_dir(base)
+    paths = sorted(root.glob('*/journal.json'), key=lambda p: p.stat().st_mtime) if root.exists() else []
+    for path in paths:
+        journal = JobJournal(path.parent)
+        state = journal.retired['status'] if journal.retired else journal.first_incomplete() or 'finished'
+        print(f"{journal.job_id:>6}  {state:<10} {journal.topic}")
+    if not paths:
+        print(f"No jobs in {root}.")
+
+if __name__ == '__main__':
+    main()
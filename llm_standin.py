@@ -0,0 +1,120 @@
+"""
+llm_standin.py
+--------------
+
+Local HTTP stand-in for an LLM completion endpoint, used to exercise the
+``http`` backend of ``gen_questions.py`` offline. It accepts
+``{"model", "prompt", "max_tokens"}``, reads the ``REQUEST:`` line that
+``gen_questions.build_prompt`` puts into every prompt and answers with
+deterministic, varied questions for each topic in the same JSON shape a
+real model is asked for, plus a ``usage.total_tokens`` estimate.
+
+``--delay`` makes every completion slow and ``--fail-rate`` answers a
+share of requests with 503, to check batching, concurrency, the token
+budget and retries.
+
+Usage:
+
+    python llm_standin.py --port 8766
+    python llm_standin.py --port 8766 --delay 2 --fail-rate 0.1
+
+Then in ``config/ops.yml``:
+
+    generation:
+      backend: http
+      url: "http://127.0.0.1:8766/v1/completions"
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUBJECTS = ['origin', 'symbol', 'record', 'first appearance', 'largest example', 'nickname',
+            'founding year', 'famous figure', 'common color', 'official language', 'landmark', 'tradition']
+
+
+def fake_questions(topic: str, n: int) -> list:
+    rng = random.Random(hashlib.sha1(topic.encode()).hexdigest())
+    subjects = rng.sample(SUBJECTS, k=min(n, len(SUBJECTS)))
+    questions = []
+    for i in range(n):
+        subject = subjects[i % len(subjects)]
+        correct = rng.randrange(4)
+        questions.append({
+            'question': f'In {topic}, what is the {subject} most often cited (set {i // len(subjects) + 1})?',
+            'options': [f'{subject.title()} {chr(65 + j)}{rng.randint(1, 99)}' for j in range(4)],
+            'correct': correct,
+            'hint': f'Think about the {subject}.',
+            'explanation': f'The {subject} of {topic} is option {chr(65 + correct)}.',
+        })
+    return questions
+
+
+def complete(prompt: str) -> dict:
+    line = next((l for l in prompt.splitlines() if l.startswith('REQUEST: ')), None)
+    if line is None:
+        return {'text': '{"topics": {}}', 'usage': {'total_tokens': len(prompt) // 4}}
+    request = json.loads(line[len('REQUEST: '):])
+    answer = {'topics': {t['topic']: fake_questions(t['topic'], request['per_topic']) for t in request['topics']}}
+    text = json.dumps(answer)
+    return {'text': text, 'usage': {'total_tokens': (len(prompt) + len(text)) // 4}}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if random.random() < self.server.fail_rate:
+            self._reply(503, {'error': 'injected failure'})
+            return
+        time.sleep(self.server.delay)
+        try:
+            prompt = json.loads(body)['prompt']
+        except (ValueError, KeyError):
+            self._reply(400, {'error': 'expected {"prompt": ...}'})
+            return
+        self._reply(200, complete(prompt))
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(port: int, delay: float = 0.0, fail_rate: float = 0.0, verbose: bool = False) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', port), StandInHandler)
+    server.delay = delay
+    server.fail_rate = fail_rate
+    server.verbose = verbose
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for an LLM completion endpoint.")
+    parser.add_argument('--port', type=int, default=8766, help='Port to listen on (127.0.0.1)')
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait before each completion')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Share of requests answered with 503')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args()
+    server = serve(args.port, args.delay, args.fail_rate, args.verbose)
+    print(f"LLM stand-in listening on http://127.0.0.1:{args.port}/v1/completions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
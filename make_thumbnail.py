@@ -6,9 +6,22 @@ Generate a simple thumbnail image for a quiz video using Pillow. The
 thumbnail includes the topic name and a hook line. For a production
 system, this script would use more sophisticated layouts and images.
 
+Thumbnails are drawn by a ``ThumbnailRenderer``, which loads the brand
+config, fonts and the background canvas once and reuses them for every
+thumbnail it draws. Long topics and hooks are wrapped to the canvas width
+and shrunk until they fit.
+
 Usage:
 
     python make_thumbnail.py --topic "World Capitals" --hook "Can you guess them all?" --out out/thumb.png
+    python make_thumbnail.py --batch --out-dir out/thumbs --format webp --workers 4
+    python make_thumbnail.py --job current --hook "Can you guess them all?"
+
+``--batch`` draws thumbnails for every READY and VERIFIED row of the
+publish queue in one process pool and records each path on its row.
+``--job`` draws the job's topic into its ``thumb.png`` (unless it is
+already there with the same topic and hook) and records the path on the
+job's queue row (see ``job_journal.py``).
 
 Dependencies:
     pip install pillow
@@ -18,49 +31,179 @@ Configuration files:
 """
 
 import argparse
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
+from typing import List, Optional, Tuple
 
 from PIL import Image, ImageDraw, ImageFont
-import yaml
 
+from config_loader import load_config
+from instrument import add_profiler_argument, instrumented, stage
+from job_journal import add_job_argument, job_step, open_job, record_on_queue, skip_message
+from queue_store import open_queue
 
-def make_thumbnail(topic: str, hook: str, out_path: Path, config: dict) -> None:
-    width, height = 1080, 1920
-    bg_color = config['colors']['background']
-    text_color = config['colors']['text_primary']
-    # Create blank image
-    img = Image.new('RGB', (width, height), color=bg_color)
-    draw = ImageDraw.Draw(img)
-    # Load a basic font; Pillow's default is limited, so fallback to DejaVuSans
+WIDTH, HEIGHT = 1080, 1920
+DEFAULT_HOOK = "Can you guess them all?"
+
+
+@lru_cache(maxsize=32)
+def load_font(name: str, size: int) -> ImageFont.ImageFont:
+    """Load a TrueType font once per (name, size), falling back to Pillow's default."""
     try:
-        font_topic = ImageFont.truetype('DejaVuSans-Bold.ttf', 80)
-        font_hook = ImageFont.truetype('DejaVuSans.ttf', 60)
+        return ImageFont.truetype(name, size)
     except IOError:
-        font_topic = ImageFont.load_default()
-        font_hook = ImageFont.load_default()
-    # Center topic text
-    topic_w, topic_h = draw.textsize(topic, font=font_topic)
-    hook_w, hook_h = draw.textsize(hook, font=font_hook)
-    draw.text(((width - topic_w) / 2, height / 3), topic, font=font_topic, fill=text_color)
-    draw.text(((width - hook_w) / 2, height / 3 + topic_h + 40), hook, font=font_hook, fill=text_color)
-    img.save(out_path)
+        try:
+            return ImageFont.load_default(size)
+        except TypeError:  # Pillow < 10.1 has no sized default font
+            return ImageFont.load_default()
+
+
+class ThumbnailRenderer:
+    """Draws branded thumbnails, reusing fonts and the background canvas."""
+
+    topic_font = 'DejaVuSans-Bold.ttf'
+    hook_font = 'DejaVuSans.ttf'
+
+    def __init__(self, config: dict, size: Tuple[int, int] = (WIDTH, HEIGHT)) -> None:
+        self.width, self.height = size
+        self.text_color = config['colors']['text_primary']
+        self.background = Image.new('RGB', size, color=config['colors']['background'])
+        self.max_text_width = int(self.width * 0.9)
+        # Scratch surface used only for measuring text
+        self._measure = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+
+    def text_size(self, text: str, font: ImageFont.ImageFont) -> Tuple[int, int]:
+        left, top, right, bottom = self._measure.textbbox((0, 0), text, font=font)
+        return right - left, bottom - top
+
+    def wrap(self, text: str, font: ImageFont.ImageFont) -> List[str]:
+        """Greedily break text into lines no wider than the text area."""
+        lines: List[str] = []
+        for word in text.split():
+            candidate = f'{lines[-1]} {word}' if lines else word
+            if lines and self.text_size(candidate, font)[0] <= self.max_text_width:
+                lines[-1] = candidate
+            else:
+                lines.append(word)
+        return lines or ['']
+
+    def fit(self, text: str, font_name: str, size: int, max_lines: int,
+            min_size: int = 24) -> Tuple[ImageFont.ImageFont, List[str]]:
+        """Shrink the font until the wrapped text fits in ``max_lines``."""
+        while True:
+            font = load_font(font_name, size)
+            lines = self.wrap(text, font)
+            widest = max(self.text_size(line, font)[0] for line in lines)
+            if (len(lines) <= max_lines and widest <= self.max_text_width) or size <= min_size:
+                return font, lines
+            size = max(min_size, int(size * 0.9))
+
+    def draw_lines(self, draw: ImageDraw.ImageDraw, lines: List[str],
+                   font: ImageFont.ImageFont, top: float, spacing: int = 16) -> float:
+        """Draw centred lines starting at ``top``; return the y below the block."""
+        y = top
+        for line in lines:
+            w, h = self.text_size(line, font)
+            draw.text(((self.width - w) / 2, y), line, font=font, fill=self.text_color)
+            y += h + spacing
+        return y
+
+    def render(self, topic: str, hook: str) -> Image.Image:
+        with stage('thumbnail.draw', items=1):
+            img = self.background.copy()
+            draw = ImageDraw.Draw(img)
+            topic_font, topic_lines = self.fit(topic, self.topic_font, 80, max_lines=3)
+            hook_font, hook_lines = self.fit(hook, self.hook_font, 60, max_lines=2)
+            y = self.draw_lines(draw, topic_lines, topic_font, self.height / 3)
+            self.draw_lines(draw, hook_lines, hook_font, y + 40)
+        return img
+
+    def save(self, topic: str, hook: str, out_path: Path) -> None:
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        img = self.render(topic, hook)
+        with stage('thumbnail.save', items=1, format=out_path.suffix.lstrip('.')):
+            img.save(out_path)
+
+
+def make_thumbnail(topic: str, hook: str, out_path: Path, config: dict) -> None:
+    ThumbnailRenderer(config).save(topic, hook, out_path)
 
 
 def load_brand_config(base: Path) -> dict:
-    with (base / 'config' / 'brand.yml').open() as f:
-        return yaml.safe_load(f)
+    return load_config(base, 'brand')
+
+
+# Renderer of a batch worker process, set by _init_batch_worker
+_worker_renderer: Optional[ThumbnailRenderer] = None
+
+
+def _init_batch_worker(config: dict) -> None:
+    global _worker_renderer
+    _worker_renderer = ThumbnailRenderer(config)
+
+
+def _render_job(job: Tuple[str, str, str]) -> str:
+    topic, hook, out_path = job
+    _worker_renderer.save(topic, hook, Path(out_path))
+    return out_path
+
+
+def thumbnail_filename(row: dict, fmt: str) -> str:
+    slug = re.sub(r'[^a-z0-9]+', '-', row['topic'].lower()).strip('-')
+    return f"{row['id']}-{slug}.{fmt}"
+
+
+def make_batch(base: Path, out_dir: Path, config: dict, fmt: str = 'png', workers: int = 1) -> int:
+    """Draw thumbnails for all READY/VERIFIED queue rows. Returns the count."""
+    with open_queue(base) as store:
+        rows = list(store.rows('READY')) + list(store.rows('VERIFIED'))
+        jobs = [(row['topic'], row.get('hook') or DEFAULT_HOOK,
+                 str(out_dir / thumbnail_filename(row, fmt))) for row in rows]
+        with ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_batch_worker,
+                                 initargs=(config,)) as pool:
+            paths = list(pool.map(_render_job, jobs))
+        for row, path in zip(rows, paths):
+            store.update(row['id'], thumbnail=path)
+    return len(paths)
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Generate a thumbnail for a quiz video.")
-    parser.add_argument('--topic', required=True, help='Quiz topic')
-    parser.add_argument('--hook', required=True, help='Hook line to entice viewers')
-    parser.add_argument('--out', required=True, help='Output PNG file')
+    parser.add_argument('--topic', help='Quiz topic')
+    parser.add_argument('--hook', help='Hook line to entice viewers')
+    parser.add_argument('--out', help='Output PNG file')
+    parser.add_argument('--batch', action='store_true', help='Make thumbnails for all READY/VERIFIED queue rows')
+    parser.add_argument('--out-dir', default='tmp/thumbs', help='Output directory for --batch')
+    parser.add_argument('--format', choices=['png', 'webp'], default='png', help='Image format for --batch')
+    parser.add_argument('--workers', type=int, default=1, help='Processes used by --batch')
+    add_job_argument(parser)
+    add_profiler_argument(parser)
     args = parser.parse_args()
-    base = Path(__file__).resolve().parent.parent
-    config = load_brand_config(base)
-    make_thumbnail(args.topic, args.hook, Path(args.out), config)
-    print(f"Thumbnail saved to {args.out}")
+    with instrumented('make_thumbnail', args.profiler):
+        base = Path(__file__).resolve().parent.parent
+        config = load_brand_config(base)
+        if args.batch:
+            n = make_batch(base, Path(args.out_dir), config, args.format, args.workers)
+            print(f"Saved {n} thumbnails to {args.out_dir}")
+            return
+        journal = open_job(base, args.job) if args.job else None
+        if journal is not None:
+            args.topic = args.topic or journal.topic
+            args.hook = args.hook or DEFAULT_HOOK
+            args.out = str(journal.file('thumb.png'))
+        if not (args.topic and args.hook and args.out):
+            parser.error('--topic, --hook and --out are required unless --batch or --job is given')
+        params = {'topic': args.topic, 'hook': args.hook, 'colors': config['colors']}
+        with job_step(journal, 'thumbnail', outputs=[Path(args.out)], params=params) as step:
+            if step.skipped:
+                print(skip_message(journal, 'thumbnail'))
+                return
+            make_thumbnail(args.topic, args.hook, Path(args.out), config)
+            if journal is not None:
+                record_on_queue(base, journal, thumbnail=str(Path(args.out).resolve()))
+        print(f"Thumbnail saved to {args.out}")
 
 if __name__ == '__main__':
     main()
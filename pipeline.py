@@ -0,0 +1,120 @@
+"""
+pipeline.py
+-----------
+
+Run the production stages for one topic inside a single Python process:
+question generation → fact-check → de-duplication → render → thumbnail.
+Each stage hands its questions to the next as Python objects, and the
+brand and ops config are loaded once, instead of ten separate
+``python3 scripts/...`` invocations re-importing modules and passing data
+through ``tmp/*.jsonl`` files.
+
+The individual scripts keep their own CLIs; this module simply calls the
+same stage functions. The generator returns a few more candidate
+questions than ``--n``; fact-check and de-duplication are chained as
+generators over them and stop as soon as ``--n`` questions survive.
+Those form the pool the renderer packs into the video's duration limits,
+so fewer than ``--n`` may end up in the video.
+Intermediate JSONL files (``questions.jsonl``, ``verified.jsonl``,
+``deduped.jsonl``) are written only with ``--keep-intermediate``.
+
+Usage:
+
+    python pipeline.py --topic "World Capitals" --out-dir tmp/world-capitals
+    python pipeline.py --topic "World Capitals" --out-dir tmp/world-capitals --n 8 --keep-intermediate
+
+Configuration files:
+    config/brand.yml
+    config/ops.yml
+"""
+
+import argparse
+from itertools import islice
+from pathlib import Path
+from typing import Optional
+
+from config_loader import load_config
+from dedupe import DEFAULT_THRESHOLD, iter_deduped
+from factcheck import iter_factchecked, open_fact_checker
+from gen_questions import QuestionGenerator, open_generator
+from instrument import add_profiler_argument, instrumented, stage
+from make_thumbnail import DEFAULT_HOOK, ThumbnailRenderer
+from question_stream import tap
+from render_cache import load_render_cache
+from render_native import format_report, load_brand_config, render_questions
+
+
+def load_ops_config(base: Path) -> dict:
+    with stage('config.load'):
+        return load_config(base, 'ops')
+
+
+def run_pipeline(topic: str, out_dir: Path, base: Path, brand: dict, ops: dict,
+                 n: int = 3, hook: str = DEFAULT_HOOK, workers: int = 1,
+                 keep_intermediate: bool = False,
+                 thumbnails: Optional[ThumbnailRenderer] = None,
+                 generator: Optional[QuestionGenerator] = None,
+                 series: str = '', locale: str = '') -> dict:
+    """Produce the video and thumbnail for a topic. Returns the artifact paths."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    bank_path = base / 'data' / 'bank'
+    threshold = ops.get('dedupe', {}).get('similarity_threshold', DEFAULT_THRESHOLD)
+
+    if generator is None:
+        with open_generator(base) as owned:
+            candidates = owned.questions(topic, n, series, locale)
+    else:
+        candidates = generator.questions(topic, n, series, locale)
+
+    with stage('pipeline.questions') as s, open_fact_checker(base) as checker:
+        stream = iter(candidates)
+        if keep_intermediate:
+            stream = tap(stream, out_dir / 'questions.jsonl')
+        stream = iter_factchecked(stream, checker)
+        if keep_intermediate:
+            stream = tap(stream, out_dir / 'verified.jsonl')
+        # Extra candidates replace rejected ones; stop once n have survived
+        stream = islice(iter_deduped(stream, bank_path, threshold), n)
+        if keep_intermediate:
+            stream = tap(stream, out_dir / 'deduped.jsonl')
+        deduped = list(stream)
+        s.items = len(deduped)
+    if not deduped:
+        raise ValueError(f"No questions left for {topic!r} after de-duplication")
+
+    video_path = out_dir / 'video.mp4'
+    report = render_questions(deduped, video_path, brand, workers=workers, cache=load_render_cache(base))
+    thumb_path = out_dir / 'thumb.png'
+    (thumbnails or ThumbnailRenderer(brand)).save(topic, hook, thumb_path)
+    return {
+        'topic': topic,
+        'questions': report['questions'],
+        'video': str(video_path),
+        'thumbnail': str(thumb_path),
+        'render': report,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run generation through thumbnail in one process.")
+    parser.add_argument('--topic', required=True, help='Topic for the quiz')
+    parser.add_argument('--out-dir', required=True, help='Directory for the video, thumbnail and any intermediates')
+    parser.add_argument('--n', type=int, default=8, help='Size of the verified question pool to render from')
+    parser.add_argument('--hook', default=DEFAULT_HOOK, help='Hook line for the thumbnail')
+    parser.add_argument('--workers', type=int, default=1, help='Processes used to render segments')
+    parser.add_argument('--keep-intermediate', action='store_true', help='Also write the per-stage JSONL files')
+    add_profiler_argument(parser)
+    args = parser.parse_args()
+    with instrumented('pipeline', args.profiler):
+        base = Path(__file__).resolve().parent.parent
+        result = run_pipeline(
+            args.topic, Path(args.out_dir), base,
+            brand=load_brand_config(base), ops=load_ops_config(base),
+            n=args.n, hook=args.hook, workers=args.workers,
+            keep_intermediate=args.keep_intermediate,
+        )
+        print(format_report(Path(result['video']), result['render']))
+        print(f"Produced {result['video']} and {result['thumbnail']} for {args.topic}")
+
+if __name__ == '__main__':
+    main()
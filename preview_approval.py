@@ -3,42 +3,121 @@ preview_approval.py
 -------------------
 
 This script sends a preview of generated questions to the user for
-approval. It bundles sample frames (placeholder paths), the full list
-of questions and answers, and the estimated runtime. The user can
-either approve to proceed to rendering or reject to choose a different
-topic. This simplified version reads questions from a JSONL file and
-sends a static message via Telegram.
+approval. It bundles sample frames, the full list of questions and
+answers, and the estimated runtime. The user can either approve to
+proceed to rendering or reject to choose a different topic. A rejection
+exits with an error so the following stages do not run; under
+``--job`` it also retires the job as REJECTED (see ``job_journal.py``),
+so the next ``propose_topic.py`` run proposes a new topic. This
+simplified version reads questions from a JSONL file and sends a static
+message via Telegram.
+
+The questions are laid out once with the renderer's own slide plan.
+Its length is the runtime estimate, so it is the length of the video
+that will be rendered from these questions, and sample frames are only
+made for the question slides in it: questions the plan leaves out of the
+video are not rasterized. Each sample is the first frame of the slide,
+drawn with the same layout code as ``render_native.py`` and saved as a
+small JPEG next to a scaled-down thumbnail. No video is encoded, so the
+preview takes well under a second per topic.
 
 Usage:
 
     python preview_approval.py --questions questions.jsonl
+    python preview_approval.py --questions questions.jsonl --topic "World Capitals" --frames-dir tmp/preview
+    python preview_approval.py --job current
+
+Configuration files:
+    config/brand.yml
 """
 
 import argparse
-import json
 from pathlib import Path
+from typing import List, Optional
+
+from PIL import Image
+
+from instrument import add_profiler_argument, instrumented, stage
+from job_journal import add_job_argument, job_step, open_job, retire_job, skip_message
+from make_thumbnail import DEFAULT_HOOK, ThumbnailRenderer
+from question_stream import read_questions
+from render_native import load_brand_config, plan_segments, rasterize_segment
+
+PREVIEW_WIDTH = 270
+
+def estimate_runtime(segments: List[dict]) -> float:
+    """Runtime in seconds of the video planned as ``segments``."""
+    return sum(s['duration'] for s in segments)
+
+def save_preview(image: Image.Image, path: Path, width: int) -> Path:
+    image.thumbnail((width, width * 16 // 9))
+    image.save(path, 'JPEG', quality=80)
+    return path
+
+def preview_frames(segments: List[dict], config: dict, out_dir: Path,
+                   topic: Optional[str] = None, hook: str = DEFAULT_HOOK,
+                   width: int = PREVIEW_WIDTH) -> List[Path]:
+    """Write a small JPEG of each planned question slide (and the thumbnail if a topic is given)."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    slides = [s for s in segments if s['kind'] == 'question']
+    frames = []
+    with stage('preview.frames', items=len(slides)):
+        if topic:
+            thumb = ThumbnailRenderer(config).render(topic, hook)
+            frames.append(save_preview(thumb, out_dir / 'thumb.jpg', width))
+        for i, segment in enumerate(slides, start=1):
+            frame = rasterize_segment(segment, config)
+            frames.append(save_preview(Image.fromarray(frame), out_dir / f'q{i:02d}.jpg', width))
+    return frames
 
-def send_preview(chat_id: str, questions: list, estimated_runtime: int) -> str:
+def send_preview(chat_id: str, questions: list, estimated_runtime: float,
+                 frames: Optional[List[Path]] = None) -> str:
     """Send a preview to Telegram and return the user's response."""
-    print(f"[TELEGRAM] Previewing {len(questions)} questions (runtime ≈ {estimated_runtime}s). Options: Proceed/Reject")
+    print(f"[TELEGRAM] Previewing {len(questions)} questions (runtime ≈ {estimated_runtime:.0f}s, "
+          f"{len(frames or [])} sample frames). Options: Proceed/Reject")
     # Always approve for this placeholder
     return 'Proceed'
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Send a preview for approval.")
-    parser.add_argument('--questions', required=True, help='Path to the questions JSONL file')
+    parser.add_argument('--questions', help='Path to the questions JSONL file')
     parser.add_argument('--chat_id', default='REPLACE_WITH_CHAT_ID', help='Telegram chat ID')
+    parser.add_argument('--topic', help='Topic, used to include a thumbnail preview')
+    parser.add_argument('--hook', default=DEFAULT_HOOK, help='Hook line for the thumbnail preview')
+    parser.add_argument('--frames-dir', default='tmp/preview', help='Directory for the sample frame JPEGs')
+    parser.add_argument('--no-frames', action='store_true', help='Skip sample frames')
+    add_job_argument(parser)
+    add_profiler_argument(parser)
     args = parser.parse_args()
+    if not (args.questions or args.job):
+        parser.error('--questions or --job is required')
 
-    # Load questions
-    questions = []
-    with Path(args.questions).open() as f:
-        for line in f:
-            questions.append(json.loads(line))
-    # Estimate runtime: 7s per question + 2s buffer
-    estimated_runtime = len(questions) * 7 + 2
-    response = send_preview(args.chat_id, questions, estimated_runtime)
-    print(f"User response: {response}")
+    base = Path(__file__).resolve().parent.parent
+    journal = open_job(base, args.job) if args.job else None
+    if journal is not None:
+        args.questions = str(journal.file('questions.jsonl'))
+        args.frames_dir = str(journal.file('preview'))
+        args.topic = args.topic or journal.topic
+    with instrumented('preview_approval', args.profiler), \
+            job_step(journal, 'preview', inputs=[Path(args.questions)]) as step:
+        if step.skipped:
+            print(skip_message(journal, 'preview'))
+            return
+        config = load_brand_config(base)
+        # Load questions
+        questions = list(read_questions(args.questions))
+        segments = plan_segments(questions, config)
+        estimated_runtime = estimate_runtime(segments)
+        frames = None
+        if not args.no_frames:
+            frames = preview_frames(segments, config, Path(args.frames_dir), args.topic, args.hook)
+        response = send_preview(args.chat_id, questions, estimated_runtime, frames)
+        print(f"User response: {response}")
+        if response != 'Proceed':
+            # Raising marks the stage failed, so a rerun asks again rather than rendering
+            if journal is not None:
+                retire_job(base, journal, 'REJECTED', 'preview rejected')
+            raise SystemExit(f"Preview rejected: {response}")
 
 if __name__ == '__main__':
     main()
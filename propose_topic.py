@@ -3,10 +3,19 @@ propose_topic.py
 -----------------
 
 This script selects the next topic from the publish queue and requests
-approval from the user via Telegram. It reads from ``data/publish_queue.csv``
-and updates the status of the selected row to ``APPROVED_TOPIC`` if the
+approval from the user via Telegram. It reads PLANNED rows from the
+publish queue (see ``queue_store.py``) and updates the status of the selected row to ``APPROVED_TOPIC`` if the
 user approves. If the user rejects the proposed topic, the script
-advances to the next topic in the queue.
+advances to the next topic in the queue. When no PLANNED rows are left,
+a batch of backlog topics is promoted first (see ``topic_planner.py``),
+so rows are proposed in priority order with series kept apart.
+
+An approved topic starts a production job (see ``job_journal.py``)
+whose working directory the following stages use with ``--job current``.
+If the current job has not finished, no new topic is proposed: the
+script reports the stage the job resumes at and leaves it current. A job
+with a stage that failed ``MAX_STAGE_ATTEMPTS`` times in a row is
+retired as FAILED first, and a new topic is proposed in its place.
 
 Usage:
 
@@ -18,14 +27,20 @@ Environment variables:
 Configuration files:
     config/ops.yml
     config/status_keys.yml
+
+Data files:
+    data/backlog.csv
 """
 
-import csv
 import os
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
-import yaml
+from config_loader import load_config
+from instrument import instrumented
+from job_journal import create_job, current_job, retire_job
+from queue_store import QueueStore, open_queue
+from topic_planner import load_settings, open_planner, promote_topics
 
 # Placeholder Telegram send/receive functions. Replace with actual
 # telegram bot API calls for production use.
@@ -35,39 +50,41 @@ def send_telegram_message(chat_id: str, text: str, buttons: List[str]) -> str:
     # Simulate a positive response for testing; in real use, wait for reply
     return 'Yes'
 
-def propose_next_topic(queue_path: Path, chat_id: str) -> None:
-    """Propose topics until approved or queue is exhausted."""
-    with queue_path.open(newline='') as csvfile:
-        rows = list(csv.DictReader(csvfile))
-
-    for row in rows:
-        if row.get('status') == 'PLANNED':
-            topic = row['topic']
-            response = send_telegram_message(
-                chat_id,
-                f"Proposed topic: {topic}. Approve?",
-                buttons=['Yes', 'No'],
-            )
-            if response.lower() == 'yes':
-                row['status'] = 'APPROVED_TOPIC'
-                break
-            else:
-                continue
-
-    # Write updated statuses back to CSV
-    with queue_path.open('w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=rows[0].keys())
-        writer.writeheader()
-        writer.writerows(rows)
+def propose_next_topic(store: QueueStore, chat_id: str) -> Optional[dict]:
+    """Propose topics until approved or queue is exhausted; return the approved row."""
+    for row in store.rows('PLANNED'):
+        topic = row['topic']
+        response = send_telegram_message(
+            chat_id,
+            f"Proposed topic: {topic}. Approve?",
+            buttons=['Yes', 'No'],
+        )
+        # Another stage may have claimed the row meanwhile; keep looking
+        if response.lower() == 'yes' and store.transition(row['id'], 'PLANNED', 'APPROVED_TOPIC'):
+            return row
+    return None
 
 def main() -> None:
-    base = Path(__file__).resolve().parent.parent
-    ops_path = base / 'config' / 'ops.yml'
-    queue_path = base / 'data' / 'publish_queue.csv'
-    with ops_path.open() as f:
-        ops = yaml.safe_load(f)
-    chat_id = ops['telegram']['chat_id']
-    propose_next_topic(queue_path, chat_id)
+    with instrumented('propose_topic'):
+        base = Path(__file__).resolve().parent.parent
+        chat_id = load_config(base, 'ops')['telegram']['chat_id']
+        job = current_job(base)
+        if job is not None and not job.closed():
+            failing = job.exhausted()
+            if failing is None:
+                print(f"Resuming job {job.job_id} ({job.topic}) at {job.first_incomplete()}")
+                return
+            reason = f"{failing} failed {job.stage(failing)['attempts']} times: {job.stage(failing).get('error', '')}"
+            retire_job(base, job, 'FAILED', reason)
+            print(f"Retired job {job.job_id} ({job.topic}) as FAILED: {reason}")
+        with open_queue(base) as store:
+            if store.count('PLANNED') == 0:
+                settings = load_settings(base)
+                promote_topics(store, open_planner(base, store, settings), int(settings['batch_size']))
+            row = propose_next_topic(store, chat_id)
+        if row is not None:
+            job = create_job(base, row)
+            print(f"Started job {job.job_id} for {row['topic']} in {job.dir}")
 
 if __name__ == '__main__':
     main()
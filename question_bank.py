@@ -0,0 +1,467 @@
+"""
+question_bank.py
+----------------
+
+Storage for published questions, replacing the flat
+``data/questions_bank.jsonl``. The bank is a directory (``data/bank``)
+with one shard per (series, locale). Each shard holds:
+
+- ``records-<gen>.bin`` – the questions as compact JSON records, back
+  to back, read through ``mmap`` and decoded one at a time on demand;
+- ``index-<gen>.bin`` – a fixed-width binary index with, per record, an
+  append sequence number, its offset and length in the record file,
+  flags and 64-bit hashes of the question id and the topic, opened as a
+  NumPy memory map;
+- ``meta.json`` – the series, locale and current generation.
+
+Opening a shard maps its two files and reads nothing else, so opening a
+bank of millions of questions takes milliseconds. Looking a question up
+by id or topic compares the hash column of each index, which NumPy
+does without decoding any record.
+
+Appending writes new records, then their index entries, each followed
+by an fsync. A crash in between leaves unindexed bytes that are simply
+ignored, and a torn index entry is cut off on the next open.
+``compact`` drops deleted records and older copies of re-published
+questions. It writes the next generation of both files and then switches
+``meta.json`` over atomically. Sequence numbers survive compaction, so
+readers that remember the last sequence they saw, like the de-duplication
+index, only ever read newer records.
+
+A question's id is its ``id`` field when present, otherwise a hash of
+its whitespace- and case-normalized text. The first ``open_bank`` seeds
+the bank from ``questions_bank.jsonl`` next to it and leaves a
+``.seeded`` marker so the import runs once.
+
+Usage:
+
+    python question_bank.py stats
+    python question_bank.py append --in deduped.jsonl --topic "World Capitals" --series capitals --locale EN
+    python question_bank.py get --id 3f2a9c0d1e2b4a5c
+    python question_bank.py topic --topic "World Capitals"
+    python question_bank.py compact
+    python question_bank.py import --jsonl data/questions_bank.jsonl
+
+Data files:
+    data/bank/
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import tempfile
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from instrument import add_profiler_argument, instrumented, stage
+from question_stream import read_questions, write_questions
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+INDEX_DTYPE = np.dtype([
+    ('seq', '<u8'),
+    ('offset', '<u8'),
+    ('length', '<u4'),
+    ('flags', '<u4'),
+    ('id', '<u8'),
+    ('topic', '<u8'),
+])
+DELETED = 1
+
+LEGACY_BANK = 'questions_bank.jsonl'
+SEEDED_MARKER = '.seeded'
+
+
+def hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little')
+
+
+def canonical(text: str) -> str:
+    return ' '.join(unicodedata.normalize('NFKC', text).casefold().split())
+
+
+def question_id(question: dict) -> str:
+    """Stable id of a question: its ``id`` field, or a hash of its normalized text."""
+    if question.get('id'):
+        return str(question['id'])
+    return hashlib.blake2b(canonical(question['question']).encode(), digest_size=8).hexdigest()
+
+
+def topic_key(topic: str) -> int:
+    return hash64(canonical(topic)) if topic else 0
+
+
+def shard_name(series: str, locale: str) -> str:
+    slug = lambda s: re.sub(r'[^a-z0-9]+', '-', s.lower()).strip('-') or '_'
+    return f'{slug(series)}--{slug(locale)}'
+
+
+def write_synced(path: Path, data: bytes, mode: str = 'wb') -> None:
+    with path.open(mode) as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def replace_synced(path: Path, data: bytes) -> None:
+    """Write ``data`` to a temporary file and rename it over ``path``."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Shard:
+    """Records of one (series, locale) with a memory-mapped offset index."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.name = self.path.name
+        self._records_file = None
+        self._load()
+
+    def _load(self, attempts: int = 5) -> None:
+        """Map the current generation's files.
+
+        ``compact`` may switch generations and unlink the old files between
+        reading ``meta.json`` and opening them; the load is then retried
+        with the new generation. Open mappings stay valid after an unlink.
+        """
+        self.close()
+        for attempt in range(attempts):
+            with (self.path / 'meta.json').open() as f:
+                self.meta = json.load(f)
+            gen = self.meta['generation']
+            self.records_path = self.path / f'records-{gen}.bin'
+            self.index_path = self.path / f'index-{gen}.bin'
+            try:
+                self._map()
+                return
+            except FileNotFoundError:
+                self.close()
+                if attempt == attempts - 1:
+                    raise
+
+    def _map(self) -> None:
+        with self.index_path.open('rb') as f:
+            # A torn entry from a crash mid-append is ignored here and cut
+            # off by the next append, which holds the writer lock
+            n = os.fstat(f.fileno()).st_size // INDEX_DTYPE.itemsize
+            self.index = np.memmap(f, INDEX_DTYPE, 'r', shape=(n,)) if n else np.empty(0, INDEX_DTYPE)
+        records_file = self.records_path.open('rb')
+        if os.fstat(records_file.fileno()).st_size:
+            self._records_file = records_file
+            self.records = mmap.mmap(records_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            records_file.close()
+
+    def close(self) -> None:
+        if self._records_file is not None:
+            self.records.close()
+            self._records_file.close()
+            self._records_file = None
+        self.records = b''
+        self.index = np.empty(0, INDEX_DTYPE)
+
+    @property
+    def series(self) -> str:
+        return self.meta['series']
+
+    @property
+    def locale(self) -> str:
+        return self.meta['locale']
+
+    def live(self) -> np.ndarray:
+        return (self.index['flags'] & DELETED) == 0
+
+    def __len__(self) -> int:
+        return int(self.live().sum())
+
+    def last_seq(self) -> int:
+        return int(self.index['seq'][-1]) if len(self.index) else 0
+
+    def record(self, position: int) -> dict:
+        entry = self.index[position]
+        start = int(entry['offset'])
+        return json.loads(self.records[start:start + int(entry['length'])])
+
+    def find(self, field: str, key: int) -> np.ndarray:
+        """Positions of live records whose ``field`` hash equals ``key``."""
+        return np.flatnonzero((self.index[field] == key) & self.live())
+
+    def after(self, seq: int) -> Iterator[Tuple[int, dict]]:
+        """Yield ``(seq, question)`` for live records appended after ``seq``."""
+        start = int(np.searchsorted(self.index['seq'], seq, side='right'))
+        for position in range(start, len(self.index)):
+            if not self.index[position]['flags'] & DELETED:
+                yield int(self.index[position]['seq']), self.record(position)
+
+    def __iter__(self) -> Iterator[dict]:
+        for _, question in self.after(0):
+            yield question
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Serialize writers of this shard across processes."""
+        with (self.path / '.lock').open('w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._load()  # see what other writers appended
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def append(self, questions: Iterable[dict]) -> int:
+        """Append questions; records first, then index, each made durable."""
+        with self._locked():
+            size = self.index_path.stat().st_size
+            if size % INDEX_DTYPE.itemsize:
+                with self.index_path.open('r+b') as f:
+                    f.truncate(size - size % INDEX_DTYPE.itemsize)
+            offset = self.records_path.stat().st_size
+            seq = self.last_seq()
+            blobs, entries = [], []
+            for q in questions:
+                blob = json.dumps(q, ensure_ascii=False, separators=(',', ':')).encode()
+                seq += 1
+                entries.append((seq, offset, len(blob), 0, hash64(q['id']), topic_key(q.get('topic', ''))))
+                blobs.append(blob)
+                offset += len(blob)
+            if not entries:
+                return 0
+            write_synced(self.records_path, b''.join(blobs), 'ab')
+            write_synced(self.index_path, np.array(entries, dtype=INDEX_DTYPE).tobytes(), 'ab')
+            self._load()
+        return len(entries)
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """Flag records as deleted; ``compact`` reclaims the space."""
+        keys = np.array([hash64(i) for i in ids], dtype='<u8')
+        with self._locked():
+            if not len(self.index):
+                return 0
+            self.close()
+            index = np.memmap(self.index_path, INDEX_DTYPE, 'r+')
+            hit = np.isin(index['id'], keys) & ((index['flags'] & DELETED) == 0)
+            index['flags'][hit] |= DELETED
+            index.flush()
+            del index
+            self._load()
+        return int(hit.sum())
+
+    def compact(self) -> Tuple[int, int]:
+        """Rewrite the shard without deleted records or superseded copies.
+
+        Returns the record counts before and after.
+        """
+        with self._locked():
+            before = len(self.index)
+            live = self.live()
+            # Keep the newest live copy of every id, in append order
+            _, last = np.unique(self.index['id'][::-1], return_index=True)
+            keep = np.zeros(before, dtype=bool)
+            keep[before - 1 - last] = True
+            positions = np.flatnonzero(keep & live)
+            gen = self.meta['generation'] + 1
+            new_records = self.path / f'records-{gen}.bin'
+            new_index = self.path / f'index-{gen}.bin'
+            entries = np.empty(len(positions), dtype=INDEX_DTYPE)
+            offset = 0
+            with new_records.open('wb') as f:
+                for i, position in enumerate(positions):
+                    entry = self.index[position]
+                    start, length = int(entry['offset']), int(entry['length'])
+                    f.write(self.records[start:start + length])
+                    entries[i] = entry
+                    entries[i]['offset'] = offset
+                    offset += length
+                f.flush()
+                os.fsync(f.fileno())
+            write_synced(new_index, entries.tobytes())
+            old = (self.records_path, self.index_path)
+            meta = dict(self.meta, generation=gen,
+                        compacted_at=datetime.now(timezone.utc).isoformat(timespec='seconds'))
+            replace_synced(self.path / 'meta.json', json.dumps(meta, indent=2).encode())
+            self._load()
+            for p in old:
+                p.unlink(missing_ok=True)
+        return before, len(positions)
+
+
+class QuestionBank:
+    """Directory of (series, locale) shards."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._shards: Dict[str, Shard] = {}
+        for meta in sorted(self.root.glob('*/meta.json')):
+            self._shards[meta.parent.name] = Shard(meta.parent)
+
+    def close(self) -> None:
+        for shard in self._shards.values():
+            shard.close()
+
+    def __enter__(self) -> 'QuestionBank':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def shards(self) -> List[Shard]:
+        return list(self._shards.values())
+
+    def shard(self, series: str = '', locale: str = '') -> Shard:
+        """Return the shard of (series, locale), creating it if needed."""
+        name = shard_name(series, locale)
+        if name not in self._shards:
+            path = self.root / name
+            path.mkdir(exist_ok=True)
+            if not (path / 'meta.json').exists():
+                # Empty generation-0 files first, so meta.json never names missing
+                # files; a reader opening the shard meanwhile sees no meta.json
+                # or a complete one, never a truncated file
+                for p in (path / 'records-0.bin', path / 'index-0.bin'):
+                    write_synced(p, b'', 'ab')
+                replace_synced(path / 'meta.json', json.dumps(
+                    {'series': series, 'locale': locale, 'generation': 0}, indent=2).encode())
+            self._shards[name] = Shard(path)
+        return self._shards[name]
+
+    def __len__(self) -> int:
+        return sum(len(s) for s in self._shards.values())
+
+    def append(self, questions: Iterable[dict], topic: str = '', series: str = '', locale: str = '') -> int:
+        """Add published questions, each to the shard of its series and locale.
+
+        ``topic``, ``series`` and ``locale`` fill in fields a question lacks.
+        """
+        groups: Dict[Tuple[str, str], List[dict]] = {}
+        for q in questions:
+            q = dict(q, id=question_id(q), topic=q.get('topic') or topic,
+                     series=q.get('series') or series, locale=q.get('locale') or locale)
+            groups.setdefault((q['series'], q['locale']), []).append(q)
+        return sum(self.shard(s, l).append(qs) for (s, l), qs in groups.items())
+
+    def get(self, qid: str) -> Optional[dict]:
+        """Return the newest copy of a question by id, or None."""
+        key = hash64(qid)
+        for shard in self._shards.values():
+            hits = shard.find('id', key)
+            if len(hits):
+                return shard.record(int(hits[-1]))
+        return None
+
+    def by_topic(self, topic: str, series: Optional[str] = None, locale: Optional[str] = None) -> List[dict]:
+        """Return the newest copy of every question of a topic, in append order."""
+        key = topic_key(topic)
+        found: Dict[str, dict] = {}
+        for shard in self._shards.values():
+            if (series is None or shard.series == series) and (locale is None or shard.locale == locale):
+                for position in shard.find('topic', key):
+                    question = shard.record(int(position))
+                    found[question['id']] = question
+        return list(found.values())
+
+    def delete(self, ids: Iterable[str]) -> int:
+        ids = list(ids)
+        return sum(shard.delete(ids) for shard in self._shards.values())
+
+    def compact(self) -> Dict[str, Tuple[int, int]]:
+        with stage('bank.compact') as s:
+            result = {name: shard.compact() for name, shard in self._shards.items()}
+            s.items = sum(before - after for before, after in result.values())
+        return result
+
+
+def open_bank(root: Path) -> QuestionBank:
+    """Open a bank directory, seeding it from the legacy JSONL bank next to it on first use.
+
+    Seeding is recorded by a ``.seeded`` marker written once the import
+    finished, not inferred from the directory (the de-duplication index
+    lives in it too) or from existing shards (questions may have been
+    published before the import ran).
+    """
+    root = Path(root)
+    marker = root / SEEDED_MARKER
+    if not marker.exists():
+        root.mkdir(parents=True, exist_ok=True)
+        legacy = root.parent / LEGACY_BANK
+        with (root / '.lock').open('w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if not marker.exists():
+                    if legacy.exists():
+                        with stage('bank.import') as s, QuestionBank(root) as bank:
+                            s.items = bank.append(read_questions(legacy))
+                    write_synced(marker, f'{legacy}\n'.encode())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+    # Opened after seeding so shards created by the import are included
+    return QuestionBank(root)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect and maintain the sharded question bank.")
+    parser.add_argument('--bank', default='data/bank', help='Bank directory (default: data/bank)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats', help='Questions and file sizes per shard')
+    p_append = sub.add_parser('append', help='Add published questions')
+    p_append.add_argument('--in', dest='inp', required=True, help='Input JSONL file')
+    p_append.add_argument('--topic', default='', help='Topic for questions without one')
+    p_append.add_argument('--series', default='', help='Series for questions without one')
+    p_append.add_argument('--locale', default='', help='Locale for questions without one')
+    p_get = sub.add_parser('get', help='Print a question by id')
+    p_get.add_argument('--id', required=True, help='Question id')
+    p_topic = sub.add_parser('topic', help='Print all questions of a topic')
+    p_topic.add_argument('--topic', required=True, help='Topic')
+    sub.add_parser('compact', help='Drop deleted and superseded records')
+    p_import = sub.add_parser('import', help='Append a JSONL bank')
+    p_import.add_argument('--jsonl', required=True, help='JSONL bank to import')
+    add_profiler_argument(parser)
+    args = parser.parse_args()
+
+    base = Path(__file__).resolve().parent.parent
+    root = Path(args.bank) if Path(args.bank).is_absolute() else base / args.bank
+    with instrumented('question_bank', args.profiler), open_bank(root) as bank:
+        if args.command == 'stats':
+            for shard in bank.shards():
+                size = shard.records_path.stat().st_size + shard.index_path.stat().st_size
+                print(f"{shard.name:<28} {len(shard):>9} questions {size / 1e6:>9.1f} MB  gen {shard.meta['generation']}")
+            print(f"{'total':<28} {len(bank):>9} questions")
+        elif args.command in ('append', 'import'):
+            path = args.inp if args.command == 'append' else args.jsonl
+            defaults = (args.topic, args.series, args.locale) if args.command == 'append' else ()
+            with stage('bank.append') as s:
+                s.items = bank.append(read_questions(path), *defaults)
+            print(f"Added {s.items} questions from {path} to {root}")
+        elif args.command == 'get':
+            question = bank.get(args.id)
+            if question is None:
+                raise SystemExit(f"No question {args.id!r}")
+            print(json.dumps(question, ensure_ascii=False))
+        elif args.command == 'topic':
+            write_questions('-', bank.by_topic(args.topic))
+        else:
+            for name, (before, after) in bank.compact().items():
+                print(f"{name:<28} {before:>9} → {after:>9} records")
+
+if __name__ == '__main__':
+    main()
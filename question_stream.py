@@ -0,0 +1,133 @@
+"""
+question_stream.py
+------------------
+
+Shared streaming reader/writer for question JSONL files. Stages read and
+write questions one at a time through generators instead of loading a
+whole file into a list, so they can be chained lazily (question 1 flows
+through fact-check and de-duplication while later questions are still
+being generated) and memory stays flat on large bulk imports into
+the question bank.
+
+Decoding uses ``orjson`` or ``msgspec`` when installed and falls back to
+the standard ``json`` module. The path ``-`` means stdin/stdout, so the
+stage scripts can also be piped together:
+
+    python gen_questions.py --topic "World Capitals" --out - \\
+        | python factcheck.py --in - --out - \\
+        | python dedupe.py --in - --bank data/bank --out deduped.jsonl
+
+``Question`` is a typed, slotted record for code that prefers attributes
+to dict keys; fields it does not know about are kept in ``extra``.
+"""
+
+import json
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Iterable, Iterator, List, Union
+
+try:
+    import orjson
+
+    def _loads(line: bytes) -> dict:
+        return orjson.loads(line)
+
+    def _dumps(record: dict) -> bytes:
+        return orjson.dumps(record) + b'\n'
+except ImportError:
+    try:
+        import msgspec
+
+        _decoder = msgspec.json.Decoder()
+        _encoder = msgspec.json.Encoder()
+
+        def _loads(line: bytes) -> dict:
+            return _decoder.decode(line)
+
+        def _dumps(record: dict) -> bytes:
+            return _encoder.encode(record) + b'\n'
+    except ImportError:
+        def _loads(line: bytes) -> dict:
+            return json.loads(line)
+
+        def _dumps(record: dict) -> bytes:
+            return (json.dumps(record, ensure_ascii=False) + '\n').encode()
+
+PathLike = Union[str, Path]
+
+
+@dataclass(slots=True)
+class Question:
+    question: str
+    options: List[str]
+    correct: int = 0
+    hint: str = ''
+    explanation: str = ''
+    extra: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Question':
+        known = {k: data[k] for k in ('question', 'options', 'correct', 'hint', 'explanation') if k in data}
+        extra = {k: v for k, v in data.items() if k not in known}
+        return cls(**known, extra=extra)
+
+    def to_dict(self) -> dict:
+        data = {
+            'question': self.question,
+            'options': self.options,
+            'correct': self.correct,
+            'hint': self.hint,
+            'explanation': self.explanation,
+        }
+        data.update(self.extra)
+        return data
+
+
+@contextmanager
+def _open(path: PathLike, mode: str) -> Iterator[IO[bytes]]:
+    if str(path) == '-':
+        yield sys.stdin.buffer if 'r' in mode else sys.stdout.buffer
+        return
+    with Path(path).open(mode) as f:
+        yield f
+
+
+def read_questions(path: PathLike) -> Iterator[dict]:
+    """Yield question dicts from a JSONL file one line at a time."""
+    with _open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield _loads(line)
+
+
+def read_records(path: PathLike) -> Iterator[Question]:
+    """Yield typed ``Question`` records from a JSONL file."""
+    for data in read_questions(path):
+        yield Question.from_dict(data)
+
+
+def write_questions(path: PathLike, questions: Iterable[Union[dict, Question]], append: bool = False) -> int:
+    """Stream questions to a JSONL file. Returns the count.
+
+    When writing to stdout every line is flushed so the next stage of a
+    shell pipe can start on it immediately.
+    """
+    n = 0
+    live = str(path) == '-'
+    with _open(path, 'ab' if append else 'wb') as f:
+        for q in questions:
+            f.write(_dumps(q.to_dict() if isinstance(q, Question) else q))
+            if live:
+                f.flush()
+            n += 1
+    return n
+
+
+def tap(questions: Iterable[dict], path: PathLike) -> Iterator[dict]:
+    """Pass questions through unchanged while also writing them to ``path``."""
+    with _open(path, 'wb') as f:
+        for q in questions:
+            f.write(_dumps(q))
+            yield q
@@ -3,8 +3,8 @@ queue_approval.py
 ------------------
 
 This script requests user approval to move a READY item into the
-upload/scheduling queue. It scans ``data/publish_queue.csv`` for rows
-with status ``READY`` and prompts the user via Telegram. If the user
+upload/scheduling queue. It looks up rows with status ``READY`` in the
+publish queue (see ``queue_store.py``) and prompts the user via Telegram. If the user
 approves, the status is updated to ``IN_QUEUE``. Otherwise, the item
 remains READY.
 
@@ -20,11 +20,12 @@ Configuration files:
     config/status_keys.yml
 """
 
-import csv
 from pathlib import Path
 from typing import List
 
-import yaml
+from config_loader import load_config
+from instrument import instrumented
+from queue_store import QueueStore, open_queue
 
 
 def send_queue_approval(chat_id: str, topic: str) -> str:
@@ -33,33 +34,21 @@ def send_queue_approval(chat_id: str, topic: str) -> str:
     # Placeholder: automatically approve
     return 'Add to Queue'
 
-def queue_approval(queue_path: Path, chat_id: str) -> None:
-    with queue_path.open(newline='') as csvfile:
-        rows = list(csv.DictReader(csvfile))
-    updated = False
-    for row in rows:
-        if row.get('status') == 'READY':
-            topic = row['topic']
-            resp = send_queue_approval(chat_id, topic)
-            if resp.lower().startswith('add'):
-                row['status'] = 'IN_QUEUE'
-            # Only prompt for the first READY item per run
-            updated = True
-            break
-    if updated:
-        with queue_path.open('w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=rows[0].keys())
-            writer.writeheader()
-            writer.writerows(rows)
+def queue_approval(store: QueueStore, chat_id: str) -> None:
+    # Only prompt for the first READY item per run
+    row = store.first('READY')
+    if row is None:
+        return
+    resp = send_queue_approval(chat_id, row['topic'])
+    if resp.lower().startswith('add'):
+        store.transition(row['id'], 'READY', 'IN_QUEUE')
 
 def main() -> None:
-    base = Path(__file__).resolve().parent.parent
-    ops_path = base / 'config' / 'ops.yml'
-    with ops_path.open() as f:
-        ops = yaml.safe_load(f)
-    chat_id = ops['telegram']['chat_id']
-    queue_path = base / 'data' / 'publish_queue.csv'
-    queue_approval(queue_path, chat_id)
+    with instrumented('queue_approval'):
+        base = Path(__file__).resolve().parent.parent
+        chat_id = load_config(base, 'ops')['telegram']['chat_id']
+        with open_queue(base) as store:
+            queue_approval(store, chat_id)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,292 @@
+"""
+queue_store.py
+--------------
+
+Shared storage engine for the publish queue. Earlier versions of the
+pipeline kept the queue only in ``data/publish_queue.csv`` and every
+stage re-read and rewrote the whole file to change a single status. This
+module keeps the queue in a SQLite database (``data/publish_queue.db``)
+with an index on ``status`` so that counting READY items, fetching the
+next PLANNED topic or moving a row to IN_QUEUE touches only the affected
+rows. Writes are transactional and the database runs in WAL mode, so
+several stages can safely work on the queue at the same time.
+
+The CSV file remains the interchange format: the database is seeded
+from ``publish_queue.csv`` once, and the queue can be exported back to
+CSV at any time. Seeding runs under ``BEGIN IMMEDIATE`` and records a
+``seeded`` row in the ``meta`` table in the same transaction, so two
+processes opening a new queue at once import the CSV only once, and an
+import that crashed partway is rolled back and retried on the next open.
+
+Usage:
+
+    python queue_store.py export --out data/publish_queue.csv
+    python queue_store.py import --in data/publish_queue.csv
+    python queue_store.py count --status READY
+
+Data files:
+    data/publish_queue.db
+    data/publish_queue.csv
+"""
+
+import argparse
+import csv
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from instrument import add_profiler_argument, instrumented, stage
+
+# Columns stored natively; anything else lives in the ``extra`` JSON blob
+CORE_COLUMNS = ['date', 'topic', 'series', 'locale', 'status', 'published_at']
+
+# States a row ends in when its topic will not be produced
+TERMINAL_STATUSES = ('REJECTED', 'FAILED')
+# States of rows whose video has been produced
+PRODUCED_STATUSES = ('READY', 'IN_QUEUE', 'PUBLISHED')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT,
+    topic TEXT NOT NULL,
+    series TEXT,
+    locale TEXT,
+    status TEXT NOT NULL,
+    published_at TEXT,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS queue_status ON queue (status, id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class QueueStore:
+    """Status-indexed publish queue backed by SQLite."""
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode; explicit transactions are opened where needed
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> 'QueueStore':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @staticmethod
+    def _to_dict(record: sqlite3.Row) -> Dict[str, object]:
+        row = {'id': record['id']}
+        for col in CORE_COLUMNS:
+            row[col] = record[col] if record[col] is not None else ''
+        row.update(json.loads(record['extra']))
+        return row
+
+    @staticmethod
+    def _split(fields: Dict[str, object]) -> tuple:
+        core = {k: v for k, v in fields.items() if k in CORE_COLUMNS}
+        extra = {k: v for k, v in fields.items() if k not in CORE_COLUMNS and k != 'id'}
+        return core, extra
+
+    def add(self, row: Dict[str, object]) -> int:
+        """Append a row and return its id."""
+        ids = self.add_many([row])
+        return ids[0]
+
+    def _insert(self, rows: Iterable[Dict[str, object]]) -> List[int]:
+        ids = []
+        for row in rows:
+            core, extra = self._split(row)
+            values = [core.get(col) or None for col in CORE_COLUMNS]
+            cur = self.conn.execute(
+                f"INSERT INTO queue ({', '.join(CORE_COLUMNS)}, extra) "
+                f"VALUES ({', '.join('?' for _ in CORE_COLUMNS)}, ?)",
+                values + [json.dumps(extra)],
+            )
+            ids.append(cur.lastrowid)
+        return ids
+
+    def add_many(self, rows: Iterable[Dict[str, object]]) -> List[int]:
+        """Append several rows in a single transaction."""
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            return self._insert(rows)
+
+    def is_seeded(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM meta WHERE key = 'seeded'").fetchone() is not None
+
+    def seed(self, csv_path: Path) -> int:
+        """Import ``csv_path`` unless the queue was seeded already. Returns the number imported."""
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            if self.is_seeded():
+                return 0  # another process won the race
+            n = 0
+            # Queues seeded before the marker existed already hold the CSV's rows
+            if csv_path.exists() and self.conn.execute('SELECT 1 FROM queue LIMIT 1').fetchone() is None:
+                with stage('queue.import') as s, csv_path.open(newline='') as csvfile:
+                    n = s.items = len(self._insert(row for row in csv.DictReader(csvfile) if row.get('topic')))
+            self.conn.execute("INSERT INTO meta VALUES ('seeded', ?)", (str(csv_path),))
+        return n
+
+    def get(self, row_id: int) -> Optional[Dict[str, object]]:
+        record = self.conn.execute('SELECT * FROM queue WHERE id = ?', (row_id,)).fetchone()
+        return self._to_dict(record) if record else None
+
+    def count(self, status: str) -> int:
+        """Count rows with the given status using the status index."""
+        (n,) = self.conn.execute('SELECT COUNT(*) FROM queue WHERE status = ?', (status,)).fetchone()
+        return n
+
+    def rows(self, status: Optional[str] = None, limit: Optional[int] = None) -> Iterator[Dict[str, object]]:
+        """Yield rows in insertion order, optionally filtered by status."""
+        sql = 'SELECT * FROM queue'
+        params: list = []
+        if status is not None:
+            sql += ' WHERE status = ?'
+            params.append(status)
+        sql += ' ORDER BY id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        for record in self.conn.execute(sql, params):
+            yield self._to_dict(record)
+
+    def latest(self, limit: int) -> List[Dict[str, object]]:
+        """Return the ``limit`` most recently added rows, newest first."""
+        if limit <= 0:
+            return []
+        cursor = self.conn.execute('SELECT * FROM queue ORDER BY id DESC LIMIT ?', (limit,))
+        return [self._to_dict(record) for record in cursor]
+
+    def topics(self) -> set:
+        """Return every topic that has a queue row, whatever its status."""
+        return {topic for (topic,) in self.conn.execute('SELECT DISTINCT topic FROM queue')}
+
+    def first(self, status: str) -> Optional[Dict[str, object]]:
+        """Return the oldest row with the given status, or None."""
+        return next(self.rows(status, limit=1), None)
+
+    def transition(self, row_id: int, from_status: str, to_status: str, **fields) -> bool:
+        """Move a row between states.
+
+        The update only applies if the row is still in ``from_status``, so
+        two stages racing on the same row cannot both win. Returns True if
+        the transition happened.
+        """
+        core, extra = self._split(fields)
+        assignments = ['status = ?'] + [f'{col} = ?' for col in core]
+        params = [to_status] + list(core.values())
+        if extra:
+            assignments.append('extra = json_patch(extra, ?)')
+            params.append(json.dumps(extra))
+        with self.conn:
+            cur = self.conn.execute(
+                f"UPDATE queue SET {', '.join(assignments)} WHERE id = ? AND status = ?",
+                params + [row_id, from_status],
+            )
+        return cur.rowcount == 1
+
+    def retire(self, row_id: int, to_status: str, reason: str = '') -> bool:
+        """Move a row that will not be produced to a terminal state.
+
+        ``to_status`` is one of ``TERMINAL_STATUSES``; the reason is kept in
+        the row's ``error`` field. Rows that are already terminal or have a
+        finished video (READY and later) are left alone. Returns True if the
+        row was moved.
+        """
+        if to_status not in TERMINAL_STATUSES:
+            raise ValueError(f"{to_status!r} is not one of {TERMINAL_STATUSES}")
+        done = TERMINAL_STATUSES + PRODUCED_STATUSES
+        with self.conn:
+            cur = self.conn.execute(
+                f"UPDATE queue SET status = ?, extra = json_patch(extra, ?) "
+                f"WHERE id = ? AND status NOT IN ({', '.join('?' for _ in done)})",
+                [to_status, json.dumps({'error': reason}), row_id, *done],
+            )
+        return cur.rowcount == 1
+
+    def update(self, row_id: int, **fields) -> None:
+        """Set arbitrary fields on a row without touching its status."""
+        core, extra = self._split(fields)
+        assignments = [f'{col} = ?' for col in core]
+        params = list(core.values())
+        if extra:
+            assignments.append('extra = json_patch(extra, ?)')
+            params.append(json.dumps(extra))
+        if not assignments:
+            return
+        with self.conn:
+            self.conn.execute(f"UPDATE queue SET {', '.join(assignments)} WHERE id = ?", params + [row_id])
+
+    def import_csv(self, csv_path: Path) -> int:
+        """Append all rows from a queue CSV file. Returns the number imported."""
+        with stage('queue.import') as s:
+            with Path(csv_path).open(newline='') as csvfile:
+                rows = [row for row in csv.DictReader(csvfile) if row.get('topic')]
+            s.items = len(self.add_many(rows))
+        return s.items
+
+    def export_csv(self, csv_path: Path) -> int:
+        """Write the whole queue to CSV atomically. Returns the row count."""
+        with stage('queue.export') as s:
+            rows = list(self.rows())
+            fieldnames = list(CORE_COLUMNS)
+            for row in rows:
+                for key in row:
+                    if key != 'id' and key not in fieldnames:
+                        fieldnames.append(key)
+            csv_path = Path(csv_path)
+            tmp_path = csv_path.with_suffix(csv_path.suffix + '.tmp')
+            with tmp_path.open('w', newline='') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
+                writer.writeheader()
+                writer.writerows(rows)
+            tmp_path.replace(csv_path)
+            s.items = len(rows)
+        return len(rows)
+
+
+def open_queue(base: Path) -> QueueStore:
+    """Open the project queue, seeding it from the CSV on first use."""
+    store = QueueStore(base / 'data' / 'publish_queue.db')
+    if not store.is_seeded():
+        store.seed(base / 'data' / 'publish_queue.csv')
+    return store
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the publish queue store.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_export = sub.add_parser('export', help='Export the queue to CSV')
+    p_export.add_argument('--out', required=True, help='Output CSV file')
+    p_import = sub.add_parser('import', help='Append rows from a queue CSV')
+    p_import.add_argument('--in', dest='inp', required=True, help='Input CSV file')
+    p_count = sub.add_parser('count', help='Count rows in a given status')
+    p_count.add_argument('--status', required=True, help='Pipeline state, e.g. READY')
+    add_profiler_argument(parser)
+    args = parser.parse_args()
+
+    base = Path(__file__).resolve().parent.parent
+    with instrumented('queue_store', args.profiler), open_queue(base) as store:
+        if args.command == 'export':
+            n = store.export_csv(Path(args.out))
+            print(f"Exported {n} rows → {args.out}")
+        elif args.command == 'import':
+            n = store.import_csv(Path(args.inp))
+            print(f"Imported {n} rows from {args.inp}")
+        else:
+            print(store.count(args.status))
+
+if __name__ == '__main__':
+    main()
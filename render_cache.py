@@ -0,0 +1,135 @@
+"""
+render_cache.py
+---------------
+
+Content-addressed cache for rendered videos and segments. Entries are
+keyed by a hash of the question content, the brand settings that affect
+the picture and the renderer version, so a rerun of ``render_native.py``
+for an unchanged quiz (for example after a rejected-then-reapproved
+preview or a failed thumbnail step) becomes a hard link or copy instead
+of a fresh encode. A hard-linked output shares the cached file, so the
+renderer unlinks an output before encoding over it.
+
+The cache directory is bounded in size. Every hit refreshes the entry's
+modification time, and when a new entry pushes the total over the limit
+the least recently used files are removed first.
+
+Usage:
+
+    python render_cache.py stats
+    python render_cache.py clear
+
+Configuration files:
+    config/ops.yml (``render_cache.dir``, ``render_cache.max_size_mb``)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from config_loader import config_section
+
+DEFAULT_MAX_SIZE_MB = 2048
+
+
+def cache_key(*parts) -> str:
+    """Hash JSON-serializable parts into a stable hex key."""
+    blob = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class RenderCache:
+    """Size-bounded, LRU-evicted directory of rendered artifacts."""
+
+    def __init__(self, root: Path, max_bytes: int) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str, suffix: str) -> Path:
+        return self.root / key[:2] / f'{key}{suffix}'
+
+    def fetch(self, key: str, dest: Path) -> bool:
+        """Materialize a cached entry at ``dest``. Returns False on a miss."""
+        src = self._path(key, dest.suffix)
+        if not src.exists():
+            return False
+        os.utime(src)  # mark as recently used
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists():
+            dest.unlink()
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copy2(src, dest)
+        return True
+
+    def store(self, key: str, src: Path) -> None:
+        """Copy a freshly rendered file into the cache and enforce the size limit."""
+        dest = self._path(key, src.suffix)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dest.parent, suffix='.tmp')
+        os.close(fd)
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dest)
+        self.evict()
+
+    def entries(self) -> list:
+        if not self.root.exists():
+            return []
+        return [p for p in self.root.glob('*/*') if p.is_file() and p.suffix != '.tmp']
+
+    def size(self) -> int:
+        return sum(p.stat().st_size for p in self.entries())
+
+    def evict(self) -> int:
+        """Remove least recently used entries until under the limit."""
+        stats = sorted(((p.stat(), p) for p in self.entries()), key=lambda sp: sp[0].st_mtime)
+        total = sum(st.st_size for st, _ in stats)
+        removed = 0
+        for st, path in stats:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= st.st_size
+            removed += 1
+        return removed
+
+    def clear(self) -> None:
+        for path in self.entries():
+            path.unlink(missing_ok=True)
+
+
+def load_render_cache(base: Path) -> Optional[RenderCache]:
+    """Build the cache configured in ``ops.yml``; None if it is disabled."""
+    settings = config_section(base, 'render_cache')
+    if not settings.get('enabled', True):
+        return None
+    root = base / settings.get('dir', 'cache/renders')
+    max_mb = settings.get('max_size_mb', DEFAULT_MAX_SIZE_MB)
+    return RenderCache(root, int(max_mb * 1024 * 1024))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect or clear the render cache.")
+    parser.add_argument('command', choices=['stats', 'clear'])
+    args = parser.parse_args()
+    base = Path(__file__).resolve().parent.parent
+    cache = load_render_cache(base)
+    if cache is None:
+        print("Render cache is disabled in ops.yml.")
+        return
+    if args.command == 'clear':
+        cache.clear()
+        print(f"Cleared {cache.root}")
+    else:
+        entries = cache.entries()
+        print(f"{len(entries)} entries, {cache.size() / 1e6:.1f} MB of "
+              f"{cache.max_bytes / 1e6:.0f} MB in {cache.root}")
+
+if __name__ == '__main__':
+    main()
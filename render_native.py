@@ -3,19 +3,65 @@ render_native.py
 -----------------
 
 Render a vertical quiz video from a JSONL file of questions using
-MoviePy. Each question is displayed for a fixed amount of time defined
-in ``config/brand.yml``. The total runtime is padded to ensure the
-video length falls within the configured minimum and maximum duration.
+MoviePy. Before anything is drawn, a planning step packs questions from
+the pool into the minimum and maximum duration of ``config/brand.yml``:
+each question gets a question slide (at least ``timer_seconds``, longer
+when the text takes longer to read), a reveal slide with the correct
+answer and, where it still fits, an explanation slide, each fading in
+over ``transition_ms``. Slide lengths are whole frames and any time short
+of the minimum is spread over the planned slides, so every rendered
+frame ends up in the video; nothing is padded or cut afterwards. Slides
+are stretched by at most ``MAX_STRETCH``; a pool too small to reach the
+minimum within that is rejected with ``NotEnoughQuestions`` rather than
+rendered as a few drawn-out slides.
 
 Usage:
 
     python render_native.py --in deduped.jsonl --out out/video.mp4
+    python render_native.py --in deduped.jsonl --out out/video.mp4 --workers 4
+    python render_native.py --manifest jobs.jsonl --workers 4
+    python render_native.py --in deduped.jsonl --out out/draft.mp4 --profile draft
+    python render_native.py --in deduped.jsonl --out out/video.mp4 --profiler cprofile
+    python render_native.py --job current
+
+With ``--workers`` greater than one, each slide is encoded as its own
+segment in a separate process and the segments are joined with ffmpeg's concat demuxer without re-encoding.
+
+With ``--manifest``, many videos are rendered by one long-lived process
+pool. The manifest is a JSONL file with one ``{"in": ..., "out": ...}``
+job per line; the brand config is parsed once and each worker keeps its
+background frame warm between jobs. A JSON status line is printed as
+each job finishes.
+
+Finished videos and segments are kept in a content-addressed render
+cache (see ``render_cache.py``), keyed on the question content, the
+brand settings below and ``RENDERER_VERSION``. Rerunning an unchanged
+quiz links the cached file into place instead of encoding it again.
+Pass ``--no-cache`` to force a fresh render.
+
+Slides are static, so they are rasterized once to a single frame
+instead of being recomposited for every frame. In segment mode a static
+slide is encoded straight from that still image, with ffmpeg's ``fade``
+filter drawing the transition.
+
+Encoder settings come from the ``encoder.profiles`` section of
+``brand.yml`` (x264 preset, CRF, thread count, keyframe interval and
+pixel format); ``--profile`` picks one, defaulting to the brand's
+``publish_profile``. Each render reports its encode time and output
+bitrate; planning, encoding, segment and concat stages are also logged
+through ``instrument.py``, and ``--profiler`` profiles the whole run.
+
+With ``--job`` the job's ``deduped.jsonl`` is rendered to its
+``video.mp4`` and the video path is recorded on the job's queue row; a
+video already rendered from the same questions, brand settings and
+profile is kept (see ``job_journal.py``).
 
 Dependencies:
     pip install moviepy
 
 Configuration files:
     config/brand.yml
+    config/ops.yml (render cache settings)
 
 Note: This implementation is simplified and uses basic text clips on
 a static background. It is intended as a starting point for building
@@ -24,75 +70,501 @@ a fully featured renderer.
 
 import argparse
 import json
+import math
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
+from typing import List, Optional
+
+from config_loader import load_config
+from instrument import add_profiler_argument, instrumented, stage
+from job_journal import add_job_argument, job_step, open_job, record_on_queue, skip_message
+from question_stream import read_questions
+from render_cache import RenderCache, cache_key, load_render_cache
+
+# NumPy, imageio and MoviePy (over a second to import together) are
+# imported inside the functions that draw or encode, so planning, runtime
+# estimates and the render queue's producers start without them.
+
+# Video dimensions for vertical (9:16 ratio)
+WIDTH, HEIGHT = 1080, 1920
+FPS = 24
+
+# Bump whenever a change alters the rendered output so cached renders
+# from older code are not reused
+RENDERER_VERSION = '4'
+
+# Sections of brand.yml that influence the rendered picture
+RENDER_BRAND_KEYS = ('typography', 'colors', 'short')
+
+# Used for any setting a brand.yml encoder profile leaves out
+DEFAULT_ENCODER_PROFILE = {
+    'preset': 'medium',
+    'crf': 23,
+    'threads': 0,
+    'keyframe_interval_sec': 2,
+    'pixel_format': 'yuv420p',
+}
 
-import yaml
-from moviepy.editor import (ColorClip, CompositeVideoClip, TextClip,
-                            concatenate_videoclips)
+# Used for any pacing setting the brand's ``short`` section leaves out
+DEFAULT_PACING = {
+    'reading_wps': 3.0,
+    'reveal_seconds': 2.0,
+    'explanation_min_seconds': 3.0,
+    'transition_ms': 0,
+}
+
+# Questions read past the most that can fit, so that a question too long
+# for the remaining time can be skipped in favour of a shorter one
+POOL_LOOKAHEAD = 2
+
+# Longest a slide may become, relative to its planned length, when the
+# questions fall short of ``min_duration_sec``
+MAX_STRETCH = 1.5
+
+# Segment kinds whose content does not change over time
+STATIC_KINDS = {'question', 'reveal', 'explanation'}
+
+# Brand config, cache and encoder profile of a batch worker process,
+# set by _init_batch_worker
+_worker_config: Optional[dict] = None
+_worker_cache: Optional[RenderCache] = None
+_worker_profile: Optional[str] = None
 
 
 def load_brand_config(base: Path) -> dict:
-    with (base / 'config' / 'brand.yml').open() as f:
-        return yaml.safe_load(f)
+    with stage('config.load'):
+        return load_config(base, 'brand')
+
+
+def hex_to_rgb(value: str) -> tuple:
+    return tuple(int(value[i:i+2], 16) for i in (1, 3, 5))
+
+
+@lru_cache(maxsize=8)
+def background_frame(bg_color: str) -> 'np.ndarray':
+    """Return the solid background frame, built once per colour and process."""
+    import numpy as np
+
+    frame = np.empty((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    frame[:] = hex_to_rgb(bg_color)
+    frame.flags.writeable = False
+    return frame
+
+
+def pacing_settings(config: dict) -> dict:
+    """Slide pacing from the brand's ``short`` section, filling in defaults."""
+    short = config['short']
+    return dict(DEFAULT_PACING, **{k: short[k] for k in DEFAULT_PACING if k in short})
 
 
-def render_video(questions_file: Path, output_file: Path, config: dict) -> None:
-    # Extract settings
+def reading_seconds(text: str, pacing: dict) -> float:
+    return len(text.split()) / pacing['reading_wps']
+
+
+def to_frames(seconds: float) -> int:
+    return max(1, round(seconds * FPS))
+
+
+def question_text(q: dict) -> str:
+    return q['question'] + '\n' + '\n'.join(f"{chr(65+i)}. {opt}" for i, opt in enumerate(q['options']))
+
+
+def question_slides(q: dict, config: dict, pacing: dict) -> tuple:
+    """Return the question and reveal slides of ``q`` and its optional
+    explanation slide, each with its shortest length in frames."""
+    fade = pacing['transition_ms'] / 1000
     timer_seconds = config['short']['timer_seconds']
-    min_duration = config['short']['min_duration_sec']
-    max_duration = config['short']['max_duration_sec']
-    question_font_size = config['typography']['question_font_size']
-    option_font_size = config['typography']['option_font_size']
-    bg_color = config['colors']['background']
-    text_color = config['colors']['text_primary']
-
-    # Read questions
-    questions = []
-    with questions_file.open() as f:
-        for line in f:
-            questions.append(json.loads(line))
+    core = [
+        {'kind': 'question', 'question': q,
+         'frames': to_frames(fade + max(timer_seconds, reading_seconds(question_text(q), pacing)))},
+        {'kind': 'reveal', 'question': q, 'frames': to_frames(fade + pacing['reveal_seconds'])},
+    ]
+    explanation = None
+    if (q.get('explanation') or '').strip():
+        seconds = max(pacing['explanation_min_seconds'], reading_seconds(q['explanation'], pacing))
+        explanation = {'kind': 'explanation', 'question': q, 'frames': to_frames(fade + seconds)}
+    return core, explanation
+
+
+class NotEnoughQuestions(ValueError):
+    """The questions cannot fill the minimum duration without over-stretching slides."""
+
+
+def stretch_frames(slides: List[dict], target: int) -> None:
+    """Lengthen ``slides`` in proportion to their length until they add up to ``target`` frames."""
+    total = sum(s['frames'] for s in slides)
+    shares = [s['frames'] * (target - total) / total for s in slides]
+    for slide, share in zip(slides, shares):
+        slide['frames'] += int(share)
+    # Hand out the frames lost to rounding down, largest remainder first
+    left = target - sum(s['frames'] for s in slides)
+    by_remainder = sorted(range(len(slides)), key=lambda i: shares[i] - int(shares[i]), reverse=True)
+    for i in by_remainder[:left]:
+        slides[i]['frames'] += 1
 
-    clips = []
-    # Video dimensions for vertical (9:16 ratio)
-    width, height = 1080, 1920
+
+def plan_segments(questions: List[dict], config: dict) -> List[dict]:
+    """Pack questions into the duration limits and lay out their slides.
+
+    Questions are taken in pool order while their question and reveal
+    slides fit under ``max_duration_sec``; one that does not fit is
+    skipped in favour of shorter ones further down. Explanation slides
+    are then added, in question order, where they still fit, and any time
+    left below ``min_duration_sec`` is spread over all planned slides.
+    Durations are whole frames, so the plan is exactly the final video.
+    Raises ``NotEnoughQuestions`` when that would lengthen the slides by
+    more than ``MAX_STRETCH``.
+    """
+    pacing = pacing_settings(config)
+    min_frames = round(config['short']['min_duration_sec'] * FPS)
+    max_frames = round(config['short']['max_duration_sec'] * FPS)
+
+    chosen, total = [], 0
     for q in questions:
-        question_text = q['question']
-        options = q['options']
-        content = question_text + '\n' + '\n'.join(f"{chr(65+i)}. {opt}" for i, opt in enumerate(options))
-        # Create text clip
-        txt = TextClip(content, fontsize=question_font_size, color=text_color, font='Liberation-Sans', align='Center', method='caption', size=(width*0.9, None))
-        # Create background clip
-        bg = ColorClip(size=(width, height), color=tuple(int(bg_color[i:i+2], 16) for i in (1, 3, 5))).set_duration(timer_seconds)
-        # Position text in the center
-        txt = txt.set_position(('center', 'center')).set_duration(timer_seconds)
-        clip = CompositeVideoClip([bg, txt])
-        clips.append(clip)
-
-    # Concatenate clips
-    video = concatenate_videoclips(clips)
-
-    # Pad video to minimum duration with a blank slide if needed
-    if video.duration < min_duration:
-        pad_time = min_duration - video.duration
-        pad_clip = ColorClip(size=(width, height), color=tuple(int(bg_color[i:i+2], 16) for i in (1, 3, 5))).set_duration(pad_time)
-        video = concatenate_videoclips([video, pad_clip])
-    # Trim if exceeds max duration
-    if video.duration > max_duration:
-        video = video.subclip(0, max_duration)
-
-    # Write video file
+        core, explanation = question_slides(q, config, pacing)
+        frames = sum(s['frames'] for s in core)
+        if total + frames <= max_frames:
+            chosen.append((core, explanation))
+            total += frames
+
+    planned = []
+    for core, explanation in chosen:
+        planned.extend(core)
+        if explanation is not None and total + explanation['frames'] <= max_frames:
+            planned.append(explanation)
+            total += explanation['frames']
+    if planned and total < min_frames:
+        if min_frames > total * MAX_STRETCH:
+            raise NotEnoughQuestions(
+                f"{len(chosen)} of {len(questions)} questions fill {total / FPS:.1f}s of the "
+                f"{config['short']['min_duration_sec']}s minimum, more than slides may be "
+                f"stretched ({MAX_STRETCH}x); generate more questions")
+        stretch_frames(planned, min_frames)
+
+    fade = pacing['transition_ms'] / 1000
+    return [{'kind': s['kind'], 'question': s['question'], 'duration': s['frames'] / FPS, 'fade_in': fade}
+            for s in planned]
+
+
+def pool_size(config: dict) -> int:
+    """How many questions to read from a pool for ``plan_segments``."""
+    pacing = pacing_settings(config)
+    shortest = (config['short']['timer_seconds'] + pacing['reveal_seconds']
+                + 2 * pacing['transition_ms'] / 1000)
+    return math.ceil(config['short']['max_duration_sec'] / shortest) * POOL_LOOKAHEAD
+
+
+def preload_renderer() -> None:
+    """Import the drawing and encoding libraries now, e.g. in a render worker's
+    initializer, so its first job does not pay for them."""
+    import imageio  # noqa: F401
+    import moviepy.editor  # noqa: F401
+
+
+def ffmpeg_binary() -> str:
+    from moviepy.config import get_setting
+
+    return get_setting('FFMPEG_BINARY')
+
+
+def text_clip(text: str, font_size: int, color: str, duration: float, y):
+    from moviepy.editor import TextClip
+
+    txt = TextClip(text, fontsize=font_size, color=color, font='Liberation-Sans', align='Center',
+                   method='caption', size=(WIDTH*0.9, None))
+    return txt.set_position(('center', y)).set_duration(duration)
+
+
+def build_segment_clip(segment: dict, config: dict):
+    """Build the MoviePy clip for a single planned segment."""
+    from moviepy.editor import CompositeVideoClip, ImageClip
+
+    duration = segment['duration']
+    typography, colors = config['typography'], config['colors']
+    bg = ImageClip(background_frame(colors['background'])).set_duration(duration)
+    q = segment['question']
+    if segment['kind'] == 'question':
+        layers = [text_clip(question_text(q), typography['question_font_size'], colors['text_primary'],
+                            duration, 'center')]
+    elif segment['kind'] == 'reveal':
+        answer = f"{chr(65 + q['correct'])}. {q['options'][q['correct']]}"
+        layers = [
+            text_clip(q['question'], typography['question_font_size'], colors['text_primary'],
+                      duration, HEIGHT * 0.2),
+            text_clip(answer, typography['option_font_size'], colors['correct_option'], duration, 'center'),
+        ]
+    else:
+        layers = [text_clip(q['explanation'], typography['option_font_size'], colors['text_secondary'],
+                            duration, 'center')]
+    return CompositeVideoClip([bg] + layers)
+
+
+def rasterize_segment(segment: dict, config: dict) -> 'np.ndarray':
+    """Composite a static slide once and return it as an RGB frame."""
+    clip = build_segment_clip(segment, config)
+    frame = clip.get_frame(0)
+    clip.close()
+    return frame
+
+
+def slide_clip(segment: dict, config: dict):
+    """Return a clip for a segment, using a single still frame when static."""
+    from moviepy.editor import ImageClip, vfx
+
+    if segment['kind'] in STATIC_KINDS:
+        clip = ImageClip(rasterize_segment(segment, config)).set_duration(segment['duration'])
+    else:
+        clip = build_segment_clip(segment, config)
+    if segment.get('fade_in'):
+        clip = clip.fx(vfx.fadein, segment['fade_in'], initial_color=hex_to_rgb(config['colors']['background']))
+    return clip
+
+
+def encoder_profile(config: dict, name: Optional[str] = None) -> dict:
+    """Resolve an encoder profile from brand.yml, filling in defaults."""
+    encoder = config.get('encoder', {})
+    name = name or encoder.get('publish_profile', 'publish')
+    profiles = encoder.get('profiles', {})
+    if profiles and name not in profiles:
+        raise ValueError(f"Unknown encoder profile {name!r}; choose from {sorted(profiles)}")
+    return dict(DEFAULT_ENCODER_PROFILE, **profiles.get(name, {}), name=name)
+
+
+def encoder_params(profile: dict) -> List[str]:
+    """x264 options shared by every encode so segments can be stream-copied together."""
+    gop = max(1, round(profile['keyframe_interval_sec'] * FPS))
+    return ['-crf', str(profile['crf']), '-g', str(gop), '-keyint_min', str(gop),
+            '-pix_fmt', profile['pixel_format']]
+
+
+def encode_still(frame: 'np.ndarray', duration: float, out_path: str, profile: dict,
+                 fade_in: float = 0.0, fade_color: str = '#000000') -> None:
+    """Encode a still frame held for ``duration`` seconds directly with ffmpeg,
+    optionally fading in from ``fade_color`` over the first ``fade_in`` seconds."""
+    import imageio
+
+    still_path = str(Path(out_path).with_suffix('.png'))
+    imageio.imwrite(still_path, frame)
+    n_frames = max(1, round(duration * FPS))
+    fade = ['-vf', f"fade=t=in:st=0:d={fade_in}:color=0x{fade_color.lstrip('#')}"] if fade_in else []
+    subprocess.run(
+        [ffmpeg_binary(), '-y', '-loglevel', 'error',
+         '-loop', '1', '-framerate', str(FPS), '-i', still_path,
+         '-frames:v', str(n_frames)] + fade + ['-c:v', 'libx264', '-tune', 'stillimage',
+         '-preset', profile['preset'], '-threads', str(profile['threads'])]
+        + encoder_params(profile) + [out_path],
+        check=True,
+    )
+
+
+def render_key(kind: str, payload, config: dict, profile: dict) -> str:
+    """Cache key for a rendered artifact of the given content, brand and encoder profile."""
+    brand = {k: config.get(k) for k in RENDER_BRAND_KEYS}
+    return cache_key(kind, RENDERER_VERSION, FPS, brand, profile, payload)
+
+
+def unlink_output(path: Path) -> None:
+    """Remove an earlier output before encoding over it. A cache hit hard-links
+    the cached file into place, so writing through that link would overwrite
+    the cache entry as well."""
+    path.unlink(missing_ok=True)
+
+
+def render_segment(segment: dict, config: dict, out_path: str,
+                   cache: Optional[RenderCache] = None, profile: Optional[dict] = None) -> str:
+    """Encode one segment to its own file. Runs inside worker processes."""
+    profile = profile or encoder_profile(config)
+    key = render_key('segment', segment, config, profile)
+    with stage('render.segment', items=1, kind=segment['kind']) as s:
+        if cache is not None and cache.fetch(key, Path(out_path)):
+            s.fields['cached'] = True
+            return out_path
+        unlink_output(Path(out_path))
+        if segment['kind'] in STATIC_KINDS:
+            encode_still(rasterize_segment(segment, config), segment['duration'], out_path, profile,
+                         segment.get('fade_in', 0.0), config['colors']['background'])
+        else:
+            clip = slide_clip(segment, config)
+            clip.write_videofile(out_path, fps=FPS, audio=False, logger=None,
+                                 preset=profile['preset'], threads=profile['threads'] or None,
+                                 ffmpeg_params=encoder_params(profile))
+            clip.close()
+    if cache is not None:
+        cache.store(key, Path(out_path))
+    return out_path
+
+
+def concat_segments(segment_paths: List[str], output_file: Path) -> None:
+    """Join encoded segments with the concat demuxer (stream copy, no re-encode)."""
+    list_path = Path(segment_paths[0]).parent / 'segments.txt'
+    list_path.write_text(''.join(f"file '{Path(p).resolve()}'\n" for p in segment_paths))
+    with stage('render.concat', items=len(segment_paths)):
+        subprocess.run(
+            [ffmpeg_binary(), '-y', '-loglevel', 'error',
+             '-f', 'concat', '-safe', '0', '-i', str(list_path),
+             '-c', 'copy', '-movflags', '+faststart', str(output_file)],
+            check=True,
+        )
+
+
+def render_video(questions_file: Path, output_file: Path, config: dict, workers: int = 1,
+                 cache: Optional[RenderCache] = None, profile: Optional[str] = None) -> dict:
+    """Render a quiz video and return its render report (see ``render_questions``)."""
+    # Read only as much of the pool as the planner can use
+    questions = list(islice(read_questions(questions_file), pool_size(config)))
+    return render_questions(questions, output_file, config, workers=workers, cache=cache, profile=profile)
+
+
+def render_questions(questions: List[dict], output_file: Path, config: dict, workers: int = 1,
+                     cache: Optional[RenderCache] = None, profile: Optional[str] = None) -> dict:
+    """Render the questions ``plan_segments`` picks from an already-loaded pool.
+
+    Returns a report with the encoder profile, whether the video came from
+    the cache, the encode time in seconds, the output bitrate in kb/s, the
+    number of questions used and the video duration in seconds.
+    """
+    started = time.monotonic()
+    settings = encoder_profile(config, profile)
+    with stage('render.plan', items=len(questions)) as s:
+        segments = plan_segments(questions, config)
+        used = len({id(seg['question']) for seg in segments})
+        s.fields['used'] = used
+    if not segments:
+        raise ValueError(f"None of the {len(questions)} questions fit into "
+                         f"{config['short']['max_duration_sec']}s")
+    duration = sum(s['duration'] for s in segments)
     output_file.parent.mkdir(parents=True, exist_ok=True)
-    video.write_videofile(str(output_file), fps=24, audio=False)
+    key = render_key('video', segments, config, settings)
+    cached = cache is not None and cache.fetch(key, output_file)
+
+    if not cached:
+        unlink_output(output_file)
+    if cached:
+        pass
+    elif workers <= 1:
+        # Single encode of the whole concatenation
+        from moviepy.editor import concatenate_videoclips
+
+        with stage('render.encode', items=len(segments), profile=settings['name']):
+            video = concatenate_videoclips([slide_clip(s, config) for s in segments])
+            video.write_videofile(str(output_file), fps=FPS, audio=False,
+                                  preset=settings['preset'], threads=settings['threads'] or None,
+                                  ffmpeg_params=['-tune', 'stillimage', '-movflags', '+faststart']
+                                  + encoder_params(settings))
+    else:
+        with tempfile.TemporaryDirectory(dir=output_file.parent, prefix='.segments-') as tmp:
+            paths = [str(Path(tmp) / f'seg{i:03d}.mp4') for i in range(len(segments))]
+            n = len(segments)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                done = list(pool.map(render_segment, segments, [config] * n, paths,
+                                     [cache] * n, [settings] * n))
+            concat_segments(done, output_file)
+
+    if cache is not None and not cached:
+        cache.store(key, output_file)
+    return {
+        'profile': settings['name'],
+        'cached': cached,
+        'seconds': round(time.monotonic() - started, 2),
+        'bitrate_kbps': round(output_file.stat().st_size * 8 / 1000 / duration, 1) if duration else 0.0,
+        'questions': used,
+        'duration': round(duration, 2),
+    }
+
+
+def format_report(output_file: Path, report: dict) -> str:
+    source = 'cache hit' if report['cached'] else f"encoded in {report['seconds']}s"
+    return f"{output_file}: {source}, {report['bitrate_kbps']} kb/s ({report['profile']} profile)"
+
+
+def _init_batch_worker(config: dict, cache: Optional[RenderCache], profile: Optional[str]) -> None:
+    global _worker_config, _worker_cache, _worker_profile
+    _worker_config = config
+    _worker_cache = cache
+    _worker_profile = profile
+    # Warm the background so the first job does not pay for it
+    background_frame(config['colors']['background'])
+
+
+def _render_job(job: dict) -> dict:
+    """Render one manifest job inside a batch worker and report its status."""
+    started = time.monotonic()
+    try:
+        report = render_video(Path(job['in']), Path(job['out']), _worker_config,
+                              cache=_worker_cache, profile=_worker_profile)
+    except Exception as exc:  # report and keep the batch going
+        return {'in': job['in'], 'out': job['out'], 'status': 'failed',
+                'error': f'{type(exc).__name__}: {exc}',
+                'seconds': round(time.monotonic() - started, 2)}
+    return {'in': job['in'], 'out': job['out'], 'status': 'cached' if report['cached'] else 'ok',
+            'seconds': report['seconds'], 'bitrate_kbps': report['bitrate_kbps']}
+
+
+def render_batch(manifest_path: Path, config: dict, workers: int = 1,
+                 cache: Optional[RenderCache] = None, profile: Optional[str] = None) -> List[dict]:
+    """Render every job of a JSONL manifest through a bounded process pool."""
+    jobs = []
+    with manifest_path.open() as f:
+        for line in f:
+            if line.strip():
+                jobs.append(json.loads(line))
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_batch_worker,
+                             initargs=(config, cache, profile)) as pool:
+        futures = [pool.submit(_render_job, job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            print(json.dumps(result), flush=True)
+            results.append(result)
+    return results
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Render a quiz video using MoviePy.")
-    parser.add_argument('--in', dest='inp', required=True, help='Input deduped JSONL file')
-    parser.add_argument('--out', dest='outp', required=True, help='Output MP4 file')
+    parser.add_argument('--in', dest='inp', help='Input deduped JSONL file')
+    parser.add_argument('--out', dest='outp', help='Output MP4 file')
+    parser.add_argument('--manifest', help='JSONL file of {"in", "out"} jobs to render in one process pool')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Render segments (or manifest jobs) in this many processes')
+    parser.add_argument('--no-cache', action='store_true', help='Ignore and do not fill the render cache')
+    parser.add_argument('--profile', help='Encoder profile from brand.yml (default: encoder.publish_profile)')
+    add_job_argument(parser)
+    add_profiler_argument(parser)
     args = parser.parse_args()
     base = Path(__file__).resolve().parent.parent
-    brand_config = load_brand_config(base)
-    render_video(Path(args.inp), Path(args.outp), brand_config)
+    journal = open_job(base, args.job) if args.job else None
+    if journal is not None:
+        args.inp = str(journal.file('deduped.jsonl'))
+        args.outp = str(journal.file('video.mp4'))
+    if not args.manifest and not (args.inp and args.outp):
+        parser.error('either --manifest, --job or both --in and --out are required')
+    with instrumented('render_native', args.profiler):
+        brand_config = load_brand_config(base)
+        cache = None if args.no_cache else load_render_cache(base)
+        if args.manifest:
+            results = render_batch(Path(args.manifest), brand_config, workers=args.workers,
+                                   cache=cache, profile=args.profile)
+            failed = sum(1 for r in results if r['status'] == 'failed')
+            print(f"Rendered {len(results) - failed}/{len(results)} jobs from {args.manifest}")
+            if failed:
+                raise SystemExit(1)
+            return
+        params = {'brand': {k: brand_config.get(k) for k in RENDER_BRAND_KEYS},
+                  'encoder': encoder_profile(brand_config, args.profile), 'renderer': RENDERER_VERSION}
+        with job_step(journal, 'render', [Path(args.inp)], [Path(args.outp)], params) as step:
+            if step.skipped:
+                print(skip_message(journal, 'render'))
+                return
+            report = render_video(Path(args.inp), Path(args.outp), brand_config, workers=args.workers,
+                                  cache=cache, profile=args.profile)
+            if journal is not None:
+                record_on_queue(base, journal, video=str(Path(args.outp).resolve()))
+        print(format_report(Path(args.outp), report))
 
 if __name__ == '__main__':
     main()
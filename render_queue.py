@@ -0,0 +1,558 @@
+"""
+render_queue.py
+---------------
+
+Shared render job queue and the worker daemon that drains it, so renders
+can run on every machine that can reach the queue instead of only on the
+host where n8n calls ``render_native.py``.
+
+The queue is a SQLite database (``data/render_jobs.db`` by default) in
+WAL mode. SQLite's locking does not hold up on network filesystems, so
+the database stays on the local disk of one host. That host runs
+``render_queue.py serve``, which exposes the queue over HTTP. Producers
+and workers on every node set ``render_farm.url`` to reach it. Without
+``url`` the scripts open the database directly, which is only safe for
+workers on the same host. A producer enqueues a job with everything a
+worker needs to render it: the questions, the brand config, the encoder
+profile and the output path. Enqueueing the same payload again returns
+the existing job instead of adding another.
+
+Workers lease jobs one at a time in a short ``BEGIN IMMEDIATE``
+transaction, so a job is never handed to two workers at once. While a
+render runs, the worker renews its lease with a heartbeat every third of
+the lease time. A lease that expires (the worker died or lost the
+server) is put back in the queue and retried by another worker, up to
+``max_attempts`` times in total. A failed render is retried the same way.
+The artifact is written to a name private to the attempt, next to the
+output path. It is renamed into place only if the worker still holds the
+lease once the render has finished, so neither a half-written video nor
+the late result of a lost lease appears under the final name.
+
+The server accepts only requests carrying the shared token from the
+environment variable named by ``render_farm.token_env`` in an
+``X-Render-Token`` header, and refuses to listen beyond the loopback
+interface without one. Jobs may only write below ``render_farm.output_root``
+(relative to the project root): enqueueing any other output path is
+rejected, because workers move their renders to that path.
+
+Workers share nothing but the queue server and the output storage, and
+leasing touches one row, so throughput grows with the number of workers
+until the storage or the queue server becomes the bottleneck. Each
+worker keeps up to ``--slots`` renders in flight in its own process pool.
+
+Usage:
+
+    RENDER_QUEUE_TOKEN=... python render_queue.py serve --host 0.0.0.0 --port 8767
+    python render_queue.py worker --slots 2
+    RENDER_QUEUE_TOKEN=... python render_queue.py worker --url http://render-host:8767 --lease 120
+    python render_queue.py enqueue --in deduped.jsonl --out tmp/jobs/manual/video.mp4 --wait
+    python render_queue.py status
+
+Environment variables:
+    RENDER_QUEUE_TOKEN (name configurable in ops.yml)
+
+Configuration files:
+    config/ops.yml (``render_farm`` section)
+    config/brand.yml
+
+Data files:
+    data/render_jobs.db
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config_loader import config_section
+from instrument import add_profiler_argument, instrumented, stage
+from question_stream import read_questions
+from render_cache import load_render_cache
+from render_native import load_brand_config, pool_size, preload_renderer, render_questions
+
+QUEUED, LEASED, DONE, FAILED = 'queued', 'leased', 'done', 'failed'
+
+DEFAULT_SETTINGS = {
+    'enabled': False,
+    'db': 'data/render_jobs.db',
+    'url': '',
+    'host': '127.0.0.1',
+    'port': 8767,
+    'token_env': 'RENDER_QUEUE_TOKEN',
+    'output_root': 'tmp/jobs',
+    'lease_seconds': 60,
+    'max_attempts': 3,
+    'poll_seconds': 1.0,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS render_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    out TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    error TEXT,
+    report TEXT,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS render_jobs_status ON render_jobs (status, id);
+CREATE INDEX IF NOT EXISTS render_jobs_key ON render_jobs (key);
+"""
+
+
+class RenderJobFailed(RuntimeError):
+    """A render job used up its attempts."""
+
+
+class JobWaiter:
+    """Waiting for a job, shared by the local queue and its HTTP client."""
+
+    def get(self, job_id: int) -> Optional[dict]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def wait(self, job_id: int, poll_seconds: float = 1.0, timeout: Optional[float] = None) -> dict:
+        """Block until a job is done and return its render report."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                raise KeyError(f'No render job {job_id}')
+            if job['status'] == DONE:
+                return json.loads(job['report'])
+            if job['status'] == FAILED:
+                raise RenderJobFailed(f"Render job {job_id} failed after {job['attempts']} attempts: {job['error']}")
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f'Render job {job_id} still {job["status"]} after {timeout}s')
+            time.sleep(poll_seconds)
+
+
+class RenderQueue(JobWaiter):
+    """Lease-based render job queue backed by SQLite."""
+
+    def __init__(self, db_path: Path, output_root: Optional[Path] = None) -> None:
+        self.output_root = Path(output_root).resolve() if output_root is not None else None
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode; explicit transactions are opened where needed.
+        # The server shares the connection between its threads under a lock.
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @staticmethod
+    def job_key(payload: dict) -> str:
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def enqueue(self, questions: List[dict], config: dict, out: Path,
+                profile: Optional[str] = None, max_attempts: int = 3) -> int:
+        """Add a render job, or return an unfinished or still-on-disk job with the same payload."""
+        if self.output_root is not None and not Path(out).resolve().is_relative_to(self.output_root):
+            raise ValueError(f"Output {out} is outside the render output root {self.output_root}")
+        payload = {'questions': questions, 'config': config, 'profile': profile, 'out': str(out)}
+        key = self.job_key(payload)
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            existing = self.conn.execute(
+                'SELECT id, status FROM render_jobs WHERE key = ? AND status != ? ORDER BY id DESC LIMIT 1',
+                (key, FAILED)).fetchone()
+            if existing and (existing['status'] != DONE or Path(out).exists()):
+                return existing['id']
+            cur = self.conn.execute(
+                'INSERT INTO render_jobs (key, status, payload, out, max_attempts, enqueued_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, QUEUED, json.dumps(payload), str(out), max_attempts, time.time()))
+        return cur.lastrowid
+
+    def _expire_leases(self, now: float) -> None:
+        """Requeue jobs whose worker stopped renewing the lease (inside a transaction)."""
+        self.conn.execute(
+            'UPDATE render_jobs SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, '
+            "worker = NULL, error = 'lease expired' WHERE status = ? AND lease_expires < ?",
+            (FAILED, QUEUED, LEASED, now))
+
+    def lease(self, worker: str, lease_seconds: float) -> Optional[dict]:
+        """Claim the oldest queued job for ``worker``; None if there is none."""
+        now = time.time()
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self._expire_leases(now)
+            row = self.conn.execute(
+                'SELECT id, payload, attempts FROM render_jobs WHERE status = ? ORDER BY id LIMIT 1',
+                (QUEUED,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                'UPDATE render_jobs SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, '
+                'started_at = ? WHERE id = ?',
+                (LEASED, worker, now + lease_seconds, now, row['id']))
+        return {'id': row['id'], 'attempt': row['attempts'] + 1, **json.loads(row['payload'])}
+
+    def heartbeat(self, job_id: int, worker: str, lease_seconds: float) -> bool:
+        """Extend a lease. False means the lease was lost and the job handed on."""
+        with self.conn:
+            cur = self.conn.execute(
+                'UPDATE render_jobs SET lease_expires = ? WHERE id = ? AND status = ? AND worker = ?',
+                (time.time() + lease_seconds, job_id, LEASED, worker))
+        return cur.rowcount == 1
+
+    def complete(self, job_id: int, worker: str, report: dict) -> bool:
+        with self.conn:
+            cur = self.conn.execute(
+                'UPDATE render_jobs SET status = ?, report = ?, error = NULL, finished_at = ?, '
+                'lease_expires = NULL WHERE id = ? AND status = ? AND worker = ?',
+                (DONE, json.dumps(report), time.time(), job_id, LEASED, worker))
+        return cur.rowcount == 1
+
+    def fail(self, job_id: int, worker: str, error: str) -> None:
+        """Give a job back for another attempt, or mark it failed when out of attempts."""
+        with self.conn:
+            self.conn.execute(
+                'UPDATE render_jobs SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, '
+                'worker = NULL, lease_expires = NULL, error = ?, finished_at = ? '
+                'WHERE id = ? AND status = ? AND worker = ?',
+                (FAILED, QUEUED, error, time.time(), job_id, LEASED, worker))
+
+    def get(self, job_id: int) -> Optional[dict]:
+        row = self.conn.execute(
+            'SELECT id, status, out, worker, attempts, error, report FROM render_jobs WHERE id = ?',
+            (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def counts(self) -> Dict[str, int]:
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self._expire_leases(time.time())
+        return {status: n for status, n in self.conn.execute(
+            'SELECT status, COUNT(*) FROM render_jobs GROUP BY status')}
+
+
+# Queue methods the server exposes; each is a POST of its keyword arguments as JSON
+SERVED_METHODS = ('enqueue', 'lease', 'heartbeat', 'complete', 'fail', 'get', 'counts')
+
+
+class QueueHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        token = self.headers.get('X-Render-Token') or ''
+        if self.server.token and not hmac.compare_digest(token.encode(), self.server.token.encode()):
+            self._reply(403, {'error': 'missing or wrong X-Render-Token'})
+            return
+        method = self.path.strip('/')
+        if method not in SERVED_METHODS:
+            self._reply(404, {'error': f'unknown method {method!r}'})
+            return
+        try:
+            kwargs = json.loads(body or b'{}')
+            with self.server.lock:
+                result = getattr(self.server.queue, method)(**kwargs)
+        except (ValueError, TypeError) as exc:
+            self._reply(400, {'error': f'{type(exc).__name__}: {exc}'})
+            return
+        self._reply(200, {'result': result})
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+# Addresses the server may listen on without a token
+LOOPBACK_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+
+def serve(queue: RenderQueue, host: str, port: int, token: str = '',
+          verbose: bool = False) -> ThreadingHTTPServer:
+    """HTTP server for ``queue``; one request touches the database at a time."""
+    if not token and host not in LOOPBACK_HOSTS:
+        raise ValueError(f"Refusing to serve the render queue on {host} without a token")
+    server = ThreadingHTTPServer((host, port), QueueHandler)
+    server.queue = queue
+    server.token = token
+    server.lock = threading.Lock()
+    server.verbose = verbose
+    return server
+
+
+class RenderQueueClient(JobWaiter):
+    """The ``RenderQueue`` interface, served by ``render_queue.py serve`` on another host."""
+
+    def __init__(self, url: str, token: str = '', timeout: float = 30, max_retries: int = 3) -> None:
+        self.url = url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+    def _call(self, method: str, **kwargs):
+        import urllib.error
+        import urllib.request  # only workers and producers talking to a server need it
+
+        payload = json.dumps(kwargs).encode()
+        attempt = 0
+        while True:
+            request = urllib.request.Request(f'{self.url}/{method}', data=payload,
+                                             headers={'Content-Type': 'application/json',
+                                                      'X-Render-Token': self.token})
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as resp:
+                    return json.load(resp)['result']
+            except urllib.error.HTTPError as exc:
+                raise ValueError(f'{self.url}/{method}: {exc.code} {exc.read().decode(errors="replace")}')
+            except OSError:
+                # Every method is safe to repeat: enqueue is keyed by payload, and a
+                # lease whose reply was lost expires and is retried like any other
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def enqueue(self, questions: List[dict], config: dict, out: Path,
+                profile: Optional[str] = None, max_attempts: int = 3) -> int:
+        return self._call('enqueue', questions=questions, config=config, out=str(out),
+                          profile=profile, max_attempts=max_attempts)
+
+    def lease(self, worker: str, lease_seconds: float) -> Optional[dict]:
+        return self._call('lease', worker=worker, lease_seconds=lease_seconds)
+
+    def heartbeat(self, job_id: int, worker: str, lease_seconds: float) -> bool:
+        return self._call('heartbeat', job_id=job_id, worker=worker, lease_seconds=lease_seconds)
+
+    def complete(self, job_id: int, worker: str, report: dict) -> bool:
+        return self._call('complete', job_id=job_id, worker=worker, report=report)
+
+    def fail(self, job_id: int, worker: str, error: str) -> None:
+        self._call('fail', job_id=job_id, worker=worker, error=error)
+
+    def get(self, job_id: int) -> Optional[dict]:
+        return self._call('get', job_id=job_id)
+
+    def counts(self) -> Dict[str, int]:
+        return self._call('counts')
+
+
+def load_settings(base: Path) -> dict:
+    return config_section(base, 'render_farm', DEFAULT_SETTINGS)
+
+
+def open_render_queue(base: Path, settings: Optional[dict] = None) -> JobWaiter:
+    """The queue server at ``url``, or the local database when no ``url`` is set."""
+    settings = settings or load_settings(base)
+    if settings.get('url'):
+        return RenderQueueClient(settings['url'], queue_token(settings))
+    return RenderQueue(base / settings['db'], base / settings['output_root'])
+
+
+def queue_token(settings: dict) -> str:
+    return os.environ.get(settings['token_env'], '')
+
+
+def render_remote(queue: JobWaiter, questions: List[dict], out: Path, config: dict,
+                  settings: dict, profile: Optional[str] = None) -> dict:
+    """Render through the queue and wait for a worker to finish it."""
+    job_id = queue.enqueue(questions, config, Path(out).resolve(), profile, int(settings['max_attempts']))
+    with stage('render.remote', items=1, job=job_id):
+        return queue.wait(job_id, float(settings['poll_seconds']))
+
+
+# Render cache of a worker process, set by _init_worker_process
+_process_cache = None
+
+
+def _init_worker_process(base: Path) -> None:
+    global _process_cache
+    _process_cache = load_render_cache(base)
+    preload_renderer()
+
+
+def partial_path(job: dict, worker: str) -> Path:
+    """Where this worker's attempt at ``job`` is written before it is moved into place."""
+    out = Path(job['out'])
+    owner = worker.replace(':', '-').replace('/', '-')
+    return out.with_name(f".{out.stem}.{job['id']}-{job['attempt']}.{owner}.partial{out.suffix}")
+
+
+def _render_leased(job: dict, partial: Path) -> dict:
+    """Render one leased job to ``partial``; the worker moves it into place."""
+    try:
+        return render_questions(job['questions'], partial, job['config'],
+                                cache=_process_cache, profile=job['profile'])
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+
+
+def _finish_leased(queue: JobWaiter, job: dict, worker: str, partial: Path, report: dict,
+                   lease_seconds: float) -> str:
+    """Move a finished render into place if the lease is still ours; returns the job status."""
+    try:
+        if not queue.heartbeat(job['id'], worker, lease_seconds):
+            return 'lease_lost'  # another worker owns the job now; leave its output alone
+        os.replace(partial, job['out'])
+        return 'done' if queue.complete(job['id'], worker, report) else 'lease_lost'
+    finally:
+        partial.unlink(missing_ok=True)
+
+
+def worker_name() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def run_worker(base: Path, queue: JobWaiter, settings: dict, slots: int = 1,
+               max_jobs: Optional[int] = None, exit_when_idle: bool = False) -> int:
+    """Lease and render jobs until stopped. Returns the number of jobs finished."""
+    worker = worker_name()
+    lease_seconds = float(settings['lease_seconds'])
+    beat_every = lease_seconds / 3
+    in_flight: Dict[Future, dict] = {}
+    lost = set()  # (job, attempt) pairs whose lease expired while they rendered
+    finished = 0
+    leased = 0
+    with ProcessPoolExecutor(max_workers=slots, initializer=_init_worker_process, initargs=(base,)) as pool:
+        while True:
+            while len(in_flight) < slots and (max_jobs is None or leased < max_jobs):
+                job = queue.lease(worker, lease_seconds)
+                if job is None:
+                    break
+                leased += 1
+                print(json.dumps({'worker': worker, 'job': job['id'], 'attempt': job['attempt'],
+                                  'status': 'leased'}), flush=True)
+                in_flight[pool.submit(_render_leased, job, partial_path(job, worker))] = job
+            if not in_flight:
+                if exit_when_idle or (max_jobs is not None and leased >= max_jobs):
+                    return finished
+                time.sleep(float(settings['poll_seconds']))
+                continue
+            done, _ = wait(in_flight, timeout=beat_every, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = in_flight.pop(future)
+                key = (job['id'], job['attempt'])
+                partial = partial_path(job, worker)
+                try:
+                    report = future.result()
+                except Exception as exc:  # hand the job back and keep serving
+                    if key not in lost:
+                        queue.fail(job['id'], worker, f'{type(exc).__name__}: {exc}')
+                    status = 'failed'
+                else:
+                    if key in lost:
+                        partial.unlink(missing_ok=True)
+                        status = 'lease_lost'
+                    else:
+                        status = _finish_leased(queue, job, worker, partial, report, lease_seconds)
+                    if status == 'done':
+                        finished += 1
+                lost.discard(key)
+                print(json.dumps({'worker': worker, 'job': job['id'], 'status': status}), flush=True)
+            for job in in_flight.values():
+                key = (job['id'], job['attempt'])
+                if key not in lost and not queue.heartbeat(job['id'], worker, lease_seconds):
+                    # The render cannot be stopped mid-encode; its result is dropped when it ends
+                    lost.add(key)
+                    print(json.dumps({'worker': worker, 'job': job['id'], 'status': 'lease_lost'}), flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Shared render job queue and worker daemon.")
+    parser.add_argument('--db', help='Queue database (default: render_farm.db in ops.yml)')
+    parser.add_argument('--url', help='Queue server (default: render_farm.url in ops.yml)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_serve = sub.add_parser('serve', help='Serve the queue database to workers on other nodes')
+    p_serve.add_argument('--host', help='Address to listen on (default: render_farm.host)')
+    p_serve.add_argument('--port', type=int, help='Port to listen on (default: render_farm.port)')
+    p_serve.add_argument('--verbose', action='store_true', help='Log every request')
+    p_worker = sub.add_parser('worker', help='Lease and render jobs until stopped')
+    p_worker.add_argument('--slots', type=int, default=1, help='Renders in flight on this node')
+    p_worker.add_argument('--lease', type=float, help='Lease length in seconds (default: render_farm.lease_seconds)')
+    p_worker.add_argument('--max-jobs', type=int, help='Exit after leasing this many jobs')
+    p_worker.add_argument('--exit-when-idle', action='store_true', help='Exit once the queue is empty')
+    p_enqueue = sub.add_parser('enqueue', help='Queue a render of a questions file')
+    p_enqueue.add_argument('--in', dest='inp', required=True, help='Input deduped JSONL file')
+    p_enqueue.add_argument('--out', dest='outp', required=True, help='Output MP4 on storage the workers share')
+    p_enqueue.add_argument('--profile', help='Encoder profile from brand.yml')
+    p_enqueue.add_argument('--wait', action='store_true', help='Wait for the render and print its report')
+    sub.add_parser('status', help='Count jobs per status')
+    add_profiler_argument(parser)
+    args = parser.parse_args()
+
+    base = Path(__file__).resolve().parent.parent
+    settings = load_settings(base)
+    if args.db:
+        settings['db'] = args.db
+    if args.url:
+        settings['url'] = args.url
+    if args.command == 'serve':
+        host, port = args.host or settings['host'], args.port or int(settings['port'])
+        with RenderQueue(base / settings['db'], base / settings['output_root']) as queue:
+            try:
+                server = serve(queue, host, port, queue_token(settings), args.verbose)
+            except ValueError as exc:
+                raise SystemExit(f"{exc}; set {settings['token_env']}")
+            print(f"Render queue {queue.db_path} listening on http://{host}:{port}")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+        return
+    with instrumented('render_queue', args.profiler), open_render_queue(base, settings) as queue:
+        if args.command == 'worker':
+            if args.lease:
+                settings['lease_seconds'] = args.lease
+            n = run_worker(base, queue, settings, max(1, args.slots), args.max_jobs, args.exit_when_idle)
+            print(f"Worker {worker_name()} finished {n} jobs")
+        elif args.command == 'enqueue':
+            config = load_brand_config(base)
+            questions = list(islice(read_questions(args.inp), pool_size(config)))
+            job_id = queue.enqueue(questions, config, Path(args.outp).resolve(), args.profile,
+                                   int(settings['max_attempts']))
+            print(f"Queued render job {job_id} → {args.outp}")
+            if args.wait:
+                print(json.dumps(queue.wait(job_id, float(settings['poll_seconds']))))
+        else:
+            counts = queue.counts()
+            for status in (QUEUED, LEASED, DONE, FAILED):
+                print(f"{status:<7} {counts.get(status, 0)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+scheduler.py
+------------
+
+Refill the READY buffer by producing several topics at once. The
+scheduler computes the buffer deficit the same way ``buffer_watcher.py``
+does (``target - READY`` once the count drops below ``low_watermark``),
+picks that many topics from ``data/backlog.csv`` through the priority
+index of ``topic_planner.py`` (highest ``priority`` first, series kept
+apart by the planner's cooldown) and runs each one as a job through topic approval →
+generation → fact-check → de-duplication → render → thumbnail.
+
+Jobs run concurrently, but the two kinds of work are limited separately:
+renders go to a small process pool sized for the CPU (``render_workers``)
+while fact-checks and Telegram approvals share a larger pool of I/O slots
+(``io_workers``). Refilling from 6 to 14 READY items therefore takes
+roughly as long as the slowest job rather than eight runs back to back.
+With ``render_farm.enabled``, renders are queued for
+``render_queue.py`` workers on other nodes instead of the local pool.
+Approvals are requested for all picked topics at once. As they come in,
+the approved topics are grouped by the generator's ``batch_size`` and
+each group's questions are generated in one batched request (see
+``gen_questions.py``); its jobs then start while later approvals are
+still outstanding. Nothing is generated for a rejected topic.
+
+Each job adds its topic to the publish queue and moves it through
+APPROVED_TOPIC → VERIFIED → READY, recording the video and thumbnail
+paths on the queue row. A job that does not get there leaves its row in
+a terminal state with the reason in ``error``: REJECTED when the topic
+is turned down, FAILED when no questions survive fact-checking and
+de-duplication or a stage raises.
+
+Render workers are spawned rather than forked: the scheduler already
+runs job threads when the pool starts its processes, and a forked child
+could inherit a lock held by one of them.
+
+Usage:
+
+    python scheduler.py
+    python scheduler.py --deficit 4 --render-workers 2 --io-workers 8
+
+Configuration files:
+    config/ops.yml
+    config/brand.yml
+
+Data files:
+    data/backlog.csv
+    data/publish_queue.db
+"""
+
+import argparse
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from buffer_watcher import count_ready_items
+from dedupe import DEFAULT_THRESHOLD, dedupe_records
+from factcheck import factcheck_records, open_fact_checker
+from gen_questions import QuestionGenerator, open_generator
+from instrument import add_profiler_argument, instrumented, stage
+from make_thumbnail import DEFAULT_HOOK, ThumbnailRenderer, thumbnail_filename
+from pipeline import load_ops_config
+from propose_topic import send_telegram_message
+from queue_store import QueueStore, open_queue
+from render_cache import load_render_cache
+from render_native import load_brand_config, preload_renderer, render_questions
+from render_queue import load_settings as load_farm_settings, open_render_queue, render_remote
+from topic_planner import open_planner
+
+
+def compute_deficit(ready_count: int, ops: dict) -> int:
+    """Number of videos needed to bring the buffer back to target."""
+    if ready_count >= ops['buffer']['low_watermark']:
+        return 0
+    return ops['buffer']['target'] - ready_count
+
+
+class Scheduler:
+    """Runs production jobs with separate limits for CPU and I/O stages."""
+
+    def __init__(self, base: Path, brand: dict, ops: dict,
+                 render_workers: int = 1, io_workers: int = 4) -> None:
+        self.base = base
+        self.brand = brand
+        self.ops = ops
+        self.io_slots = threading.BoundedSemaphore(io_workers)
+        self.render_pool = ProcessPoolExecutor(max_workers=render_workers, initializer=preload_renderer,
+                                               mp_context=multiprocessing.get_context('spawn'))
+        self.cache = load_render_cache(base)
+        farm = load_farm_settings(base)
+        self.farm = farm if farm['enabled'] else None
+        self.thumbnails = ThumbnailRenderer(brand)
+        self.thumb_lock = threading.Lock()
+        self.out_root = base / 'tmp' / 'jobs'
+        self.n_questions = ops.get('scheduler', {}).get('questions_per_topic', 8)
+
+    def close(self) -> None:
+        self.render_pool.shutdown()
+
+    def approve(self, topic: str) -> bool:
+        if not self.ops.get('approvals', {}).get('topic', True):
+            return True
+        with self.io_slots:
+            response = send_telegram_message(
+                self.ops['telegram']['chat_id'],
+                f"Proposed topic: {topic}. Approve?",
+                buttons=['Yes', 'No'],
+            )
+        return response.lower() == 'yes'
+
+    def admit(self, backlog_row: dict) -> Optional[int]:
+        """Add the topic to the publish queue and ask for approval; returns the row id if approved."""
+        topic = backlog_row['topic']
+        with open_queue(self.base) as store:
+            row_id = store.add({
+                'date': date.today().isoformat(),
+                'topic': topic,
+                'series': backlog_row.get('series', ''),
+                'locale': backlog_row.get('locale', ''),
+                'status': 'PLANNED',
+            })
+            try:
+                approved = self.approve(topic)
+            except BaseException as exc:
+                store.retire(row_id, 'FAILED', f'{type(exc).__name__}: {exc}')
+                raise
+            if not approved:
+                store.retire(row_id, 'REJECTED', 'topic rejected')
+                return None
+            store.transition(row_id, 'PLANNED', 'APPROVED_TOPIC')
+        return row_id
+
+    def run_job(self, backlog_row: dict, row_id: int, questions: List[dict]) -> dict:
+        """Produce one approved topic from its generated questions and return a status summary."""
+        with stage('scheduler.job', items=1) as s:
+            result = self._run_job(backlog_row, row_id, questions)
+            s.fields['status'] = result['status']
+        return result
+
+    def _run_job(self, backlog_row: dict, row_id: int, questions: List[dict]) -> dict:
+        with open_queue(self.base) as store:
+            try:
+                return self._produce(store, row_id, backlog_row, questions)
+            except BaseException as exc:
+                store.retire(row_id, 'FAILED', f'{type(exc).__name__}: {exc}')
+                raise
+
+    def _produce(self, store: QueueStore, row_id: int, backlog_row: dict, questions: List[dict]) -> dict:
+        topic = backlog_row['topic']
+        with self.io_slots, open_fact_checker(self.base) as checker:
+            verified = factcheck_records(questions, checker)
+        threshold = self.ops.get('dedupe', {}).get('similarity_threshold', DEFAULT_THRESHOLD)
+        deduped = dedupe_records(verified, self.base / 'data' / 'bank', threshold)
+        # Over-generated extras stand in for rejected questions
+        deduped = deduped[:self.n_questions]
+        if not deduped:
+            store.retire(row_id, 'FAILED', 'no questions left after fact-check and de-duplication')
+            return {'topic': topic, 'status': 'no_questions'}
+        store.transition(row_id, 'APPROVED_TOPIC', 'VERIFIED')
+
+        out_dir = self.out_root / str(row_id)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        video_path = out_dir / 'video.mp4'
+        if self.farm is not None:
+            with open_render_queue(self.base, self.farm) as queue:
+                report = render_remote(queue, deduped, video_path, self.brand, self.farm)
+        else:
+            report = self.render_pool.submit(render_questions, deduped, video_path, self.brand,
+                                             1, self.cache).result()
+        thumb_path = out_dir / thumbnail_filename({'id': row_id, 'topic': topic}, 'png')
+        with self.thumb_lock:
+            self.thumbnails.save(topic, backlog_row.get('hook') or DEFAULT_HOOK, thumb_path)
+        store.transition(row_id, 'VERIFIED', 'READY', video=str(video_path), thumbnail=str(thumb_path))
+        return {'topic': topic, 'status': 'READY', 'video': str(video_path), 'render': report}
+
+    def start_group(self, generator: QuestionGenerator, jobs: ThreadPoolExecutor,
+                    group: List[Tuple[dict, int]]) -> Dict[Future, str]:
+        """Generate questions for approved topics in one batched call, then start their jobs."""
+        try:
+            generated = generator.generate([row for row, _ in group], self.n_questions)
+        except Exception as exc:  # the jobs end as no_questions and their rows as FAILED
+            print(f"Generation failed for {[row['topic'] for row, _ in group]}: {exc}")
+            generated = {}
+        return {jobs.submit(self.run_job, row, row_id, generated.get(row['topic'], [])): row['topic']
+                for row, row_id in group}
+
+    def run(self, topics: List[dict]) -> List[dict]:
+        """Run all jobs concurrently and return their summaries as they finish."""
+        results = []
+
+        def report(result: dict) -> None:
+            print(f"[{result['status']}] {result['topic']}")
+            results.append(result)
+
+        def failed(topic: str, exc: Exception) -> dict:
+            return {'topic': topic, 'status': 'failed', 'error': f'{type(exc).__name__}: {exc}'}
+
+        # Threads only coordinate; the render pool and I/O slots bound the real work
+        with open_generator(self.base) as generator, \
+                ThreadPoolExecutor(max_workers=max(1, len(topics))) as jobs:
+            group_size = max(1, int(generator.settings['batch_size']))
+            approvals = {jobs.submit(self.admit, row): row for row in topics}
+            productions: Dict[Future, str] = {}
+            group: List[Tuple[dict, int]] = []
+            for answered, future in enumerate(as_completed(approvals), 1):
+                row = approvals[future]
+                try:
+                    row_id = future.result()
+                except Exception as exc:  # one failed topic must not stop the others
+                    report(failed(row['topic'], exc))
+                else:
+                    if row_id is None:
+                        report({'topic': row['topic'], 'status': 'rejected'})
+                    else:
+                        group.append((row, row_id))
+                if group and (len(group) >= group_size or answered == len(approvals)):
+                    productions.update(self.start_group(generator, jobs, group))
+                    group = []
+            for future in as_completed(productions):
+                try:
+                    report(future.result())
+                except Exception as exc:
+                    report(failed(productions[future], exc))
+        return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Produce topics concurrently to refill the buffer.")
+    parser.add_argument('--deficit', type=int, help='Number of topics to produce (default: computed from the buffer)')
+    parser.add_argument('--render-workers', type=int, help='Concurrent renders')
+    parser.add_argument('--io-workers', type=int, help='Concurrent fact-check/approval calls')
+    add_profiler_argument(parser)
+    args = parser.parse_args()
+
+    with instrumented('scheduler', args.profiler):
+        base = Path(__file__).resolve().parent.parent
+        ops = load_ops_config(base)
+        settings = ops.get('scheduler', {})
+        with open_queue(base) as store:
+            deficit = args.deficit
+            if deficit is None:
+                deficit = compute_deficit(count_ready_items(store), ops)
+            if deficit <= 0:
+                print("Buffer sufficient; nothing to produce.")
+                return
+            topics = open_planner(base, store).take(deficit)
+        if len(topics) < deficit:
+            print(f"Only {len(topics)} unused backlog topics for a deficit of {deficit}.")
+        scheduler = Scheduler(
+            base, load_brand_config(base), ops,
+            render_workers=args.render_workers or settings.get('render_workers', 1),
+            io_workers=args.io_workers or settings.get('io_workers', 4),
+        )
+        try:
+            results = scheduler.run(topics)
+        finally:
+            scheduler.close()
+        ready = sum(1 for r in results if r['status'] == 'READY')
+        print(f"Produced {ready}/{len(topics)} topics.")
+
+if __name__ == '__main__':
+    main()
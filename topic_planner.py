@@ -0,0 +1,204 @@
+"""
+topic_planner.py
+----------------
+
+Choose which backlog topics go into the publish queue next. The backlog
+(``data/backlog.csv``) is loaded once into a priority index: one heap of
+topics per series, ordered by ``priority`` (ties keep backlog order), and
+a heap of series keyed by the priority of their best remaining topic.
+Taking the next candidate pops the best series that is not cooling down
+and then that series' best topic, so each pick costs O(log N) no matter
+how many thousands of topics the backlog holds.
+
+Series diversity is enforced with a cooldown: a series picked within
+the last ``series_cooldown`` picks is skipped, so with the default of 1
+no two ``flags`` topics are ever queued back to back. The cooldown is
+seeded from the newest queue rows, so it also holds across batches.
+Topics that already have a queue row are left out. When every remaining
+topic belongs to a cooling series, planning stops short rather than
+breaking the rule.
+
+``promote`` adds the top ``batch_size`` candidates to the queue as
+PLANNED rows in one transaction, in the order they were picked.
+
+Usage:
+
+    python topic_planner.py plan --k 10
+    python topic_planner.py promote
+    python topic_planner.py promote --k 20
+
+Configuration files:
+    config/ops.yml (``planner`` section)
+
+Data files:
+    data/backlog.csv
+    data/publish_queue.db
+"""
+
+import argparse
+import csv
+import heapq
+from collections import deque
+from datetime import date
+from itertools import count
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from config_loader import config_section
+from instrument import add_profiler_argument, instrumented, stage
+from queue_store import QueueStore, open_queue
+
+DEFAULT_SETTINGS = {
+    'batch_size': 5,
+    'series_cooldown': 1,
+}
+
+
+class TopicPlanner:
+    """Priority index over backlog topics with a per-series cooldown."""
+
+    def __init__(self, topics: Iterable[dict], taken: Iterable[str] = (),
+                 recent_series: Iterable[str] = (), cooldown: int = 1) -> None:
+        self.cooldown = max(0, cooldown)
+        # Series of the latest picks, oldest first
+        self.recent = deque(maxlen=self.cooldown)
+        for series in recent_series:
+            self._remember(series)
+        self._seen = set(taken)
+        self._order = count()
+        self._series: Dict[str, list] = {}
+        for row in topics:
+            if row.get('topic') and row['topic'] not in self._seen:
+                self._seen.add(row['topic'])
+                self._series.setdefault(row.get('series') or '', []).append(self._entry(row))
+        # Heapify once instead of pushing every topic: O(N) to build
+        for heap in self._series.values():
+            heapq.heapify(heap)
+        self._heads = [(heap[0][0], series) for series, heap in self._series.items()]
+        heapq.heapify(self._heads)
+
+    def __len__(self) -> int:
+        return sum(len(heap) for heap in self._series.values())
+
+    def _entry(self, row: dict) -> tuple:
+        return (-float(row.get('priority') or 0), next(self._order), row)
+
+    def _remember(self, series: str) -> None:
+        # Topics without a series never cool down
+        if series and self.cooldown:
+            self.recent.append(series)
+
+    def push(self, row: dict) -> bool:
+        """Add a topic to the index. Returns False if it is already known."""
+        if not row.get('topic') or row['topic'] in self._seen:
+            return False
+        self._seen.add(row['topic'])
+        series = row.get('series') or ''
+        entry = self._entry(row)
+        heapq.heappush(self._series.setdefault(series, []), entry)
+        # An older head entry for this series goes stale and is dropped on pop
+        heapq.heappush(self._heads, (entry[0], series))
+        return True
+
+    def pop(self) -> Optional[dict]:
+        """Remove and return the best topic whose series is not cooling down."""
+        cooling = []
+        chosen = None
+        while self._heads:
+            head = heapq.heappop(self._heads)
+            neg_priority, series = head
+            heap = self._series.get(series)
+            if not heap or heap[0][0] != neg_priority:
+                continue  # stale head
+            if series in self.recent:
+                cooling.append(head)
+                continue
+            chosen = series
+            break
+        # At most ``cooldown`` series are set aside, so this stays O(log N)
+        for head in cooling:
+            heapq.heappush(self._heads, head)
+        if chosen is None:
+            return None
+        heap = self._series[chosen]
+        _, _, row = heapq.heappop(heap)
+        if heap:
+            heapq.heappush(self._heads, (heap[0][0], chosen))
+        self._remember(chosen)
+        return row
+
+    def take(self, k: int) -> List[dict]:
+        """Pop up to ``k`` topics in planning order."""
+        picked = []
+        while len(picked) < k:
+            row = self.pop()
+            if row is None:
+                break
+            picked.append(row)
+        return picked
+
+
+def load_settings(base: Path) -> dict:
+    return config_section(base, 'planner', DEFAULT_SETTINGS)
+
+
+def read_backlog(backlog_path: Path) -> Iterable[dict]:
+    with backlog_path.open(newline='') as csvfile:
+        yield from csv.DictReader(csvfile)
+
+
+def open_planner(base: Path, store: QueueStore, settings: Optional[dict] = None) -> TopicPlanner:
+    """Index ``data/backlog.csv`` minus queued topics, with the cooldown seeded from the queue."""
+    settings = settings or load_settings(base)
+    cooldown = int(settings['series_cooldown'])
+    with stage('planner.load') as s:
+        recent = [row['series'] for row in reversed(store.latest(cooldown))]
+        planner = TopicPlanner(read_backlog(base / 'data' / 'backlog.csv'), store.topics(), recent, cooldown)
+        s.items = len(planner)
+    return planner
+
+
+def promote_topics(store: QueueStore, planner: TopicPlanner, k: int) -> List[dict]:
+    """Add the next ``k`` planned topics to the queue as PLANNED rows."""
+    with stage('planner.promote') as s:
+        picked = planner.take(k)
+        today = date.today().isoformat()
+        store.add_many({
+            'date': today,
+            'topic': row['topic'],
+            'series': row.get('series', ''),
+            'locale': row.get('locale', ''),
+            'status': 'PLANNED',
+            'priority': row.get('priority', ''),
+        } for row in picked)
+        s.items = len(picked)
+    return picked
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Plan and promote backlog topics into the publish queue.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_plan = sub.add_parser('plan', help='Print the next topics without changing the queue')
+    p_plan.add_argument('--k', type=int, help='Number of topics (default: planner.batch_size)')
+    p_promote = sub.add_parser('promote', help='Add the next topics to the queue as PLANNED')
+    p_promote.add_argument('--k', type=int, help='Number of topics (default: planner.batch_size)')
+    add_profiler_argument(parser)
+    args = parser.parse_args()
+
+    with instrumented('topic_planner', args.profiler):
+        base = Path(__file__).resolve().parent.parent
+        settings = load_settings(base)
+        k = args.k or int(settings['batch_size'])
+        with open_queue(base) as store:
+            planner = open_planner(base, store, settings)
+            if args.command == 'plan':
+                picked = planner.take(k)
+            else:
+                picked = promote_topics(store, planner, k)
+        for row in picked:
+            print(f"{float(row.get('priority') or 0):>5.2f}  {row.get('series') or '-':<12} {row['topic']}")
+        verb = 'Planned' if args.command == 'plan' else 'Promoted'
+        print(f"{verb} {len(picked)} of {k} topics.")
+
+if __name__ == '__main__':
+    main()
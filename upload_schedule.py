@@ -3,49 +3,336 @@ upload_schedule.py
 ------------------
 
 Upload and schedule videos to YouTube Shorts, TikTok, and Instagram
-Reels. This placeholder implementation does not actually perform
-uploads; instead, it updates the status of queue entries to
-``PUBLISHED`` to simulate successful scheduling. In a production
-version, integrate the YouTube Data API and respective TikTok/Instagram
-upload endpoints.
+Reels. Every IN_QUEUE row is uploaded to each platform configured under
+``upload.platforms`` in ``config/ops.yml``; the row moves to
+``PUBLISHED`` once all platforms have accepted the video.
+
+Uploads are chunked and resumable. Each platform gets its own worker
+pool, HTTP connection pool, rate limit (new uploads per minute) and
+retry/backoff, so a slow or failing platform does not hold up the
+others. Progress is checkpointed on the queue row in per-platform
+columns (``<platform>_status``, ``<platform>_upload``,
+``<platform>_offset``, ``<platform>_id``, ``<platform>_error``); after a
+crash the next run asks the platform how much of the session it already
+has and continues from there instead of starting over.
+
+Backends are pluggable (``BACKENDS``). ``resumable_http`` speaks a
+YouTube-style resumable protocol (``POST <base_url>/uploads`` to open a
+session, ``PUT`` with ``Content-Range`` for chunks and status queries)
+and can be exercised against ``upload_standin.py``. ``simulated`` keeps
+the old placeholder behaviour and marks uploads done without sending
+anything; it is the default until real platform endpoints are wired up.
 
 Usage:
 
     python upload_schedule.py
+    python upload_schedule.py --platform youtube --platform tiktok
 
 Configuration files:
-    config/ops.yml
+    config/ops.yml (``upload`` section)
 
 Data files:
-    data/publish_queue.csv
+    data/publish_queue.db
 """
 
-import csv
+import argparse
+import io
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from config_loader import config_section
+from instrument import add_profiler_argument, instrumented, stage
+from queue_store import QueueStore, open_queue
+
+DEFAULT_CHUNK_MB = 8
+DEFAULT_MAX_RETRIES = 5
+
+# Errors from the socket layer that are always worth retrying; the HTTP
+# backend turns protocol errors into retryable ``UploadError``s itself, so
+# ``http.client`` (and ``ssl``) are only imported when that backend is used
+TRANSIENT_ERRORS = (OSError,)
+
+
+class UploadError(Exception):
+    """An upload step failed. ``retryable`` errors are retried with backoff."""
+
+    def __init__(self, message: str, status: int = 0, retryable: bool = False) -> None:
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+class RateLimiter:
+    """Spaces calls evenly so no more than ``per_minute`` start each minute."""
+
+    def __init__(self, per_minute: float) -> None:
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        time.sleep(at - now)
+
+
+class ConnectionPool:
+    """Reusable keep-alive connections to one host."""
+
+    def __init__(self, base_url: str, size: int, timeout: float = 60) -> None:
+        import http.client
+
+        url = urlsplit(base_url)
+        cls = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.factory = lambda: cls(url.netloc, timeout=timeout)
+        self.idle: queue.LifoQueue = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self) -> Iterator['http.client.HTTPConnection']:
+        with self.slots:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                conn = self.factory()
+            try:
+                yield conn
+            except BaseException:
+                # The connection may be mid-response; never hand it out again
+                conn.close()
+                raise
+            self.idle.put(conn)
+
+    def close(self) -> None:
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+
+
+class SimulatedBackend:
+    """Accepts every upload immediately without sending anything."""
+
+    requires_file = False
+
+    def __init__(self, name: str, settings: dict) -> None:
+        self.name = name
+
+    def begin(self, meta: dict) -> str:
+        return uuid.uuid4().hex
+
+    def offset(self, session: str, size: int) -> Tuple[int, Optional[str]]:
+        return size, f'sim-{session[:12]}'
+
+    def send(self, session: str, chunk: bytes, start: int, size: int) -> Tuple[int, Optional[str]]:
+        return size, f'sim-{session[:12]}'
+
+    def close(self) -> None:
+        pass
+
+
+class ResumableHttpBackend:
+    """YouTube-style resumable uploads over pooled HTTP connections.
+
+    ``offset`` and ``send`` return ``(bytes the server has, remote id)``;
+    the remote id is set once the server reports the upload complete.
+    """
+
+    requires_file = True
+
+    def __init__(self, name: str, settings: dict) -> None:
+        self.name = name
+        self.path = urlsplit(settings['base_url']).path.rstrip('/')
+        self.pool = ConnectionPool(settings['base_url'], settings.get('max_concurrent', 1),
+                                   settings.get('timeout', 60))
+
+    def _request(self, method: str, path: str, body: bytes = b'',
+                 headers: Optional[dict] = None) -> Tuple[int, 'http.client.HTTPMessage', bytes]:
+        import http.client
+
+        try:
+            with self.pool.connection() as conn:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                data = resp.read()
+        except http.client.HTTPException as exc:
+            raise UploadError(f'{self.name}: {method} {path} failed: {exc!r}', retryable=True) from exc
+        if resp.status == 429 or resp.status >= 500:
+            raise UploadError(f'{self.name}: {method} {path} returned {resp.status}', resp.status, retryable=True)
+        if resp.status >= 400:
+            raise UploadError(f'{self.name}: {method} {path} returned {resp.status}', resp.status)
+        return resp.status, resp.headers, data
+
+    @staticmethod
+    def _progress(status: int, headers: 'http.client.HTTPMessage', data: bytes) -> Tuple[int, Optional[str]]:
+        if status == 308:
+            # "Range: bytes=0-N" lists what the server has; absent means nothing yet
+            received = headers.get('Range')
+            return (int(received.rsplit('-', 1)[1]) + 1 if received else 0), None
+        return -1, json.loads(data)['id']
+
+    def begin(self, meta: dict) -> str:
+        _, _, data = self._request('POST', f'{self.path}/uploads', json.dumps(meta).encode(),
+                                   {'Content-Type': 'application/json'})
+        return json.loads(data)['upload_id']
+
+    def offset(self, session: str, size: int) -> Tuple[int, Optional[str]]:
+        return self._progress(*self._request('PUT', f'{self.path}/uploads/{session}', b'',
+                                             {'Content-Range': f'bytes */{size}'}))
+
+    def send(self, session: str, chunk: bytes, start: int, size: int) -> Tuple[int, Optional[str]]:
+        end = start + len(chunk) - 1
+        return self._progress(*self._request('PUT', f'{self.path}/uploads/{session}', chunk,
+                                             {'Content-Range': f'bytes {start}-{end}/{size}'}))
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+BACKENDS = {
+    'simulated': SimulatedBackend,
+    'resumable_http': ResumableHttpBackend,
+}
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class PlatformUploader:
+    """Uploads for one platform: its own workers, rate limit and backend."""
+
+    def __init__(self, name: str, settings: dict, db_path: Path, chunk_size: int, max_retries: int) -> None:
+        self.name = name
+        self.backend = BACKENDS[settings.get('backend', 'simulated')](name, settings)
+        self.limiter = RateLimiter(settings.get('per_minute', 0))
+        self.pool = ThreadPoolExecutor(max_workers=settings.get('max_concurrent', 1),
+                                       thread_name_prefix=f'upload-{name}')
+        self.db_path = db_path
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+
+    def close(self) -> None:
+        self.pool.shutdown()
+        self.backend.close()
+
+    def submit(self, row: dict):
+        return self.pool.submit(self.upload, row)
+
+    def upload(self, row: dict) -> str:
+        """Upload one row's video, resuming a checkpointed session. Returns the remote id."""
+        video = Path(row.get('video') or '')
+        with stage(f'upload.{self.name}', items=1, bytes=video.stat().st_size if video.is_file() else 0):
+            return self._upload(row)
+
+    def _upload(self, row: dict) -> str:
+        col = self.name
+        video = Path(row.get('video') or '')
+        size = video.stat().st_size if video.is_file() else 0
+        if not size and self.backend.requires_file:
+            raise UploadError(f'{col}: row {row["id"]} has no video file')
+        session = row.get(f'{col}_upload') or None
+        # None means "ask the server"; resumed sessions always start that way
+        offset: Optional[int] = None if session else 0
+        remote_id = None
+        attempt = 0
+        # Each worker thread needs its own SQLite connection
+        with QueueStore(self.db_path) as store, (video.open('rb') if size else io.BytesIO()) as f:
+            while remote_id is None:
+                try:
+                    if session is None:
+                        self.limiter.wait()
+                        session = self.backend.begin({'title': row['topic'], 'size': size,
+                                                      'queue_id': row['id']})
+                        offset = 0
+                        store.update(row['id'], **{f'{col}_status': 'UPLOADING', f'{col}_upload': session,
+                                                   f'{col}_offset': 0})
+                    elif offset is None:
+                        offset, remote_id = self.backend.offset(session, size)
+                    else:
+                        f.seek(offset)
+                        offset, remote_id = self.backend.send(session, f.read(self.chunk_size), offset, size)
+                        store.update(row['id'], **{f'{col}_offset': offset})
+                        attempt = 0
+                except (UploadError, *TRANSIENT_ERRORS) as exc:
+                    if isinstance(exc, UploadError) and exc.status == 404:
+                        session = None  # session expired on the platform; start a new one
+                    elif isinstance(exc, UploadError) and not exc.retryable:
+                        raise
+                    if attempt >= self.max_retries:
+                        raise
+                    attempt += 1
+                    time.sleep(backoff_delay(attempt))
+                    offset = None
+            store.update(row['id'], **{f'{col}_status': 'DONE', f'{col}_id': remote_id,
+                                       f'{col}_offset': size, f'{col}_error': ''})
+        return remote_id
+
 
-import yaml
+def load_upload_settings(base: Path) -> dict:
+    return config_section(base, 'upload')
 
 
-def upload_and_schedule(queue_path: Path) -> None:
-    with queue_path.open(newline='') as csvfile:
-        rows = list(csv.DictReader(csvfile))
-    for row in rows:
-        if row.get('status') == 'IN_QUEUE':
-            # Placeholder: mark as published and set date/time
-            row['status'] = 'PUBLISHED'
-            row['published_at'] = datetime.now(timezone.utc).isoformat()
-    with queue_path.open('w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=rows[0].keys())
-        writer.writeheader()
-        writer.writerows(rows)
-    print("Simulated upload/schedule for IN_QUEUE items.")
+def upload_and_schedule(store: QueueStore, settings: dict, platforms: Optional[List[str]] = None) -> int:
+    """Upload every IN_QUEUE row to all platforms. Returns the number published."""
+    configured: Dict[str, dict] = settings.get('platforms') or {'youtube': {}, 'tiktok': {}, 'instagram': {}}
+    names = platforms or list(configured)
+    chunk_size = int(settings.get('chunk_mb', DEFAULT_CHUNK_MB) * 1024 * 1024)
+    max_retries = settings.get('max_retries', DEFAULT_MAX_RETRIES)
+    uploaders = {name: PlatformUploader(name, configured.get(name, {}), store.db_path, chunk_size, max_retries)
+                 for name in names}
+    published = 0
+    try:
+        futures = {}
+        row_ids = []
+        for row in list(store.rows('IN_QUEUE')):
+            row_ids.append(row['id'])
+            for name in names:
+                if row.get(f'{name}_status') != 'DONE':
+                    futures[uploaders[name].submit(row)] = (row, name)
+        for future in as_completed(futures):
+            row, name = futures[future]
+            try:
+                print(f"[{name}] {row['topic']} uploaded as {future.result()}")
+            except Exception as exc:  # one failed platform must not stop the others
+                store.update(row['id'], **{f'{name}_status': 'FAILED',
+                                           f'{name}_error': f'{type(exc).__name__}: {exc}'})
+                print(f"[{name}] {row['topic']} failed: {exc}")
+        for row_id in row_ids:
+            row = store.get(row_id)
+            if not all(row.get(f'{name}_status') == 'DONE' for name in configured):
+                continue
+            if store.transition(row_id, 'IN_QUEUE', 'PUBLISHED',
+                                published_at=datetime.now(timezone.utc).isoformat()):
+                published += 1
+    finally:
+        for uploader in uploaders.values():
+            uploader.close()
+    return published
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Upload IN_QUEUE videos to all platforms.")
+    parser.add_argument('--platform', action='append', help='Only upload to this platform (repeatable)')
+    add_profiler_argument(parser)
+    args = parser.parse_args()
     base = Path(__file__).resolve().parent.parent
-    queue_path = base / 'data' / 'publish_queue.csv'
-    upload_and_schedule(queue_path)
+    with instrumented('upload_schedule', args.profiler), open_queue(base) as store:
+        n = upload_and_schedule(store, load_upload_settings(base), args.platform)
+    print(f"Published {n} videos.")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,137 @@
+"""
+upload_standin.py
+-----------------
+
+Local HTTP stand-in for the platform upload APIs, used to exercise the
+``resumable_http`` backend of ``upload_schedule.py`` without touching
+real accounts. It implements the same resumable protocol for any
+platform prefix:
+
+    POST /<platform>/uploads                     → 201 {"upload_id": ...}
+    PUT  /<platform>/uploads/<id>  (chunk)       → 308 + Range, or 200 {"id": ...}
+    PUT  /<platform>/uploads/<id>  (bytes */N)   → status query, same replies
+
+Received bytes are written to ``--dir``. ``--fail-rate`` answers a share
+of chunk requests with 503 and ``--delay`` slows every chunk down, to
+check retries, resumption and that one slow platform does not block the
+others.
+
+Usage:
+
+    python upload_standin.py --port 8765 --dir tmp/standin
+    python upload_standin.py --port 8765 --fail-rate 0.2 --delay 0.5
+
+Then point a platform at it in ``config/ops.yml``:
+
+    upload:
+      platforms:
+        youtube: {backend: resumable_http, base_url: "http://127.0.0.1:8765/youtube"}
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+CONTENT_RANGE = re.compile(r'bytes (?:\*|(\d+)-(\d+))/(\d+)')
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so client connection pooling is exercised
+
+    def _reply(self, status: int, payload: dict = None, headers: dict = None) -> None:
+        body = json.dumps(payload).encode() if payload is not None else b''
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def do_POST(self) -> None:
+        parts = self.path.strip('/').split('/')
+        body = self._body()
+        if len(parts) != 2 or parts[1] != 'uploads':
+            self._reply(404, {'error': 'not found'})
+            return
+        upload_id = f'{parts[0]}-{uuid.uuid4().hex[:16]}'
+        (self.server.root / f'{upload_id}.json').write_bytes(body or b'{}')
+        (self.server.root / f'{upload_id}.part').touch()
+        self._reply(201, {'upload_id': upload_id})
+
+    def do_PUT(self) -> None:
+        parts = self.path.strip('/').split('/')
+        chunk = self._body()
+        if len(parts) != 3 or parts[1] != 'uploads':
+            self._reply(404, {'error': 'not found'})
+            return
+        upload_id = parts[2]
+        part = self.server.root / f'{upload_id}.part'
+        done = self.server.root / f'{upload_id}.bin'
+        if done.exists():
+            self._reply(200, {'id': upload_id})
+            return
+        match = CONTENT_RANGE.fullmatch(self.headers.get('Content-Range', ''))
+        if not part.exists() or not match:
+            self._reply(404 if not part.exists() else 400, {'error': 'bad upload'})
+            return
+        if chunk:
+            if random.random() < self.server.fail_rate:
+                self._reply(503, {'error': 'injected failure'})
+                return
+            time.sleep(self.server.delay)
+        have = part.stat().st_size
+        # Only accept a chunk that continues exactly where the upload stands
+        if match.group(1) is not None and int(match.group(1)) == have:
+            with part.open('ab') as f:
+                f.write(chunk)
+            have += len(chunk)
+        if have >= int(match.group(3)):
+            part.replace(done)
+            self._reply(200, {'id': upload_id})
+            return
+        self._reply(308, headers={'Range': f'bytes=0-{have - 1}'} if have else None)
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(port: int, root: Path, fail_rate: float = 0.0, delay: float = 0.0,
+          verbose: bool = False) -> ThreadingHTTPServer:
+    root.mkdir(parents=True, exist_ok=True)
+    server = ThreadingHTTPServer(('127.0.0.1', port), StandInHandler)
+    server.root = root
+    server.fail_rate = fail_rate
+    server.delay = delay
+    server.verbose = verbose
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the platform upload APIs.")
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on (127.0.0.1)')
+    parser.add_argument('--dir', default='tmp/standin', help='Directory for received uploads')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Share of chunk requests answered with 503')
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait before accepting each chunk')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args()
+    server = serve(args.port, Path(args.dir), args.fail_rate, args.delay, args.verbose)
+    print(f"Upload stand-in listening on http://127.0.0.1:{args.port}/<platform>/uploads")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()